@@ -0,0 +1,165 @@
+import time
+from argparse import ArgumentParser
+from itertools import combinations
+
+import numpy as np
+
+from node import Order, tolerated_traitors
+
+
+def first_orders(roles, orders):
+    """
+    Order every general gets from the supreme general. SupremeGeneral.sending_procedure means a
+    traitor to alternate by port, but its counter only moves past its own port, so every general
+    gets ATTACK from it
+    :param roles: (scenarios, generals) array, True for a traitor
+    :param orders: (scenarios,) array of Order
+    :return: (scenarios, generals) array of Order
+    """
+    return np.repeat(np.where(roles[:, :1], Order.ATTACK, orders[:, None]), roles.shape[1], axis=1)
+
+
+def om_table(number_of_lieutenants, depth):
+    """
+    Majority OM(depth) reaches for a relay path at one lieutenant. Loyal lieutenants relay what
+    they got and traitors flip it, so the outcome only depends on the value received for the path
+    and on how many loyal and traitorous lieutenants are left to relay it, the receiver excluded.
+    Every relay round is one step over the whole table instead of one recursion per path
+    :param number_of_lieutenants: largest count of lieutenants left
+    :param depth: relay rounds left below the path
+    :return: (2, loyal + 1, traitors + 1) array of Order, by value, loyal left and traitors left
+    """
+    value = np.arange(2)[:, None, None]
+    loyal = np.arange(number_of_lieutenants + 1)[None, :, None]
+    traitors = np.arange(number_of_lieutenants + 1)[None, None, :]
+    table = np.broadcast_to(value, (2, number_of_lieutenants + 1, number_of_lieutenants + 1))
+    for _ in range(depth):
+        # a loyal lieutenant relays the value unchanged and is no longer left, a traitor flips it
+        loyal_relay = np.zeros_like(table)
+        loyal_relay[:, 1:, :] = table[:, :-1, :]
+        traitor_relay = np.zeros_like(table)
+        traitor_relay[:, :, 1:] = table[::-1, :, :-1]
+        attack = value + loyal * loyal_relay + traitors * traitor_relay
+        # ties fall back to RETREAT, like node.majority
+        table = (2 * attack > 1 + loyal + traitors).astype(np.int64)
+    return table
+
+
+def decisions(roles, orders, max_traitors):
+    """
+    Action every lieutenant concludes in OM(max_traitors), traitors included
+    :param roles: (scenarios, generals) array, True for a traitor
+    :param orders: (scenarios,) array of Order
+    :param max_traitors: m of OM(m)
+    :return: (scenarios, generals - 1) array of Order, for generals 1 to N - 1
+    """
+    received = first_orders(roles, orders)[:, 1:]
+    if max_traitors == 0:
+        return received
+
+    is_traitor = roles[:, 1:].astype(np.int64)
+    number_of_lieutenants = roles.shape[1] - 1
+    table = om_table(number_of_lieutenants, max_traitors - 1)
+
+    # what each lieutenant relays in round one is the only value that differs by sender,
+    # lieutenants fall in four categories by that value and whether they are traitors
+    category = 2 * (received ^ is_traitor) + is_traitor
+    counts = np.stack([(category == index).sum(axis=1) for index in range(4)], axis=1)
+
+    # every relay of a category comes with one lieutenant of its kind less, and the receiver is not
+    # left either, so with the traitor count of a scenario the receiver's kind settles the lookup
+    traitors = is_traitor.sum(axis=1)
+    votes = np.empty((len(roles), 2, 4), dtype=np.int64)
+    for receiver_is_traitor in (0, 1):
+        loyal_left = number_of_lieutenants - 1 - traitors + receiver_is_traitor
+        traitors_left = traitors - receiver_is_traitor
+        for index in range(4):
+            value, traitor = divmod(index, 2)
+            votes[:, receiver_is_traitor, index] = table[value, np.maximum(loyal_left - (1 - traitor), 0),
+                                                         np.maximum(traitors_left - traitor, 0)]
+
+    # every lieutenant's relay but the receiver's own
+    totals = (votes * counts[:, None, :]).sum(axis=2)
+    attack = received + np.take_along_axis(totals, is_traitor, axis=1) - \
+        votes[np.arange(len(roles))[:, None], is_traitor, category]
+    return (2 * attack > number_of_lieutenants).astype(np.int64)
+
+
+def evaluate(roles, orders, max_traitors=None):
+    """
+    Verdict of the city for a batch of scenarios, as main.execution would return it over a lossless network
+    :param roles: (scenarios, generals) booleans, True for a traitor, the first general is the supreme general
+    :param orders: Order of the supreme general, one for every scenario or one for all of them
+    :param max_traitors: m of OM(m), defaults to the largest one the number of generals allows
+    :return: (scenarios,) object array of verdicts
+    """
+    roles = np.asarray(roles, dtype=bool)
+    number_of_generals = roles.shape[1]
+    orders = np.broadcast_to(np.asarray(orders, dtype=np.int64), roles.shape[:1])
+    if max_traitors is None:
+        max_traitors = tolerated_traitors(number_of_generals)
+    if number_of_generals < 3 * max_traitors + 1:
+        return np.full(roles.shape[0], "ERROR_NOT_ENOUGH_GENERALS", dtype=object)
+
+    is_loyal = ~roles
+    # only loyal generals report to the city, the supreme general reports its own order
+    attack = (decisions(roles, orders, max_traitors) * is_loyal[:, 1:]).sum(axis=1) + orders * is_loyal[:, 0]
+    retreat = is_loyal.sum(axis=1) - attack
+
+    verdicts = np.where(attack > retreat, "ATTACK", np.where(attack < retreat, "RETREAT", "FAILED"))
+    # the edge cases City.check_generals decides before listening
+    verdicts = np.where(number_of_generals < 3 * roles.sum(axis=1) + 1, "FAILED", verdicts)
+    verdicts = np.where(is_loyal.sum(axis=1) < 2, "ERROR_LESS_THAN_TWO_GENERALS", verdicts)
+    return verdicts.astype(object)
+
+
+def traitor_placements(number_of_generals, number_of_traitors=None):
+    """
+    :param number_of_generals: number of generals including the supreme general
+    :param number_of_traitors: only placements with this many traitors, every placement by default
+    :return: (scenarios, generals) booleans, in the order of all_tc_out.txt
+    """
+    if number_of_traitors is None:
+        codes = np.arange(2 ** number_of_generals)[:, None]
+        return (codes >> np.arange(number_of_generals - 1, -1, -1)[None, :]) & 1 == 1
+
+    placements = list(combinations(range(number_of_generals), number_of_traitors))
+    roles = np.zeros((len(placements), number_of_generals), dtype=bool)
+    if number_of_traitors > 0:
+        roles[np.arange(len(placements))[:, None], np.array(placements)] = True
+    return roles
+
+
+def main():
+    parser = ArgumentParser(description="Evaluate OM(m) for every placement of traitors without running the generals")
+    parser.add_argument("-n", type=int, dest="number_of_generals",
+                        help="The number of generals, the supreme general included", default=4)
+    parser.add_argument("-t", type=int, dest="number_of_traitors",
+                        help="Only placements with this many traitors, every placement by default", default=None)
+    parser.add_argument("-m", type=int, dest="max_traitors",
+                        help="The number of traitors OM(m) should tolerate, "
+                             "defaults to the largest m with N >= 3m + 1", default=None)
+    parser.add_argument("-O", type=str, dest="order",
+                        help="The order the commander gives to the other generals (O ∈ {ATTACK,RETREAT})",
+                        default="ATTACK")
+    parser.add_argument("-a", action="store_true", dest="print_all",
+                        help="Print the verdict of every placement like all_tc_out.txt")
+    args = parser.parse_args()
+
+    order = Order.RETREAT if args.order.upper() == "RETREAT" else Order.ATTACK
+    roles = traitor_placements(args.number_of_generals, args.number_of_traitors)
+    started_at = time.perf_counter()
+    verdicts = evaluate(roles, order, args.max_traitors)
+    duration = time.perf_counter() - started_at
+
+    if args.print_all:
+        for case, verdict in zip(roles, verdicts):
+            print(f"{verdict} for case {tuple(bool(role) for role in case)}")
+        return
+    for verdict, count in zip(*np.unique(verdicts.astype(str), return_counts=True)):
+        print(f"{verdict}: {count}")
+    print(f"{len(roles)} placements in {duration * 1000:.1f} ms")
+
+
+if __name__ == '__main__':
+    main()
@@ -6,53 +6,76 @@ from node_socket import UdpSocket
 
 class City:
 
-    def __init__(self, my_port: int, number_general: int) -> None:
+    def __init__(self, my_port: int, number_general: int, number_of_generals: int = 4,
+                 node_socket: UdpSocket = None) -> None:
         self.number_general = number_general
+        self.number_of_generals = number_of_generals
         self.my_port = my_port
-        self.node_socket = UdpSocket(my_port)
+        self.node_socket = node_socket if node_socket is not None else UdpSocket(my_port)
+        self.orders = []
+        self.verdict = None
 
     def start(self):
         """
         TODO
         :return: string
         """
+        verdict = self.check_generals()
+        if verdict is not None:
+            return verdict
 
+        logging.info("Listen to incoming messages...")
+        while self.verdict is None:
+            msg = self.node_socket.listen()[0]
+            self.on_message(msg.split("~"))
+
+        return self.verdict
+
+    def check_generals(self):
+        """
+        Edge cases that can be decided without listening to the generals
+        :return: string or None
+        """
         # Edge Cases
         # if honest general less than two
         if self.number_general < 2:
             logging.info("ERROR_LESS_THAN_TWO_GENERALS")
             return "ERROR_LESS_THAN_TWO_GENERALS"
 
-        if self.number_general == 2:
-            logging.info("ERROR_TWO_GENERALS")
+        # if there are too many traitors for OM(m) to reach agreement (N < 3m + 1)
+        number_traitor = self.number_of_generals - self.number_general
+        if self.number_of_generals < 3 * number_traitor + 1:
+            logging.info("ERROR_TOO_MANY_TRAITORS")
             return "FAILED"
-        
-        # if honest general more than four
-        if self.number_general > 4:
-            logging.info("ERROR_MORE_THAN_FOUR_GENERALS")
-            return "ERROR_MORE_THAN_FOUR_GENERALS"
 
-        logging.info("Listen to incoming messages...")
-        counter = 0
-        orders = []
-        while True:
-            if counter == self.number_general:
-                break
-            msg = self.node_socket.listen()[0]
-            logging.info(f"CITY MSG {msg}")
-            msg_list = msg.split("~")
-            sender = msg_list[0]
-            order = int(msg_list[1].split("=")[1])
-
-            orders.append(order)
-            
-            if order == 1:
-                logging.info(f"{sender} ATTACK us!")
-            else:
-                logging.info(f"{sender} RETREAT from us!")
-            
-            counter += 1
+        return None
 
+    def on_message(self, msg_list):
+        """
+        Record the action of a loyal general, concluding once every one of them is in
+        :param msg_list: message split on "~"
+        :return: string or None
+        """
+        logging.info(f"CITY MSG {'~'.join(msg_list)}")
+        sender = msg_list[0]
+        order = int(msg_list[1].split("=")[1])
+
+        self.orders.append(order)
+
+        if order == 1:
+            logging.info(f"{sender} ATTACK us!")
+        else:
+            logging.info(f"{sender} RETREAT from us!")
+
+        if len(self.orders) == self.number_general:
+            self.verdict = self.conclude(self.orders)
+        return self.verdict
+
+    def conclude(self, orders):
+        """
+        :param orders: list
+        :return: string
+        """
         # conclusion
         logging.info("Concluding what happen...")
         # if 1 is more than 0, then ATTACK
@@ -71,13 +94,15 @@ def thread_exception_handler(args):
     logging.error(f"Uncaught exception", exc_info=(args.exc_type, args.exc_value, args.exc_traceback))
 
 
-def main(city_port: int, number_general: int):
+def main(city_port: int, number_general: int, number_of_generals: int = 4, city: City = None):
     threading.excepthook = thread_exception_handler
     try:
         logging.debug(f"city_port: {city_port}")
         logging.info(f"City is running...")
         logging.info(f"Number of loyal general: {number_general}")
-        city = City(my_port=city_port, number_general=number_general)
+        logging.info(f"Number of generals: {number_of_generals}")
+        if city is None:
+            city = City(my_port=city_port, number_general=number_general, number_of_generals=number_of_generals)
         return city.start()
 
     except Exception:
@@ -43,8 +43,12 @@ def main():
     parser.add_argument("-G", type=str, dest="generals",
                         help=" A string of generals (i.e. 'l,t,l,l'), where l is loyal and t is a traitor.  "
                              "The first general is the supreme general. "
-                             "This argument is designed only to accept four generals",
+                             "Any number of generals N >= 3m + 1 is accepted",
                         default="l,t,l,l")
+    parser.add_argument("-m", type=int, dest="max_traitors",
+                        help=" The number of traitors OM(m) should tolerate, "
+                             "defaults to the largest m with N >= 3m + 1",
+                        default=None)
     parser.add_argument("-O", type=str, dest="order",
                         help=" The order the commander gives to the other generals (O ∈ {ATTACK,RETREAT})",
                         default="RETREAT")
@@ -56,28 +60,42 @@ def main():
     logger.debug(f"roles: {pprint.pformat(roles)}")
     logger.debug(f"order: {order}")
     logger.info("Done processing args...")
-    execution(roles, order)
+    execution(roles, order, args.max_traitors)
 
 
-def execution(roles, order):
+def execution(roles, order, max_traitors=None):
     logger = logging.getLogger(__name__)
 
     sys.excepthook = handle_exception
 
     logger.info("The main program is running...")
     logger.info("Determining the ports that will be used...")
+    number_of_generals = len(roles)
     starting_port = random.randint(10000, 11000)
-    port_used = [port for port in range(starting_port, starting_port + 4)]
+    port_used = [port for port in range(starting_port, starting_port + number_of_generals)]
+    city_port = starting_port + number_of_generals
     logger.debug(f"port_used: {port_used}")
     logger.info("Done determining the ports that will be used...")
 
+    if max_traitors is None:
+        max_traitors = node.tolerated_traitors(number_of_generals)
+    logger.debug(f"max_traitors: {max_traitors}")
+    if number_of_generals < 3 * max_traitors + 1:
+        logger.error(f"OM({max_traitors}) needs at least {3 * max_traitors + 1} generals")
+        return "ERROR_NOT_ENOUGH_GENERALS"
+
     logger.info("Convert order string to binary...")
     order = node.Order.RETREAT if order.upper() == "RETREAT" else node.Order.ATTACK
     logger.debug(f"order: {order}")
     logger.info("Done converting string to binary...")
 
+    # bind the city before any general can report its action to it
+    number_general = roles.count(False)
+    city_node = city.City(my_port=city_port, number_general=number_general,
+                          number_of_generals=number_of_generals)
+
     logger.info("Start running multiple nodes...")
-    for node_id in range(4):
+    for node_id in range(number_of_generals):
         is_supreme_general = False if node_id else True
         file_name_prefix = f"general{node_id}" if not is_supreme_general else "supreme_general"
         reload_logging_config_node(f"{file_name_prefix}.txt")
@@ -89,7 +107,8 @@ def execution(roles, order):
                 starting_port + node_id,
                 order,
                 is_supreme_general,
-                starting_port + 4
+                city_port,
+                max_traitors
             ))
         else:
             process = NodeProcess(target=node.main, args=(
@@ -99,7 +118,8 @@ def execution(roles, order):
                 starting_port + node_id,
                 order,
                 False,
-                starting_port + 4
+                city_port,
+                max_traitors
             ))
         process.start()
         list_nodes.append(process)
@@ -108,9 +128,8 @@ def execution(roles, order):
 
     logger.info("Running city...")
     reload_logging_config_node(f"city.txt")
-    number_general = roles.count(False)
     logger.debug(f"number_general: {number_general}")
-    return city.main(starting_port+4, number_general)
+    return city.main(city_port, number_general, number_of_generals, city_node)
 
 
 if __name__ == '__main__':
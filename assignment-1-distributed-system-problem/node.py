@@ -2,7 +2,7 @@ import logging
 import threading
 from pprint import pformat
 
-from node_socket import UdpSocket
+from node_socket import MAX_DATAGRAM_SIZE, UdpSocket
 
 
 class Order:
@@ -10,56 +10,118 @@ class Order:
     ATTACK = 1
 
 
+def tolerated_traitors(number_of_generals: int) -> int:
+    """
+    Largest m for which OM(m) still reaches agreement (N >= 3m + 1)
+    :param number_of_generals: number of generals including the supreme general
+    :return: int
+    """
+    return max(0, (number_of_generals - 1) // 3)
+
+
+def majority(orders):
+    """
+    Majority of a list of orders, ties fall back to RETREAT
+    :param orders: list
+    :return: Order
+    """
+    if orders.count(Order.ATTACK) > orders.count(Order.RETREAT):
+        return Order.ATTACK
+    return Order.RETREAT
+
+
 class General:
 
     def __init__(self, my_id: int, is_traitor: bool, my_port: int,
-                 ports: list, node_socket: UdpSocket, city_port: int):
+                 ports: list, node_socket: UdpSocket, city_port: int,
+                 max_traitors: int = None):
         self.ports = ports
         self.my_id = my_id
         self.city_port = city_port
         self.node_socket = node_socket
         self.my_port = my_port
         self.is_traitor = is_traitor
+        self.max_traitors = max_traitors if max_traitors is not None else tolerated_traitors(len(ports))
+
+        # message tree of OM(m): path of general ids (starting with the supreme general) -> order
+        self.tree = {}
+        self.received_per_round = [0] * (self.max_traitors + 1)
+        # (sender, round) -> parts still missing of a batch split over several datagrams
+        self.missing_parts = {}
+        self.next_round = 1
+        self.msg_counter = 0
+
+    def expected_messages(self):
+        """
+        One order from the supreme general plus one batch per lieutenant for every relay round
+        :return: int
+        """
+        return 1 + self.max_traitors * (len(self.ports) - 2)
 
     def start(self):
         """
-        TODO
+        Run OM(m) as a lieutenant: collect the whole message tree, relaying every round, then decide
         :return: None
         """
-        # init list for orders
-        orders = list()
-
-        # send ready message to supreme general
-        self.node_socket.send(f"ready", self.ports[0])
-        msg_counter = 1
+        self.ready_procedure()
 
         # listen to incoming messages
-        while True:
-            if msg_counter == len(self.ports):
-                break
+        while not self.is_finished():
             msg_list = self.listen_procedure()
-            
-            sender = msg_list[0]
+            self.on_message(msg_list)
 
-            order = int((msg_list[1].split("="))[1])
+        return
 
-            logging.info(f"Got incoming message from {sender}: {msg_list}")
+    def ready_procedure(self):
+        """
+        Send ready message to supreme general
+        :return: None
+        """
+        self.node_socket.send(f"ready", self.ports[0])
 
-            # append message to list
-            orders.append(order)
-            logging.info(f"Append message to a list: {orders}")
+    def is_finished(self):
+        """
+        :return: True once every message of OM(m) has been received
+        """
+        return self.msg_counter == self.expected_messages()
 
-            self.sending_procedure(sender, order)
-            msg_counter+=1
+    def on_message(self, msg_list):
+        """
+        Handle one incoming message, concluding once it is the last one
+        :param msg_list: message split on "~"
+        :return: None
+        """
+        sender = msg_list[0]
+        payload = msg_list[1].split("=")[1]
 
-        # conclude action
-        self.conclude_action(orders)
+        logging.info(f"Got incoming message from {sender}: {msg_list}")
 
-        return
+        # store the received order(s) in the message tree
+        if ":" in payload:
+            order = None
+            parts = int(msg_list[2].split("=")[1]) if len(msg_list) > 2 else 1
+            stored = self.store_batch(sender, payload, parts)
+        else:
+            order = int(payload)
+            stored = self.store_order(sender, order)
+        if stored is None:
+            logging.info(f"Drop relay from {sender} beyond the {self.max_traitors} rounds of OM({self.max_traitors})")
+            return
+        logging.info(f"Message tree: {self.tree}")
+        if order is None and (sender, stored) in self.missing_parts:
+            # the batch counts as one message once all of its parts are in
+            return
+
+        self.sending_procedure(sender, order)
+        self.msg_counter += 1
+
+        # conclude action
+        if self.is_finished():
+            self.conclude_action(self.om_orders())
 
     def listen_procedure(self):
         """
-        TODO
+        Receive a single message
         :return: list
         """
         # listen to incoming messages
@@ -69,36 +131,153 @@ class General:
 
         return msg_list
 
+    def store_order(self, sender, order):
+        """
+        Store a single order, coming from the supreme general (round 0) or a round 1 relay
+        :param sender: sender id
+        :param order: order
+        :return: tuple, None for a relay OM(m) has no round for
+        """
+        path = (0,) if sender == "supreme_general" else (0, int(sender.split("_")[1]))
+        if len(path) - 1 > self.max_traitors:
+            return None
+        self.tree[path] = order
+        self.received_per_round[len(path) - 1] += 1
+        return path
+
+    def store_batch(self, sender, payload, parts=1):
+        """
+        Store a batched relay, each entry is "<id>.<id>:<order>" where the ids are the relay path
+        between the supreme general and the sender
+        :param sender: sender id
+        :param payload: batched orders
+        :param parts: number of datagrams the batch was split into
+        :return: int round of the batch, None for a round OM(m) does not have
+        """
+        sender_id = int(sender.split("_")[1])
+        entries = []
+        for entry in payload.split(","):
+            relay_path, order = entry.split(":")
+            entries.append(((0,) + tuple(int(x) for x in relay_path.split(".")) + (sender_id,), int(order)))
+        # every entry of a batch has the same round
+        relay_round = len(entries[0][0]) - 1
+        if relay_round > self.max_traitors:
+            return None
+        self.tree.update(entries)
+        missing = self.missing_parts.pop((sender, relay_round), parts) - 1
+        if missing > 0:
+            self.missing_parts[(sender, relay_round)] = missing
+        else:
+            self.received_per_round[relay_round] += 1
+        return relay_round
+
     def sending_procedure(self, sender, order):
         """
-        TODO
+        Relay the supreme general's order (round 1), then every later round once the previous
+        one is complete, as a single datagram per general
         :param sender: sender id
         :param order: order
-        :return: str or None
+        :return: str, list or None
         """
-        # if self is traitor, send reverse of the order      
-        if self.is_traitor:
-                        if order == 1:
-                            order = 0
-                        else:
-                            order = 1
+        # if sender is supreme general, send order to all generals, OM(0) has no relay round
+        if sender == "supreme_general" and self.max_traitors > 0:
+            # if self is traitor, send reverse of the order
+            if self.is_traitor:
+                order = Order.RETREAT if order == Order.ATTACK else Order.ATTACK
 
-        # if sender is supreme general, send order to all generals
-        if sender == "supreme_general":
             counter = 0
             for port in self.ports:
                 # send to all but self and supreme general
                 if port != self.my_port and port != self.ports[0]:
-                    
+
                     logging.info(f"Done sending message to general {counter}...")
                     self.node_socket.send(f"general_{self.my_id}~order={order}", port)
-                counter+=1
+                counter += 1
+            self.next_round = 2
+            # later rounds may already be complete if the supreme general's order came in last
+            self.relay_complete_rounds()
             return f"general_{self.my_id}~order={order}"
-        return None
+
+        return self.relay_complete_rounds() or None
+
+    def relay_complete_rounds(self):
+        """
+        Relay every round whose previous round has been fully received
+        :return: list
+        """
+        messages = []
+        while 1 < self.next_round <= self.max_traitors and \
+                self.received_per_round[self.next_round - 1] == len(self.ports) - 2:
+            messages.extend(self.relay_round(self.next_round))
+            self.next_round += 1
+        return messages
+
+    def relay_round(self, relay_round):
+        """
+        Relay every order of the previous round to the generals that have not seen it yet
+        :param relay_round: round number, the paths relayed have relay_round ids
+        :return: list
+        """
+        messages = []
+        for general_id in range(1, len(self.ports)):
+            if general_id == self.my_id:
+                continue
+
+            entries = []
+            for path, order in self.tree.items():
+                if len(path) != relay_round or self.my_id in path or general_id in path:
+                    continue
+                if self.is_traitor:
+                    order = Order.RETREAT if order == Order.ATTACK else Order.ATTACK
+                entries.append(f"{'.'.join(str(x) for x in path[1:])}:{order}")
+
+            logging.info(f"Relay round {relay_round} to general {general_id}: {len(entries)} orders")
+            for message in self.batch_messages(entries):
+                self.node_socket.send(message, self.ports[general_id])
+                messages.append(message)
+        return messages
+
+    def batch_messages(self, entries):
+        """
+        Messages carrying a batch of relayed orders, the batch grows with (N-2)!/(N-m-1)! and is
+        split into parts when it does not fit in one datagram
+        :param entries: list of "<path>:<order>"
+        :return: list
+        """
+        prefix = f"general_{self.my_id}~orders="
+        # room for the "~parts=<n>" suffix
+        limit = MAX_DATAGRAM_SIZE - len(prefix) - 32
+        parts = [[]]
+        size = 0
+        for entry in entries:
+            if parts[-1] and size + len(entry) + 1 > limit:
+                parts.append([])
+                size = 0
+            parts[-1].append(entry)
+            size += len(entry) + 1
+        if len(parts) == 1:
+            return [prefix + ",".join(parts[0])]
+        return [f"{prefix}{','.join(part)}~parts={len(parts)}" for part in parts]
+
+    def om_orders(self, path=(0,)):
+        """
+        Orders to be voted on for the given path of OM(m), the value received for the path
+        plus the recursive majority each remaining lieutenant relayed for it
+        :param path: relay path starting with the supreme general
+        :return: list
+        """
+        orders = [self.tree.get(path, Order.RETREAT)]
+        if len(path) > self.max_traitors:
+            return orders
+        for general_id in range(1, len(self.ports)):
+            if general_id == self.my_id or general_id in path:
+                continue
+            orders.append(majority(self.om_orders(path + (general_id,))))
+        return orders
 
     def conclude_action(self, orders):
         """
-        TODO
+        Decide by majority and report the action to the city
         :param orders: list
         :return: str or None
         """
@@ -110,7 +289,7 @@ class General:
             return None
 
         # if theres more 1 than 0, attack, else retreat
-        if orders.count(1) > orders.count(0):
+        if majority(orders) == Order.ATTACK:
             logging.info("action: ATTACK")
             self.node_socket.send(f"general_{self.my_id}~action={Order.ATTACK}", self.city_port)
             return f"general_{self.my_id}~action={Order.ATTACK}"
@@ -124,9 +303,10 @@ class General:
 class SupremeGeneral(General):
 
     def __init__(self, my_id: int, is_traitor: bool, my_port: int, ports: list, node_socket: UdpSocket, city_port: int,
-                 order: Order):
-        super().__init__(my_id, is_traitor, my_port, ports, node_socket, city_port)
+                 order: Order, max_traitors: int = None):
+        super().__init__(my_id, is_traitor, my_port, ports, node_socket, city_port, max_traitors)
         self.order = order
+        self.ready_counter = 0
 
     def sending_procedure(self, sender, order):
         """
@@ -166,25 +346,38 @@ class SupremeGeneral(General):
         # check if all generals are ready
         logging.info("Wait until all generals are running...")
 
-        counter = 1
-        while True:
-            if counter == len(self.ports):
-                logging.debug("All generals are ready")
-                break
-            msg= self.node_socket.listen()
+        while not self.is_finished():
+            msg = self.node_socket.listen()
             if msg:
-                logging.debug(msg)
-                counter+=1
-            
+                self.on_message(msg[0].split("~"))
+
+        return None
+
+    def is_finished(self):
+        """
+        :return: True once every general is ready and the orders are sent
+        """
+        return self.ready_counter == len(self.ports) - 1
+
+    def on_message(self, msg_list):
+        """
+        Count a ready message, sending the orders once every general is ready
+        :param msg_list: message split on "~"
+        :return: None
+        """
+        logging.debug(msg_list)
+        self.ready_counter += 1
+        if not self.is_finished():
+            return
+        logging.debug("All generals are ready")
+
         # send to all generals
         logging.debug("Start sending orders to all generals...")
         result = self.sending_procedure("supreme_general", order=self.order)
-        
+
         logging.info("Finish sending orders to all generals...")
         self.conclude_action([])
 
-        return None
-
     def conclude_action(self, orders):
         """
         TODO
@@ -210,7 +403,8 @@ def thread_exception_handler(args):
 
 def main(is_traitor: bool, node_id: int, ports: list,
          my_port: int = 0, order: Order = Order.RETREAT,
-         is_supreme_general: bool = False, city_port: int = 0):
+         is_supreme_general: bool = False, city_port: int = 0,
+         max_traitors: int = None):
     threading.excepthook = thread_exception_handler
     try:
         if node_id > 0:
@@ -223,6 +417,7 @@ def main(is_traitor: bool, node_id: int, ports: list,
         logging.debug(f"order: {order}")
         logging.debug(f"is_supreme_general: {is_supreme_general}")
         logging.debug(f"city_port: {city_port}")
+        logging.debug(f"max_traitors: {max_traitors}")
 
         if node_id == 0:
             obj = SupremeGeneral(my_id=node_id,
@@ -230,14 +425,16 @@ def main(is_traitor: bool, node_id: int, ports: list,
                                  is_traitor=is_traitor,
                                  node_socket=UdpSocket(my_port),
                                  my_port=my_port,
-                                 ports=ports, order=order)
+                                 ports=ports, order=order,
+                                 max_traitors=max_traitors)
         else:
             obj = General(my_id=node_id,
                           city_port=city_port,
                           is_traitor=is_traitor,
                           node_socket=UdpSocket(my_port),
                           my_port=my_port,
-                          ports=ports, )
+                          ports=ports,
+                          max_traitors=max_traitors)
         obj.start()
     except Exception:
         logging.exception("Caught Error")
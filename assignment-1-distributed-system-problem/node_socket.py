@@ -2,6 +2,9 @@ import logging
 import socket
 import threading
 
+# largest UDP payload over IPv4, a message must fit in one datagram to arrive whole
+MAX_DATAGRAM_SIZE = 65507
+
 
 class NodeSocket:
 
@@ -45,13 +48,9 @@ class UdpSocket(NodeSocket):
         super(UdpSocket, self).__init__(socket.SOCK_DGRAM, port)
 
     def listen(self):
-        input_value_byte, address = self.sc.recvfrom(1024)
+        input_value_byte, address = self.sc.recvfrom(65535)
         return input_value_byte.decode("UTF-8"), address
 
-    @staticmethod
-    def send(message: str, port: int = 0):
-        client_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-        client_socket.sendto(message.encode("UTF-8"), ("127.0.0.1", port))
-        client_socket.close()
-
-
+    def send(self, message: str, port: int = 0):
+        # reuse the bound socket instead of opening one per datagram
+        self.sc.sendto(message.encode("UTF-8"), ("127.0.0.1", port))
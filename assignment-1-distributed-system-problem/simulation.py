@@ -0,0 +1,176 @@
+import heapq
+import itertools
+import logging
+import random
+
+import node
+from city import City
+
+
+class SimTimer:
+
+    def __init__(self):
+        self.is_cancelled = False
+
+    def cancel(self):
+        self.is_cancelled = True
+
+
+class Simulator:
+    """
+    Discrete-event simulator with virtual time.
+
+    Every timer and every message delivery is an event ordered by virtual time, and every
+    random choice (latency, loss, reordering) comes from one seeded generator, so a run only
+    depends on its seed and finishes as fast as its events can be processed.
+    """
+
+    def __init__(self, seed=0, latency=(0.001, 0.005), loss=0.0, reorder=0.0, reorder_delay=0.01):
+        """
+        :param seed: seed of every random choice of the network
+        :param latency: (lower bound, upper bound) of the delay of a message, in seconds
+        :param loss: probability of a message to be dropped
+        :param reorder: probability of a message to get an extra delay of up to reorder_delay
+        :param reorder_delay: largest extra delay of a reordered message, in seconds
+        """
+        self.now = 0.0
+        self.random = random.Random(seed)
+        self.latency = latency
+        self.loss = loss
+        self.reorder = reorder
+        self.reorder_delay = reorder_delay
+
+        self.events = []
+        self.sequence = itertools.count()
+        self.handlers = {}
+        self.groups = None
+
+        self.sent = 0
+        self.delivered = 0
+        self.dropped = 0
+
+    def time(self):
+        return self.now
+
+    def call_later(self, delay, callback, *args):
+        timer = SimTimer()
+        heapq.heappush(self.events, (self.now + delay, next(self.sequence), timer, callback, args))
+        return timer
+
+    def register(self, port, handler):
+        # handler is called with the payload of every message delivered to the port
+        self.handlers[port] = handler
+
+    def unregister(self, port):
+        # a crashed node, messages to it are dropped
+        self.handlers.pop(port, None)
+
+    def partition(self, *groups):
+        # only ports within the same group can reach each other, ports in no group form one more group
+        self.groups = {port: index for index, group in enumerate(groups) for port in group}
+
+    def heal(self):
+        self.groups = None
+
+    def is_reachable(self, source, destination):
+        if self.groups is None:
+            return True
+        return self.groups.get(source, -1) == self.groups.get(destination, -1)
+
+    def send(self, source, destination, payload):
+        self.sent += 1
+        if not self.is_reachable(source, destination) or self.random.random() < self.loss:
+            self.dropped += 1
+            return
+        delay = self.random.uniform(*self.latency)
+        if self.reorder and self.random.random() < self.reorder:
+            delay += self.random.uniform(0, self.reorder_delay)
+        self.call_later(delay, self.deliver, destination, payload)
+
+    def deliver(self, destination, payload):
+        handler = self.handlers.get(destination)
+        if handler is None:
+            self.dropped += 1
+            return
+        self.delivered += 1
+        handler(payload)
+
+    def run(self, until=None, stop=None):
+        """
+        Process events in virtual time order
+        :param until: virtual time to stop at, None to run until no event is left
+        :param stop: called after every event, the run stops as soon as it returns True
+        :return: virtual time at the end of the run
+        """
+        while self.events:
+            when, _, timer, callback, args = self.events[0]
+            if until is not None and when > until:
+                break
+            heapq.heappop(self.events)
+            if timer.is_cancelled:
+                continue
+            self.now = when
+            callback(*args)
+            if stop is not None and stop():
+                return self.now
+        if until is not None:
+            self.now = max(self.now, until)
+        return self.now
+
+
+class SimSocket:
+    """
+    Drop-in replacement of UdpSocket sending through a Simulator
+    """
+
+    def __init__(self, simulator: Simulator, port: int):
+        self.simulator = simulator
+        self.port = port
+
+    def send(self, message: str, port: int = 0):
+        self.simulator.send(self.port, port, message)
+
+    def listen(self):
+        raise RuntimeError("A simulated node is driven by its message handler, not by listen()")
+
+
+def run_bgp(roles, order, max_traitors=None, seed=0, **network):
+    """
+    Run one Byzantine agreement over the simulated network
+    :param roles: list of booleans, True for a traitor, the first general is the supreme general
+    :param order: Order given by the supreme general
+    :param max_traitors: m of OM(m), defaults to the largest one the number of generals allows
+    :param seed: seed of the network
+    :param network: latency, loss, reorder and reorder_delay of the Simulator
+    :return: the verdict of the city, FAILED when it never hears from every loyal general
+    """
+    simulator = Simulator(seed, **network)
+    number_of_generals = len(roles)
+    ports = list(range(number_of_generals))
+    city_port = number_of_generals
+
+    city = City(my_port=city_port, number_general=roles.count(False),
+                number_of_generals=number_of_generals, node_socket=SimSocket(simulator, city_port))
+    verdict = city.check_generals()
+    if verdict is not None:
+        return verdict
+    simulator.register(city_port, lambda message: city.on_message(message.split("~")))
+
+    for node_id in ports:
+        node_socket = SimSocket(simulator, node_id)
+        if node_id == 0:
+            general = node.SupremeGeneral(my_id=node_id, is_traitor=roles[node_id], my_port=node_id,
+                                          ports=ports, node_socket=node_socket, city_port=city_port,
+                                          order=order, max_traitors=max_traitors)
+        else:
+            general = node.General(my_id=node_id, is_traitor=roles[node_id], my_port=node_id,
+                                   ports=ports, node_socket=node_socket, city_port=city_port,
+                                   max_traitors=max_traitors)
+            simulator.call_later(0, general.ready_procedure)
+        simulator.register(node_id, lambda message, general=general: general.on_message(message.split("~")))
+
+    simulator.run(stop=lambda: city.verdict is not None)
+    if city.verdict is None:
+        logging.info("The city did not hear from every loyal general")
+        return "FAILED"
+    return city.verdict
@@ -0,0 +1,47 @@
+import unittest
+from itertools import product
+
+from node import Order
+from simulation import run_bgp
+
+try:
+    import numpy
+    from batch import evaluate, om_table, traitor_placements
+except ImportError:
+    numpy = None
+
+
+@unittest.skipIf(numpy is None, "batch evaluation needs numpy")
+class BatchTest(unittest.TestCase):
+
+    def test_matches_all_tc_out(self):
+        with open("all_tc_out.txt") as f:
+            expected = [line.split(" for case ")[0] for line in f.read().splitlines()]
+        self.assertEqual(expected, list(evaluate(traitor_placements(4), Order.ATTACK)))
+
+    def test_placements_in_all_tc_out_order(self):
+        self.assertEqual([list(case) for case in product((False, True), repeat=3)],
+                         traitor_placements(3).tolist())
+        self.assertEqual([[True, True, False], [True, False, True], [False, True, True]],
+                         traitor_placements(3, 2).tolist())
+
+    def test_om_table_depth_zero_is_the_value_received(self):
+        table = om_table(3, 0)
+        self.assertTrue((table[Order.ATTACK] == Order.ATTACK).all())
+        self.assertTrue((table[Order.RETREAT] == Order.RETREAT).all())
+
+    def test_matches_simulated_om2(self):
+        roles = traitor_placements(7)
+        for order in (Order.RETREAT, Order.ATTACK):
+            verdicts = evaluate(roles, order)
+            for case, verdict in zip(roles.tolist(), verdicts):
+                self.assertEqual(run_bgp(case, order), verdict, case)
+
+    def test_not_enough_generals_for_m(self):
+        verdicts = evaluate([[False] * 6], Order.ATTACK, max_traitors=2)
+        self.assertEqual(["ERROR_NOT_ENOUGH_GENERALS"], list(verdicts))
+        self.assertEqual(object, verdicts.dtype)
+
+
+if __name__ == '__main__':
+    unittest.main()
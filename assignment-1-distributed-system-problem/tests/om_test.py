@@ -0,0 +1,147 @@
+import itertools
+import unittest
+from unittest import mock
+
+from city import City
+from node import General, Order, majority, tolerated_traitors
+from node_socket import MAX_DATAGRAM_SIZE, UdpSocket
+
+
+def fill_last_round(general):
+    # every relay path of the round before the last one, between the supreme general and a lieutenant
+    for path in itertools.permutations(range(2, len(general.ports)), general.max_traitors - 1):
+        general.tree[(0,) + path] = Order.ATTACK
+
+
+class OmTest(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.patch1 = mock.patch('logging.info')
+        self.patch2 = mock.patch('logging.debug')
+        self.patch1.start()
+        self.patch2.start()
+
+        self.patch3 = mock.patch('node_socket.UdpSocket.send')
+        self.mock_send_message = self.patch3.start()
+        self.mock_send_message.return_value = None
+
+        self.general = General(
+            my_id=1, is_traitor=False,
+            my_port=1, ports=[0, 1, 2, 3, 4, 5, 6],
+            node_socket=UdpSocket(),
+            city_port=0
+        )
+
+    def tearDown(self) -> None:
+        self.patch1.stop()
+        self.patch2.stop()
+        self.patch3.stop()
+
+    def test_tolerated_traitors(self):
+        self.assertEqual(0, tolerated_traitors(3))
+        self.assertEqual(1, tolerated_traitors(4))
+        self.assertEqual(2, tolerated_traitors(7))
+        self.assertEqual(3, tolerated_traitors(10))
+
+    def test_majority_tie_is_retreat(self):
+        self.assertEqual(Order.RETREAT, majority([Order.ATTACK, Order.RETREAT]))
+        self.assertEqual(Order.ATTACK, majority([Order.ATTACK, Order.ATTACK, Order.RETREAT]))
+
+    def test_expected_messages_om2(self):
+        self.assertEqual(2, self.general.max_traitors)
+        self.assertEqual(11, self.general.expected_messages())
+
+    def test_second_round_is_one_batch_per_general(self):
+        self.general.store_order("supreme_general", Order.ATTACK)
+        self.general.sending_procedure("supreme_general", Order.ATTACK)
+        self.assertEqual(5, self.mock_send_message.call_count)
+
+        for general_id in range(2, 7):
+            self.general.store_order(f"general_{general_id}", Order.ATTACK)
+            result = self.general.sending_procedure(f"general_{general_id}", Order.ATTACK)
+        self.assertEqual(10, self.mock_send_message.call_count)
+        self.assertEqual(5, len(result))
+        # relays to general 2 leave out the path through general 2 itself
+        self.assertEqual("general_1~orders=3:1,4:1,5:1,6:1", result[0])
+
+    def test_store_batch(self):
+        relay_round = self.general.store_batch("general_3", "2:1,4:0")
+        self.assertEqual(2, relay_round)
+        self.assertEqual(Order.ATTACK, self.general.tree[(0, 2, 3)])
+        self.assertEqual(Order.RETREAT, self.general.tree[(0, 4, 3)])
+
+    def test_split_batch_counts_once_complete(self):
+        sender = General(my_id=3, is_traitor=False, my_port=3, ports=[0, 1, 2, 3, 4, 5, 6],
+                         node_socket=UdpSocket(), city_port=0)
+        with mock.patch("node.MAX_DATAGRAM_SIZE", 60):
+            messages = sender.batch_messages(["2:1", "4:0", "5:1", "6:1"])
+        self.assertEqual(["general_3~orders=2:1,4:0~parts=2", "general_3~orders=5:1,6:1~parts=2"], messages)
+
+        self.general.on_message(messages[0].split("~"))
+        self.assertEqual(0, self.general.received_per_round[2])
+        self.assertEqual(0, self.general.msg_counter)
+        self.general.on_message(messages[1].split("~"))
+        self.assertEqual(1, self.general.received_per_round[2])
+        self.assertEqual(1, self.general.msg_counter)
+        self.assertEqual(Order.RETREAT, self.general.tree[(0, 4, 3)])
+        self.assertEqual(Order.ATTACK, self.general.tree[(0, 6, 3)])
+
+    def test_om_orders_outvotes_two_traitors(self):
+        # generals 2 and 3 are traitors and flip everything they relay
+        traitors = {2, 3}
+        self.general.tree[(0,)] = Order.ATTACK
+        for first in range(2, 7):
+            self.general.tree[(0, first)] = Order.RETREAT if first in traitors else Order.ATTACK
+            for second in range(2, 7):
+                if second == first:
+                    continue
+                self.general.tree[(0, first, second)] = Order.RETREAT if second in traitors else Order.ATTACK
+        orders = self.general.om_orders()
+        self.assertEqual(6, len(orders))
+        self.assertEqual(Order.ATTACK, majority(orders))
+
+    def test_city_too_many_traitors(self):
+        city = City(my_port=0, number_general=4, number_of_generals=7)
+        self.assertEqual("FAILED", city.start())
+
+
+
+class RelayDatagramTest(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.patch = mock.patch('logging.info')
+        self.patch.start()
+        self.receiver = UdpSocket()
+        self.sender = UdpSocket()
+
+    def tearDown(self) -> None:
+        self.patch.stop()
+        self.receiver.sc.close()
+        self.sender.sc.close()
+
+    def test_last_round_of_thirteen_generals_arrives_whole(self):
+        port = self.receiver.sc.getsockname()[1]
+        general = General(my_id=1, is_traitor=False, my_port=port, ports=[port] * 13,
+                          node_socket=self.sender, city_port=0)
+        fill_last_round(general)
+        messages = general.relay_round(general.max_traitors)
+        self.assertEqual(11, len(messages))
+        for message in messages:
+            self.assertGreater(len(message), 1024)
+            self.assertEqual(message, self.receiver.listen()[0])
+
+    def test_batches_are_split_to_fit_in_a_datagram(self):
+        general = General(my_id=1, is_traitor=False, my_port=0, ports=list(range(16)),
+                          node_socket=self.sender, city_port=0)
+        fill_last_round(general)
+        entries = [f"{'.'.join(str(x) for x in path[1:])}:1" for path in general.tree]
+        messages = general.batch_messages(entries)
+        self.assertGreater(len(messages), 1)
+        for message in messages:
+            self.assertLessEqual(len(message.encode("UTF-8")), MAX_DATAGRAM_SIZE)
+            self.assertTrue(message.endswith(f"~parts={len(messages)}"))
+        self.assertEqual(entries, ",".join(message.split("~")[1].split("=")[1] for message in messages).split(","))
+
+
+if __name__ == '__main__':
+    unittest.main()
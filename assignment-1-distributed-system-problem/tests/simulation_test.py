@@ -0,0 +1,59 @@
+import unittest
+from unittest import mock
+
+from node import Order
+from simulation import Simulator, run_bgp
+
+
+class SimulationTest(unittest.TestCase):
+
+    def test_simulator_orders_events_by_virtual_time(self):
+        simulator = Simulator()
+        calls = []
+        simulator.call_later(2, calls.append, "second")
+        simulator.call_later(1, calls.append, "first")
+        simulator.call_later(3, calls.append, "cancelled").cancel()
+        self.assertEqual(2, simulator.run())
+        self.assertEqual(["first", "second"], calls)
+
+    def test_partition_drops_messages(self):
+        simulator = Simulator()
+        received = []
+        simulator.register(1, received.append)
+        simulator.partition([0], [1])
+        simulator.send(0, 1, "lost")
+        simulator.heal()
+        simulator.send(0, 1, "delivered")
+        simulator.run()
+        self.assertEqual(["delivered"], received)
+        self.assertEqual(1, simulator.dropped)
+
+    def test_run_bgp_matches_udp_execution(self):
+        self.assertEqual("RETREAT", run_bgp([False, True, False, False], Order.RETREAT))
+        self.assertEqual("ATTACK", run_bgp([True, False, False, False], Order.ATTACK))
+        self.assertEqual("ERROR_LESS_THAN_TWO_GENERALS", run_bgp([True, True, True, False], Order.RETREAT))
+        self.assertEqual("FAILED", run_bgp([False, True, True, False], Order.ATTACK))
+
+    def test_run_bgp_om0_for_three_generals(self):
+        # N=3 tolerates no traitor, the lieutenants take the supreme general's order as it is
+        self.assertEqual("ATTACK", run_bgp([False, False, False], Order.ATTACK))
+        self.assertEqual("RETREAT", run_bgp([False, False, False], Order.RETREAT))
+
+    def test_run_bgp_explicit_om0(self):
+        self.assertEqual("ATTACK", run_bgp([False, False, False, False], Order.ATTACK, max_traitors=0))
+        self.assertEqual("RETREAT", run_bgp([False, True, False, False], Order.RETREAT, max_traitors=0))
+        for seed in range(5):
+            self.assertEqual("ATTACK", run_bgp([False] * 5, Order.ATTACK, max_traitors=0, seed=seed, reorder=0.5))
+
+    def test_run_bgp_om2_with_reordering(self):
+        roles = [False, True, False, True, False, False, False]
+        for seed in range(10):
+            self.assertEqual("ATTACK", run_bgp(roles, Order.ATTACK, seed=seed, reorder=0.5))
+
+
+    def test_run_bgp_with_batches_split_over_datagrams(self):
+        with mock.patch("node.MAX_DATAGRAM_SIZE", 60):
+            self.assertEqual("ATTACK", run_bgp([False, False, True, False, False, True, False], Order.ATTACK))
+
+if __name__ == '__main__':
+    unittest.main()
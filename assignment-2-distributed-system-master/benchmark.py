@@ -0,0 +1,222 @@
+import csv
+import json
+import logging
+import time
+from argparse import ArgumentParser
+
+from simulation import GossipSimulation
+
+
+# percentile and format_value taken from assignment 3
+def percentile(values, fraction):
+    # nearest rank, values must be sorted
+    if not values:
+        return None
+    return values[min(len(values) - 1, max(0, int(round(fraction * len(values))) - 1))]
+
+
+def format_value(value):
+    if value is None:
+        return "-"
+    return f"{value:.3f}" if isinstance(value, float) else str(value)
+
+
+def measure_convergence(number_of_nodes, heartbeat_duration, num_of_neighbors_to_choose, fault_duration, kills,
+                        seed, warmup=None, kill_interval=None, swim=False, phi_threshold=None,
+                        anti_entropy_rounds=10, **network):
+    """
+    Kill the node with the highest id every kill_interval, like main.py does, on a simulated network,
+    and record when every surviving node declares it a fault. The last victim gets one more
+    kill_interval to be detected
+    :param kills: number of nodes killed, one after the other
+    :param warmup: seconds the cluster runs before the first kill, 5 fault durations by default
+    :param kill_interval: seconds between two kills, 5 fault durations by default
+    :param swim: run SwimNode instead of GossipNode
+    :param phi_threshold: phi-accrual threshold of the GossipNode failure detector
+    :param network: latency, loss, reorder and reorder_delay of the Simulator
+    :return: detection times, detection rounds, false positives and traffic of the run
+    """
+    warmup = warmup if warmup is not None else 5 * fault_duration
+    kill_interval = kill_interval if kill_interval is not None else 5 * fault_duration
+    simulation = GossipSimulation(number_of_nodes, heartbeat_duration, num_of_neighbors_to_choose, fault_duration,
+                                  anti_entropy_rounds, seed, swim=swim, phi_threshold=phi_threshold, **network)
+    simulator = simulation.simulator
+
+    # (time, observer id, member id, gossip rounds the observer ran) of every fault declared
+    faults = []
+    for node in simulation.nodes.values():
+        node.fault_listener = lambda member, now, node=node: faults.append(
+            (now, node.node_id, int(member.split("-")[1]), simulation.rounds[node.node_id]))
+    killed_at = {}
+    # gossip rounds every node ran when a victim was killed
+    rounds_at_kill = {}
+
+    simulation.run(warmup)
+    started_at = simulator.now
+    sent_at_start = {node_id: (node.transport.messages_sent, node.transport.bytes_sent)
+                     for node_id, node in simulation.nodes.items()}
+    transports = {node_id: node.transport for node_id, node in simulation.nodes.items()}
+    # faults declared before the measurement are warmup noise
+    faults.clear()
+
+    # survivors of every kill that already thought the victim was a fault, they detect it at once
+    already = {}
+    for _ in range(kills):
+        # one kill_interval of steady state before the first kill, then one for each kill to be detected
+        simulation.run(simulator.now + kill_interval)
+        victim = max(simulation.nodes)
+        already[victim] = {node_id for node_id, node in simulation.nodes.items()
+                           if node_id != victim and not node.status_dictionary[f"node-{victim}"][1]}
+        simulation.kill(victim)
+        killed_at[victim] = simulator.now
+        rounds_at_kill[victim] = dict(simulation.rounds)
+    simulation.run(simulator.now + kill_interval)
+
+    results = []
+    for victim, victim_killed_at in killed_at.items():
+        # nodes killed later still count as survivors until they are killed
+        survivors = [node_id for node_id in transports
+                     if node_id not in killed_at or killed_at[node_id] > victim_killed_at]
+        detected = {node_id: (0.0, 0) for node_id in already[victim]}
+        for when, observer, member, rounds in faults:
+            if member == victim and observer not in detected and victim_killed_at <= when and \
+                    when < killed_at.get(observer, when + 1):
+                detected[observer] = (when - victim_killed_at, rounds - rounds_at_kill[victim][observer])
+        times = sorted(detected[node_id][0] for node_id in survivors if node_id in detected)
+        rounds = [detected[node_id][1] for node_id in survivors if node_id in detected]
+        results.append({"victim": victim,
+                        "survivors": len(survivors),
+                        "missed": len(survivors) - len(times),
+                        "detection_times": times,
+                        # most gossip rounds a survivor ran between the kill and declaring the victim a fault,
+                        # None if one never did
+                        "rounds_to_all": max(rounds, default=0) if len(times) == len(survivors) else None})
+    ended_at = simulator.now
+
+    # a fault declared about a member that was alive at the time
+    false_positives = sum(1 for when, _, member, _ in faults if member not in killed_at or when < killed_at[member])
+
+    # traffic per node, each over the time it was alive during the measurement
+    messages_rates = []
+    bytes_rates = []
+    node_seconds = 0.0
+    for node_id, transport in transports.items():
+        duration = killed_at.get(node_id, ended_at) - started_at
+        node_seconds += duration
+        messages, sent_bytes = sent_at_start[node_id]
+        messages_rates.append((transport.messages_sent - messages) / duration)
+        bytes_rates.append((transport.bytes_sent - sent_bytes) / duration)
+
+    return {"kills": results,
+            "false_positives": false_positives,
+            "node_seconds": node_seconds,
+            "duration": ended_at - started_at,
+            "messages_per_node_per_second": sum(messages_rates) / len(messages_rates),
+            "messages_per_node_per_second_max": max(messages_rates),
+            "bytes_per_node_per_second": sum(bytes_rates) / len(bytes_rates),
+            "bytes_per_node_per_second_max": max(bytes_rates)}
+
+
+def summarize(runs):
+    # detection percentiles over every survivor of every kill, rates averaged over the seeds
+    times = sorted(value for run in runs for kill in run["kills"] for value in kill["detection_times"])
+    rounds = sorted(kill["rounds_to_all"] for run in runs for kill in run["kills"]
+                    if kill["rounds_to_all"] is not None)
+    summary = {"kills": sum(len(run["kills"]) for run in runs),
+               "missed": sum(kill["missed"] for run in runs for kill in run["kills"]),
+               "false_positives": sum(run["false_positives"] for run in runs)}
+    # false positives each node declares per minute it is alive, comparable across sizes and durations
+    summary["false_positives_per_node_minute"] = 60 * summary["false_positives"] / sum(run["node_seconds"]
+                                                                                       for run in runs)
+    for name, fraction in (("p50", 0.5), ("p90", 0.9), ("p99", 0.99)):
+        summary[f"detection_time_{name}"] = percentile(times, fraction)
+    summary["detection_time_max"] = times[-1] if times else None
+    summary["rounds_to_all_p50"] = percentile(rounds, 0.5)
+    summary["rounds_to_all_max"] = rounds[-1] if rounds else None
+    for metric in ("messages_per_node_per_second", "bytes_per_node_per_second"):
+        summary[metric] = sum(run[metric] for run in runs) / len(runs)
+        summary[f"{metric}_max"] = max(run[f"{metric}_max"] for run in runs)
+    return summary
+
+
+def main():
+    parser = ArgumentParser(description="Measure how fast gossip detects killed nodes and what it costs, "
+                                        "across cluster sizes and fan-outs, on a simulated network")
+    parser.add_argument("-n", type=int, nargs="+", dest="nodes",
+                        help="The numbers of nodes", default=[8, 16, 32])
+    parser.add_argument("-m", type=int, nargs="+", dest="neighbors",
+                        help="The numbers of chosen neighbors, of indirect probes with -S", default=[2, 3])
+    parser.add_argument("-b", type=float, dest="heartbeat",
+                        help="The particular duration of the heartbeat", default=1.0)
+    parser.add_argument("-f", type=float, dest="fault_duration",
+                        help="The particular duration to assume a node to be a fault", default=8.0)
+    parser.add_argument("-k", type=int, dest="kills",
+                        help="The number of nodes killed per seed", default=3)
+    parser.add_argument("-d", type=float, dest="kill_duration",
+                        help="The duration between two kills, 5 fault durations by default", default=None)
+    parser.add_argument("-w", type=float, dest="warmup",
+                        help="The duration before the first kill, 5 fault durations by default", default=None)
+    parser.add_argument("-s", type=int, dest="seeds",
+                        help="The number of seeds, each one is a separate cluster", default=3)
+    parser.add_argument("-l", type=float, dest="loss",
+                        help="The probability of a message to be dropped", default=0.0)
+    parser.add_argument("-e", type=int, dest="anti_entropy_rounds",
+                        help="Send the full membership table every this many gossip rounds (0 to disable)",
+                        default=10)
+    parser.add_argument("-P", type=float, dest="phi_threshold",
+                        help="Phi-accrual threshold of the failure detector (0 for the fault duration)", default=0)
+    parser.add_argument("-S", action="store_true", dest="swim",
+                        help="Detect faults by SWIM probing instead of heartbeat gossip")
+    parser.add_argument("-c", type=str, dest="csv_output",
+                        help="Also write the summaries to this csv file")
+    parser.add_argument("-o", type=str, dest="output",
+                        help="Also write every kill and the summaries to this json file")
+    args = parser.parse_args()
+    if args.phi_threshold < 0:
+        parser.error(f"-P must be a positive phi-accrual threshold, or 0 to disable it, got {args.phi_threshold}")
+
+    # the nodes log every message, keep the output to the results
+    logging.basicConfig(level=logging.WARNING)
+
+    header = ["nodes", "neighbors", "kills", "missed", "false_pos", "fp/node/min", "detect_p50", "detect_p99",
+              "detect_max", "rounds_p50", "rounds_max", "msgs/node/s", "bytes/node/s", "wall_s"]
+    print(" ".join(f"{column:>12}" for column in header))
+
+    results = []
+    for number_of_nodes in args.nodes:
+        for neighbors in args.neighbors:
+            if neighbors >= number_of_nodes or args.kills >= number_of_nodes - 1:
+                continue
+            wall_started_at = time.perf_counter()
+            runs = [measure_convergence(number_of_nodes, args.heartbeat, neighbors, args.fault_duration, args.kills,
+                                        seed, args.warmup, args.kill_duration, args.swim, args.phi_threshold or None,
+                                        args.anti_entropy_rounds, loss=args.loss)
+                    for seed in range(args.seeds)]
+            summary = summarize(runs)
+            summary["wall_seconds"] = time.perf_counter() - wall_started_at
+            row = [number_of_nodes, neighbors, summary["kills"], summary["missed"], summary["false_positives"],
+                   summary["false_positives_per_node_minute"],
+                   summary["detection_time_p50"], summary["detection_time_p99"], summary["detection_time_max"],
+                   summary["rounds_to_all_p50"], summary["rounds_to_all_max"],
+                   summary["messages_per_node_per_second"], summary["bytes_per_node_per_second"],
+                   summary["wall_seconds"]]
+            print(" ".join(f"{format_value(value):>12}" for value in row))
+            results.append({"nodes": number_of_nodes, "neighbors": neighbors, "heartbeat_duration": args.heartbeat,
+                            "fault_duration": args.fault_duration, "swim": args.swim, "loss": args.loss,
+                            "summary": summary, "runs": runs})
+
+    if args.csv_output:
+        with open(args.csv_output, "w", newline="") as f:
+            columns = ["nodes", "neighbors", "heartbeat_duration", "fault_duration", "swim", "loss"]
+            writer = csv.DictWriter(f, fieldnames=columns + list(results[0]["summary"]) if results else columns)
+            writer.writeheader()
+            for result in results:
+                writer.writerow(dict({column: result[column] for column in columns}, **result["summary"]))
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
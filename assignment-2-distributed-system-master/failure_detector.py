@@ -0,0 +1,250 @@
+import math
+
+import numpy as np
+
+
+class FailureDetector:
+    """
+    Hashed timer wheel over the fault deadline of every member.
+
+    Every member sits in exactly one slot, the one of its deadline. A heartbeat only
+    records the new counter and timestamp; the member is moved lazily when its slot
+    comes up, so each member is looked at about once per fault_duration.
+
+    Members are node ids and their counters and timestamps NumPy columns indexed by
+    node id, so the heartbeats of a whole gossip message are recorded at once.
+    """
+
+    def __init__(self, fault_duration: float, tick_duration: float, now: float):
+        self.fault_duration = fault_duration
+        self.tick_duration = tick_duration
+        self.slots = [set() for _ in range(int(math.ceil(fault_duration / tick_duration)) + 2)]
+        self.started_at = now
+        self.current_tick = 0
+
+        self.last_heartbeat = np.zeros(0, dtype=np.int64)
+        self.last_seen = np.zeros(0, dtype=np.float64)
+        self.scheduled = np.zeros(0, dtype=bool)
+
+    def _grow(self, size):
+        # room for node ids below size
+        grown = size - len(self.last_seen)
+        self.last_heartbeat = np.append(self.last_heartbeat, np.full(grown, -1, dtype=np.int64))
+        self.last_seen = np.append(self.last_seen, np.zeros(grown))
+        self.scheduled = np.append(self.scheduled, np.zeros(grown, dtype=bool))
+
+    def _tick_of(self, timestamp):
+        return int((timestamp - self.started_at) / self.tick_duration)
+
+    def deadlines(self, members):
+        """
+        Time at which members become a fault unless their heartbeat advances
+        :param members: array of node ids
+        :return: array of times
+        """
+        return self.last_seen[members] + self.fault_duration
+
+    def _schedule(self, members, deadlines=None):
+        if not len(members):
+            return
+        if deadlines is None:
+            deadlines = self.deadlines(members)
+        deadline_ticks = ((deadlines - self.started_at) / self.tick_duration).astype(np.int64)
+        slot_indexes = np.maximum(deadline_ticks, self.current_tick + 1) % len(self.slots)
+        for member, slot_index in zip(members.tolist(), slot_indexes.tolist()):
+            self.slots[slot_index].add(member)
+        self.scheduled[members] = True
+
+    def watch(self, members, heartbeat, now):
+        """
+        Start watching members
+        :param members: array of node ids
+        :param heartbeat: their current heartbeat counter
+        :param now: current time
+        """
+        members = np.asarray(members, dtype=np.int64)
+        if len(members) and members.max() >= len(self.last_seen):
+            self._grow(int(members.max()) + 1)
+        self.last_heartbeat[members] = heartbeat
+        self.last_seen[members] = now
+        self._schedule(members[~self.scheduled[members]])
+
+    def heartbeats(self, members, heartbeats, now):
+        """
+        Record the heartbeat counters seen for watched members, node ids must be unique
+        :param members: array of node ids
+        :param heartbeats: array of their heartbeat counters
+        :param now: current time
+        :return: array of the members whose counter advanced
+        """
+        advanced = heartbeats > self.last_heartbeat[members]
+        members = members[advanced]
+        self._arrived(members, now)
+        self.last_heartbeat[members] = heartbeats[advanced]
+        self.last_seen[members] = now
+        # a member that was declared faulty is watched again once it comes back
+        self._schedule(members[~self.scheduled[members]])
+        return members
+
+    def heartbeat(self, member, heartbeat, now):
+        """
+        Record a heartbeat counter seen for a watched member
+        :param member: node id
+        :param heartbeat: heartbeat counter
+        :param now: current time
+        :return: True if the counter advanced
+        """
+        return len(self.heartbeats(np.array([member]), np.array([heartbeat]), now)) > 0
+
+    def _arrived(self, members, now):
+        # called when the heartbeat of members advances, before last_seen moves to now
+        pass
+
+    def suspicion(self, member, now):
+        """
+        :param member: node id
+        :param now: current time
+        :return: how far the member is from being a fault, 1.0 at fault_duration without a heartbeat
+        """
+        return float(now - self.last_seen[member]) / self.fault_duration
+
+    def tick(self, now):
+        """
+        Advance the wheel up to now
+        :param now: current time
+        :return: list of members whose heartbeat did not advance within fault_duration
+        """
+        faulty = []
+        target_tick = self._tick_of(now)
+        while self.current_tick < target_tick:
+            self.current_tick += 1
+            slot = self.slots[self.current_tick % len(self.slots)]
+            if not slot:
+                continue
+            members = np.fromiter(slot, dtype=np.int64, count=len(slot))
+            slot.clear()
+            self.scheduled[members] = False
+            deadlines = self.deadlines(members)
+            is_faulty = now >= deadlines
+            faulty.extend(members[is_faulty].tolist())
+            self._schedule(members[~is_faulty], deadlines[~is_faulty])
+        return faulty
+
+
+class PhiAccrualDetector(FailureDetector):
+    """
+    Phi-accrual failure detector on the same timer wheel.
+
+    Instead of a fixed fault_duration, every member gets a suspicion level phi from the
+    distribution of its recent heartbeat inter-arrival times: phi is -log10 of the probability
+    that a heartbeat still arrives this late, approximated by a normal distribution like
+    Akka does. A member is a fault once phi reaches the threshold, so the deadline follows
+    how regular its heartbeats actually reach this node. As phi only grows with time, the
+    deadline is known in advance and the member sits in the slot of that deadline.
+
+    The last inter-arrival times of every member are a ring buffer of window_size slots in one
+    flat column, with running sums per member so the mean and deviation are read without walking it.
+    """
+
+    def __init__(self, fault_duration: float, tick_duration: float, now: float, threshold: float = 8.0,
+                 window_size: int = 64, min_std_deviation: float = None):
+        """
+        :param fault_duration: sizes the wheel; until the first intervals come in, a member is judged as if
+                               they averaged half of fault_duration, give or take half of that
+        :param threshold: phi at which a member becomes a fault, 8 puts up with one false fault in 1e8,
+                          must be positive
+        :param window_size: number of inter-arrival times kept per member
+        :param min_std_deviation: floor of the deviation, so very regular heartbeats do not make phi
+                                  jump on the first late one, the tick duration by default
+        """
+        if not threshold > 0:
+            # phi is never negative, a member would be a fault as soon as it is watched
+            raise ValueError(f"The phi-accrual threshold must be positive, got {threshold}")
+        super().__init__(fault_duration, tick_duration, now)
+        self.threshold = threshold
+        self.window_size = window_size
+        self.min_std_deviation = min_std_deviation if min_std_deviation is not None else tick_duration
+        self.intervals = np.zeros(0, dtype=np.float64)
+        self.window_index = np.zeros(0, dtype=np.int64)
+        self.window_count = np.zeros(0, dtype=np.int64)
+        self.window_total = np.zeros(0, dtype=np.float64)
+        self.window_total_of_squares = np.zeros(0, dtype=np.float64)
+        # phi only depends on how many deviations past the mean a member is, solve that once for the threshold
+        self.threshold_deviations = self._deviations_for(threshold)
+
+    def _grow(self, size):
+        grown = size - len(self.last_seen)
+        super()._grow(size)
+        self.intervals = np.append(self.intervals, np.zeros(grown * self.window_size))
+        self.window_index = np.append(self.window_index, np.zeros(grown, dtype=np.int64))
+        self.window_count = np.append(self.window_count, np.zeros(grown, dtype=np.int64))
+        self.window_total = np.append(self.window_total, np.zeros(grown))
+        self.window_total_of_squares = np.append(self.window_total_of_squares, np.zeros(grown))
+
+    @staticmethod
+    def _phi_of(deviations):
+        # logistic approximation of the normal tail, phi = -log10(1 - cdf)
+        exponent = deviations * (1.5976 + 0.070566 * deviations * deviations)
+        if exponent > 700:
+            return exponent / math.log(10)
+        return math.log10(1.0 + math.exp(exponent))
+
+    @staticmethod
+    def _deviations_for(phi):
+        # invert _phi_of with Newton's method, its exponent is an increasing cubic of the deviations
+        # log(10 ** phi - 1), without overflowing for a large phi
+        target = phi * math.log(10) + math.log1p(-10.0 ** -phi)
+        deviations = target / 1.5976
+        for _ in range(50):
+            value = deviations * (1.5976 + 0.070566 * deviations * deviations) - target
+            deviations -= value / (1.5976 + 3 * 0.070566 * deviations * deviations)
+            if abs(value) < 1e-9:
+                break
+        return deviations
+
+    def _distribution(self, members):
+        # mean and deviation of the inter-arrival times of members, the first estimate for those without any
+        count = self.window_count[members]
+        has_intervals = count > 0
+        count = np.maximum(count, 1)
+        mean = np.where(has_intervals, self.window_total[members] / count, self.fault_duration / 2)
+        # the running sums may drift a hair below zero
+        variance = np.maximum(self.window_total_of_squares[members] / count - mean * mean, 0.0)
+        std_deviation = np.where(has_intervals, np.sqrt(variance), mean / 2)
+        return mean, np.maximum(std_deviation, self.min_std_deviation)
+
+    def deadlines(self, members):
+        mean, std_deviation = self._distribution(members)
+        return self.last_seen[members] + mean + self.threshold_deviations * std_deviation
+
+    def _add_intervals(self, members, intervals):
+        # one more interval in the window of every member, the oldest one goes once a window is full
+        index = self.window_index[members]
+        slots = members * self.window_size + index
+        # slots are filled in order, until a window is full the next one is still 0
+        oldest = self.intervals[slots]
+        self.window_total[members] += intervals - oldest
+        self.window_total_of_squares[members] += intervals * intervals - oldest * oldest
+        self.window_count[members] = np.minimum(self.window_count[members] + 1, self.window_size)
+        self.intervals[slots] = intervals
+        self.window_index[members] = (index + 1) % self.window_size
+
+    def _arrived(self, members, now):
+        # the gap of a member that was a fault is its downtime, not an inter-arrival time
+        members = members[self.scheduled[members]]
+        new = members[self.window_count[members] == 0]
+        if len(new):
+            # seeded with the first estimate, so a few early samples cannot make the deviation tiny
+            mean, std_deviation = self._distribution(new)
+            self._add_intervals(new, mean - std_deviation)
+            self._add_intervals(new, mean + std_deviation)
+        self._add_intervals(members, now - self.last_seen[members])
+
+    def suspicion(self, member, now):
+        """
+        :param member: node id
+        :param now: current time
+        :return: phi of the member, it becomes a fault at the threshold
+        """
+        mean, std_deviation = self._distribution(np.array([member]))
+        return self._phi_of(float((now - self.last_seen[member] - mean[0]) / std_deviation[0]))
@@ -0,0 +1,172 @@
+import struct
+
+import numpy as np
+
+# Wire format of a gossip message (network byte order):
+#   header: version (uint8), sender node id (uint32), table version of the sender (uint32), number of entries (uint16)
+#   entry:  node id (uint32), heartbeat counter (uint32), alive flag (uint8)
+# version 1 had no table version, 2 is the probe format
+VERSION = 3
+HEADER = struct.Struct("!BIIH")
+ENTRY = struct.Struct("!IIB")
+# the same entry as a NumPy record, to encode and decode whole messages at once
+ENTRY_DTYPE = np.dtype([("node_id", ">u4"), ("heartbeat", ">u4"), ("alive", "u1")])
+
+# Wire format of a SWIM probe message, its own version so either decoder rejects the other:
+#   header: version (uint8), message type (uint8), sender node id (uint32), sequence number (uint32),
+#           target node id (uint32), number of entries (uint16)
+#   entry:  node id (uint32), incarnation number (uint32), state (uint8)
+PROBE_VERSION = 2
+PROBE_HEADER = struct.Struct("!BBIIIH")
+PING = 1
+ACK = 2
+PING_REQ = 3
+
+# Wire format of the acknowledgement of a gossip message:
+#   version (uint8), sender node id (uint32), table version of the gossip message acknowledged (uint32)
+ACK_VERSION = 4
+ACK_HEADER = struct.Struct("!BII")
+
+# largest payload of a single UDP datagram
+MAX_DATAGRAM_SIZE = 65507
+MAX_ENTRIES = (MAX_DATAGRAM_SIZE - HEADER.size) // ENTRY.size
+
+
+def encode(sender_id, entries, table_version=0):
+    """
+    Encode membership entries into a single datagram
+    :param sender_id: node id of the sender
+    :param entries: a list of (node id, heartbeat, alive) tuples
+    :param table_version: version of the sender's membership table the entries were taken from
+    :return: bytes
+    """
+    if len(entries) > MAX_ENTRIES:
+        raise ValueError(f"{len(entries)} entries do not fit in one datagram (max {MAX_ENTRIES})")
+
+    buffer = bytearray(HEADER.size + ENTRY.size * len(entries))
+    HEADER.pack_into(buffer, 0, VERSION, sender_id, table_version, len(entries))
+    offset = HEADER.size
+    for node_id, heartbeat, alive in entries:
+        ENTRY.pack_into(buffer, offset, node_id, heartbeat, alive)
+        offset += ENTRY.size
+    return bytes(buffer)
+
+
+def decode_header(data):
+    """
+    Decode and validate the header of a datagram
+    :param data: received bytes
+    :return: (version, sender id, table version, number of entries)
+    """
+    if len(data) < HEADER.size:
+        raise ValueError(f"Gossip message too short: {len(data)} bytes")
+    version, sender_id, table_version, count = HEADER.unpack_from(data)
+    if version != VERSION:
+        raise ValueError(f"Unsupported gossip message version: {version}")
+    if len(data) < HEADER.size + ENTRY.size * count:
+        raise ValueError(f"Gossip message truncated: expected {count} entries")
+    return version, sender_id, table_version, count
+
+
+def iter_entries(data, count, offset=HEADER.size):
+    """
+    Iterate over the entries of a datagram without copying them into a dictionary
+    :param data: received bytes
+    :param count: number of entries, taken from the header
+    :param offset: size of the header before the entries
+    :return: iterator of (node id, heartbeat, alive flag) tuples
+    """
+    return ENTRY.iter_unpack(memoryview(data)[offset:offset + ENTRY.size * count])
+
+
+def encode_array(sender_id, entries, table_version=0):
+    """
+    Encode membership entries into a single datagram, like encode
+    :param sender_id: node id of the sender
+    :param entries: a structured array of ENTRY_DTYPE
+    :param table_version: version of the sender's membership table the entries were taken from
+    :return: bytes
+    """
+    if len(entries) > MAX_ENTRIES:
+        raise ValueError(f"{len(entries)} entries do not fit in one datagram (max {MAX_ENTRIES})")
+    return HEADER.pack(VERSION, sender_id, table_version, len(entries)) + entries.tobytes()
+
+
+def decode_array(data, count, offset=HEADER.size):
+    """
+    The entries of a datagram as a structured array of ENTRY_DTYPE, a view on the datagram
+    :param data: received bytes
+    :param count: number of entries, taken from the header
+    :param offset: size of the header before the entries
+    :return: numpy array
+    """
+    return np.frombuffer(data, dtype=ENTRY_DTYPE, count=count, offset=offset)
+
+
+def is_ack(data):
+    """
+    :param data: received bytes
+    :return: True if the datagram is the acknowledgement of a gossip message
+    """
+    return len(data) > 0 and data[0] == ACK_VERSION
+
+
+def encode_ack(sender_id, table_version):
+    """
+    Acknowledge a gossip message
+    :param sender_id: node id of the sender of the acknowledgement
+    :param table_version: table version of the gossip message received
+    :return: bytes
+    """
+    return ACK_HEADER.pack(ACK_VERSION, sender_id, table_version)
+
+
+def decode_ack(data):
+    """
+    Decode and validate the acknowledgement of a gossip message
+    :param data: received bytes
+    :return: (sender id, table version acknowledged)
+    """
+    if len(data) != ACK_HEADER.size:
+        raise ValueError(f"Gossip acknowledgement of {len(data)} bytes instead of {ACK_HEADER.size}")
+    version, sender_id, table_version = ACK_HEADER.unpack(data)
+    if version != ACK_VERSION:
+        raise ValueError(f"Unsupported gossip acknowledgement version: {version}")
+    return sender_id, table_version
+
+
+def encode_probe(message_type, sender_id, sequence, target_id, entries):
+    """
+    Encode a SWIM probe message with the membership updates piggybacked on it
+    :param message_type: PING, ACK or PING_REQ
+    :param sender_id: node id of the sender
+    :param sequence: sequence number of the probe, an ACK carries the one of the PING it answers
+    :param target_id: node id of the member probed
+    :param entries: a list of (node id, incarnation, state) tuples
+    :return: bytes
+    """
+    buffer = bytearray(PROBE_HEADER.size + ENTRY.size * len(entries))
+    PROBE_HEADER.pack_into(buffer, 0, PROBE_VERSION, message_type, sender_id, sequence, target_id, len(entries))
+    offset = PROBE_HEADER.size
+    for node_id, incarnation, state in entries:
+        ENTRY.pack_into(buffer, offset, node_id, incarnation, state)
+        offset += ENTRY.size
+    return bytes(buffer)
+
+
+def decode_probe_header(data):
+    """
+    Decode and validate the header of a SWIM probe message
+    :param data: received bytes
+    :return: (message type, sender id, sequence number, target id, number of entries)
+    """
+    if len(data) < PROBE_HEADER.size:
+        raise ValueError(f"Probe message too short: {len(data)} bytes")
+    version, message_type, sender_id, sequence, target_id, count = PROBE_HEADER.unpack_from(data)
+    if version != PROBE_VERSION:
+        raise ValueError(f"Unsupported probe message version: {version}")
+    if message_type not in (PING, ACK, PING_REQ):
+        raise ValueError(f"Unknown probe message type: {message_type}")
+    if len(data) < PROBE_HEADER.size + ENTRY.size * count:
+        raise ValueError(f"Probe message truncated: expected {count} entries")
+    return message_type, sender_id, sequence, target_id, count
@@ -0,0 +1,181 @@
+import asyncio
+import logging
+import random
+import struct
+
+import tracing
+from node import GossipNode
+from swim import SwimNode
+
+logger = logging.getLogger(__name__)
+
+# datagrams between hosts are prefixed with the id of the node they are meant for
+DESTINATION = struct.Struct("!I")
+
+
+class HostTransport:
+    """
+    Stands in for the datagram transport of one node running inside a GossipHost.
+    Nodes of a host address each other by node id, used in place of the port.
+    """
+
+    def __init__(self, host):
+        self.host = host
+
+    def sendto(self, data, addr):
+        self.host.route(data, addr[1])
+
+
+class HostProtocol(asyncio.DatagramProtocol):
+
+    def __init__(self, host):
+        self.host = host
+
+    def datagram_received(self, data, addr):
+        if len(data) < DESTINATION.size:
+            logger.error(f"Drop malformed datagram from {addr}: {len(data)} bytes")
+            return
+        node_id, = DESTINATION.unpack_from(data)
+        self.host.deliver(node_id, data[DESTINATION.size:])
+
+    def error_received(self, exc):
+        logger.error(f"Socket error: {exc}")
+
+
+class GossipHost:
+    """
+    Runs many gossip nodes on one event loop and one socket.
+
+    Messages between nodes of this host are handed over in memory. Messages for nodes on
+    another host go through the shared socket, prefixed with the destination node id.
+    """
+
+    def __init__(self, host_port, remote_hosts=None):
+        """
+        :param host_port: port of the socket shared by every node of this host
+        :param remote_hosts: a dictionary with a remote node's id as the key and the (address, port) of its host
+        as the value
+        """
+        self.host_port = host_port
+        self.remote_hosts = remote_hosts or {}
+        self.nodes = {}
+        self.tasks = {}
+        self.transport = None
+        self.loop = None
+
+    def add_node(self, node):
+        node.transport = HostTransport(self)
+        self.nodes[node.node_id] = node
+        self.tasks[node.node_id] = self.loop.create_task(self.heartbeat_loop(node))
+
+    def kill_node(self, node_id):
+        node = self.nodes.pop(node_id, None)
+        task = self.tasks.pop(node_id, None)
+        if task is not None:
+            task.cancel()
+        if node is not None:
+            # what a traced node saw until it died
+            tracing.dump(node, self.trace_path(node_id))
+        return node
+
+    def toggle_tracing(self, node_id):
+        # start tracing a node of this host, or stop and dump its trace
+        node = self.nodes.get(node_id)
+        if node is None:
+            logger.error(f"Cannot trace node-{node_id}, it does not run on this host")
+            return False
+        tracing.toggle(node, self.trace_path(node_id), self.loop.time)
+        return True
+
+    @staticmethod
+    def trace_path(node_id):
+        return f"logs/node{node_id}.trace"
+
+    def route(self, data, node_id):
+        if node_id in self.nodes:
+            self.loop.call_soon(self.deliver, node_id, data)
+        elif node_id in self.remote_hosts:
+            self.transport.sendto(DESTINATION.pack(node_id) + data, self.remote_hosts[node_id])
+
+    def deliver(self, node_id, data):
+        node = self.nodes.get(node_id)
+        if node is not None:
+            node.listening_procedure(data, self.loop.time())
+
+    async def heartbeat_loop(self, node):
+        # start at a random phase so the nodes do not all gossip at the same instant
+        await asyncio.sleep(random.uniform(0, node.heartbeat_duration))
+        await node.heartbeat_loop()
+
+    async def failure_detection_loop(self, tick_duration):
+        # one loop walks every node's failure detector instead of one task per node
+        while True:
+            await asyncio.sleep(tick_duration)
+            now = self.loop.time()
+            for node in list(self.nodes.values()):
+                node.failure_detection_procedure(now)
+
+    async def start(self, tick_duration):
+        self.loop = asyncio.get_running_loop()
+        logger.info("Initiating host socket...")
+        self.transport, _ = await self.loop.create_datagram_endpoint(lambda: HostProtocol(self),
+                                                                     local_addr=("127.0.0.1", self.host_port))
+        return self.loop.create_task(self.failure_detection_loop(tick_duration))
+
+
+def parse_remote_hosts(specs):
+    """
+    Parse the other hosts of the cluster
+    :param specs: strings like "5-8@127.0.0.1:7001", the ids of the nodes a host runs and its address and port
+    :return: a dictionary with a remote node's id as the key and the (address, port) of its host as the value
+    """
+    remote_hosts = {}
+    for spec in specs:
+        try:
+            ids, address = spec.split("@")
+            first_id, _, last_id = ids.partition("-")
+            host_address, port = address.rsplit(":", 1)
+            node_ids = range(int(first_id), int(last_id or first_id) + 1)
+            addr = (host_address, int(port))
+        except ValueError:
+            raise ValueError(f"expected <first id>-<last id>@<address>:<port>, got {spec}")
+        for node_id in node_ids:
+            remote_hosts[node_id] = addr
+    return remote_hosts
+
+
+async def run(heartbeat_duration, num_of_neighbors_to_choose, fault_duration, host_port,
+              number_of_nodes, kill_duration, anti_entropy_rounds=10, swim=False,
+              phi_threshold=0, traced_ids=(), remote_hosts=None):
+    """
+    Run the nodes of this host in this process, then kill one of them every kill_duration seconds like
+    main.py does, the nodes of traced_ids are traced from the start and dump their trace when killed
+    :param remote_hosts: a dictionary with the id of a node run by another host as the key and the (address, port)
+    of that host as the value, every other node of 1..number_of_nodes runs on this host
+    """
+    remote_hosts = remote_hosts or {}
+    host = GossipHost(host_port, remote_hosts)
+    # SwimNode also needs a tick fine enough for its ping timeout
+    detection_task = await host.start(min(heartbeat_duration, fault_duration) / 10 if swim else fault_duration / 10)
+
+    # node ids double as addresses inside the host
+    node_ports = {node_id: node_id for node_id in range(1, number_of_nodes + 1)}
+    local_ids = [node_id for node_id in node_ports if node_id not in remote_hosts]
+    for node_id in local_ids:
+        if swim:
+            host.add_node(SwimNode(node_id, heartbeat_duration, num_of_neighbors_to_choose, fault_duration,
+                                   node_ports))
+        else:
+            host.add_node(GossipNode(node_id, heartbeat_duration, num_of_neighbors_to_choose, fault_duration,
+                                     node_ports, anti_entropy_rounds, host.loop.time(), phi_threshold=phi_threshold))
+    for node_id in traced_ids:
+        host.toggle_tracing(node_id)
+    logger.info(f"Running {len(local_ids)} of {number_of_nodes} nodes in this host...")
+
+    for node_id in reversed(local_ids):
+        await asyncio.sleep(kill_duration)
+        host.kill_node(node_id)
+        logger.info(f"Kill node-{node_id}")
+
+    detection_task.cancel()
+    host.transport.close()
@@ -1,10 +1,15 @@
 import logging
 import multiprocessing
+import os
 import random
+import signal
 import sys
+import asyncio
 import time
 from argparse import ArgumentParser
+import host
 import node
+import swim
 
 # RUN IN PYTHON 3.8.8
 
@@ -49,7 +54,45 @@ def main():
     parser.add_argument("-d", type=str, dest="kill_duration",
                         help="The particular duration for a node "
                              "to become a fault", default=3)
+    parser.add_argument("-e", type=str, dest="anti_entropy_rounds",
+                        help="Send the full membership table every this many gossip rounds, other rounds "
+                             "only what changed since the neighbor's last ack (0 to disable)", default=10)
+    parser.add_argument("-S", action="store_true", dest="swim",
+                        help="Detect faults by SWIM probing instead of heartbeat gossip, -m is then the number "
+                             "of members asked to ping a node that did not ack, -b the protocol period "
+                             "and -f how long a node stays suspected")
+    parser.add_argument("-P", type=str, dest="phi_threshold",
+                        help="Declare a node a fault once the phi-accrual suspicion of its heartbeats reaches "
+                             "this threshold, e.g. 8, instead of after the fault duration (0 to disable)", default=0)
+    parser.add_argument("-T", type=int, nargs="*", dest="traced",
+                        help="Ids of the nodes to trace in place of logging, their trace is written to "
+                             "logs/node<id>.trace before they are killed. Without -H, sending SIGUSR1 to "
+                             "a node process starts or stops its trace at runtime and SIGUSR2 writes it",
+                        default=[])
+    parser.add_argument("-H", action="store_true", dest="host_mode",
+                        help="Run every node in this process on one event loop and one socket, "
+                             "instead of one process and one port per node")
+    parser.add_argument("-R", type=str, nargs="*", dest="remote_hosts",
+                        help="With -H, the other hosts of the cluster as <first id>-<last id>@<address>:<port>, "
+                             "e.g. 5-8@127.0.0.1:7001. This host runs every other node and listens on -p",
+                        default=[])
+    parser.add_argument("-l", type=str, dest="log_level",
+                        help="Log level of the nodes in host mode", default="WARNING")
     args = parser.parse_args()
+    if float(args.phi_threshold) < 0:
+        parser.error(f"-P must be a positive phi-accrual threshold, or 0 to disable it, got {args.phi_threshold}")
+    unknown_ids = [node_id for node_id in args.traced if not 1 <= node_id <= int(args.node)]
+    if unknown_ids:
+        parser.error(f"-T takes ids of nodes between 1 and {args.node}, got {unknown_ids}")
+    try:
+        remote_hosts = host.parse_remote_hosts(args.remote_hosts)
+    except ValueError as e:
+        parser.error(f"-R {e}")
+    if remote_hosts and not args.host_mode:
+        parser.error("-R only applies to -H")
+    unknown_ids = [node_id for node_id in remote_hosts if not 1 <= node_id <= int(args.node)]
+    if unknown_ids:
+        parser.error(f"-R takes ids of nodes between 1 and {args.node}, got {unknown_ids}")
 
     sys.excepthook = handle_exception
 
@@ -64,15 +107,36 @@ def main():
     logger.debug(f"number_of_nodes: {number_of_nodes}")
     logger.debug(f"heartbeat: {float(args.heartbeat)}")
     logger.debug(f"fault_duration: {args.fault_duration}")
+
+    if args.host_mode:
+        logger.info(f"Start running {number_of_nodes} nodes in a single host, logging to logs/host.txt...")
+        node.reload_logging_windows("logs/host.txt")
+        logging.getLogger().setLevel(args.log_level.upper())
+        # the other hosts need to know the port of this one
+        host_port = int(args.port) if remote_hosts else starting_port
+        asyncio.run(host.run(float(args.heartbeat), int(args.neighbors), float(args.fault_duration),
+                             host_port, number_of_nodes, int(args.kill_duration),
+                             int(args.anti_entropy_rounds), args.swim,
+                             float(args.phi_threshold), args.traced, remote_hosts))
+        return
+
     list_of_node = []
     logger.info("Start running multiple nodes...")
     for node_id in range(number_of_nodes):
         reload_logging_config_node(f"node{node_id+1}.txt")
-        process = NodeProcess(target=node.main, args=(
-            float(args.heartbeat), int(args.neighbors),
-            float(args.fault_duration), starting_port+node_id,
-            node_id+1, port_used
-        ))
+        if args.swim:
+            process = NodeProcess(target=swim.main, args=(
+                float(args.heartbeat), int(args.neighbors),
+                float(args.fault_duration), starting_port+node_id,
+                node_id+1, port_used, node_id+1 in args.traced
+            ))
+        else:
+            process = NodeProcess(target=node.main, args=(
+                float(args.heartbeat), int(args.neighbors),
+                float(args.fault_duration), starting_port+node_id,
+                node_id+1, port_used, int(args.anti_entropy_rounds),
+                float(args.phi_threshold), node_id+1 in args.traced
+            ))
         process.start()
         list_of_node.append(process)
     logger.info("Done running multiple nodes...")
@@ -85,6 +149,10 @@ def main():
     for node_id in range(number_of_nodes):
         time.sleep(int(kill_duration))
         process = list_of_node.pop()
+        if len(list_of_node) + 1 in args.traced and hasattr(signal, "SIGUSR2"):
+            # let the node write its trace first
+            os.kill(process.pid, signal.SIGUSR2)
+            time.sleep(0.5)
         process.kill()
         logger.debug(f"Kill process with ID: {process.name}")
     logger.info("Done stopping all the nodes...")
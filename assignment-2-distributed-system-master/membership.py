@@ -0,0 +1,99 @@
+import numpy as np
+
+import gossip_codec
+
+
+class MembershipTable:
+    """
+    Membership table of a gossip node, indexed by node id.
+
+    The heartbeat counter, alive flag and last update time of node i sit at row i of three
+    parallel NumPy columns, so a gossip message is max-merged with a handful of column
+    operations over all of its entries instead of one dictionary update per entry.
+    Row 0 is unused, node ids start at 1.
+    """
+
+    def __init__(self, node_ids, now):
+        """
+        :param node_ids: id of every member, this node included
+        :param now: current time
+        """
+        self.ids = np.array(sorted(node_ids), dtype=np.int64)
+        size = int(self.ids[-1]) + 1
+        self.heartbeat = np.zeros(size, dtype=np.int64)
+        self.alive = np.zeros(size, dtype=bool)
+        self.alive[self.ids] = True
+        self.updated_at = np.full(size, now, dtype=np.float64)
+        self.is_member = np.zeros(size, dtype=bool)
+        self.is_member[self.ids] = True
+        # the table version counts the changes of the table, changed_at keeps the one of the last change of a row
+        self.table_version = 0
+        self.changed_at = np.zeros(size, dtype=np.int64)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def increase_heartbeat(self, node_id, now):
+        """
+        :param node_id: id of the member, this node
+        :param now: current time
+        :return: its new heartbeat counter
+        """
+        self.heartbeat[node_id] += 1
+        self.updated_at[node_id] = now
+        self.table_version += 1
+        self.changed_at[node_id] = self.table_version
+        return int(self.heartbeat[node_id])
+
+    def merge(self, entries, now):
+        """
+        Keep every entry whose heartbeat is higher than the one known, with the alive flag it comes with.
+        Node ids are unique within a message, entries about nodes that are not members are dropped
+        :param entries: structured array of gossip_codec.ENTRY_DTYPE
+        :param now: current time
+        :return: (ids, heartbeats) of the members that advanced, and the ids of those that were
+                 a fault and are alive again
+        """
+        ids = entries["node_id"].astype(np.int64)
+        heartbeats = entries["heartbeat"].astype(np.int64)
+        alive = entries["alive"] != 0
+
+        known = ids < len(self.is_member)
+        if not known.all():
+            ids, heartbeats, alive = ids[known], heartbeats[known], alive[known]
+        advanced = self.is_member[ids] & (heartbeats > self.heartbeat[ids])
+        ids, heartbeats, alive = ids[advanced], heartbeats[advanced], alive[advanced]
+
+        revived = ids[alive & ~self.alive[ids]]
+        self.heartbeat[ids] = heartbeats
+        self.alive[ids] = alive
+        self.updated_at[ids] = now
+        if len(ids):
+            self.table_version += 1
+            self.changed_at[ids] = self.table_version
+        return ids, heartbeats, revived
+
+    def changed_since(self, table_version):
+        """
+        :param table_version: a version of this table
+        :return: ids of the members whose row changed after it
+        """
+        return self.ids[self.changed_at[self.ids] > table_version]
+
+    def entries(self, ids):
+        """
+        :param ids: ids of members
+        :return: their rows as a structured array of gossip_codec.ENTRY_DTYPE, ready to be sent
+        """
+        entries = np.empty(len(ids), dtype=gossip_codec.ENTRY_DTYPE)
+        entries["node_id"] = ids
+        entries["heartbeat"] = self.heartbeat[ids]
+        entries["alive"] = self.alive[ids]
+        return entries
+
+    def status_dictionary(self):
+        """
+        :return: the table as {"node-<id>": [heartbeat, alive]}, the former format, for logs and tools
+        """
+        return {f"node-{node_id}": [heartbeat, alive] for node_id, heartbeat, alive in
+                zip(self.ids.tolist(), self.heartbeat[self.ids].tolist(), self.alive[self.ids].tolist())}
@@ -1,101 +1,236 @@
+import asyncio
 import logging
 import random
-import sys
-import threading
 import time
-import traceback
-from argparse import ArgumentParser
-import socket
-from ast import literal_eval
 from pprint import pformat
-import copy
-
-# import node_socket taken from assignment 1
-from node_socket import UdpSocket
-
-def sending_procedure(heartbeat_duration, node_id, neighbors_port, node_ports):
-    """
-    TODO: complete the sending_procedure
-    :param heartbeat_duration: heartbeat duration
-    :param node_id: node id
-    :param neighbors_port: a list of neighbors port
-    :param node_ports: a dictionary with the node's port as the key and its id as the value
-    :global status_dictionary: status dictionary
-    :global logger: use this to print the answer
-    """
-
-    # Heartbeat procedure
-    while True:
-        time.sleep(heartbeat_duration)
-        status_dictionary[f"node-{node_id}"][0] += 1
-        logger.info(f"Increase heartbeat node-{node_id}:\n{pformat(status_dictionary)}")
-
-        # Gossip procedure
+
+import gossip_codec
+import tracing
+from failure_detector import FailureDetector, PhiAccrualDetector
+from membership import MembershipTable
+
+logger = logging.getLogger(__name__)
+
+
+class GossipProtocol(asyncio.DatagramProtocol):
+
+    def __init__(self, node):
+        self.node = node
+
+    def connection_made(self, transport):
+        self.node.transport = transport
+
+    def datagram_received(self, data, addr):
+        self.node.listening_procedure(data, asyncio.get_running_loop().time())
+
+    def error_received(self, exc):
+        logger.error(f"Socket error: {exc}")
+
+
+class GossipNode:
+
+    def __init__(self, node_id, heartbeat_duration, num_of_neighbors_to_choose, fault_duration,
+                 node_ports, anti_entropy_rounds=10, now=None, rng=None, phi_threshold=None):
+        """
+        A gossip node, owning its membership table
+        :param node_id: node id
+        :param heartbeat_duration: heartbeat duration
+        :param num_of_neighbors_to_choose: number of neighbors to gossip with every heartbeat
+        :param fault_duration: duration to assume that a node is a fault
+        :param node_ports: a dictionary with every node's port as the key and its id as the value
+        :param anti_entropy_rounds: send the full membership table every this many rounds, 0 to never do it
+        :param now: current time, defaults to the monotonic clock used by the event loop
+        :param rng: random generator choosing the neighbors, a seeded one makes runs reproducible
+        :param phi_threshold: declare a fault once the phi-accrual suspicion of a member reaches this,
+                              None to declare it after fault_duration without a heartbeat
+        """
+        now = time.monotonic() if now is None else now
+        self.node_id = node_id
+        self.heartbeat_duration = heartbeat_duration
+        self.neighbors_to_choose = num_of_neighbors_to_choose
+        self.fault_duration = fault_duration
+        self.anti_entropy_rounds = anti_entropy_rounds
+        self.node_ports = node_ports
+        self.random = rng if rng is not None else random
+        self.neighbors_port = [port for port, other_id in node_ports.items() if other_id != node_id]
+        self.ports_by_id = {other_id: port for port, other_id in node_ports.items()}
+        self.transport = None
+
+        self.members = MembershipTable(node_ports.values(), now)
+        self.tick_duration = fault_duration / 10
+        if phi_threshold:
+            self.failure_detector = PhiAccrualDetector(fault_duration, self.tick_duration, now, phi_threshold)
+        else:
+            self.failure_detector = FailureDetector(fault_duration, self.tick_duration, now)
+        self.failure_detector.watch(self.members.ids, 0, now)
+
+        # highest version of the membership table each neighbor port acknowledged a gossip message of
+        self.acked_versions = {}
+        self.gossip_round = 0
+        # called with (member key, now) whenever this node declares a member a fault
+        self.fault_listener = None
+        # a tracing.Tracer while the node is traced
+        self.tracer = None
+
+    @property
+    def status_dictionary(self):
+        """
+        :return: a copy of the membership table as {"node-<id>": [heartbeat, alive]}
+        """
+        return self.members.status_dictionary()
+
+    def increase_heartbeat(self, now):
+        """
+        Heartbeat procedure
+        :param now: current time
+        """
+        heartbeat = self.members.increase_heartbeat(self.node_id, now)
+        self.failure_detector.heartbeat(self.node_id, heartbeat, now)
+        if self.tracer is not None:
+            self.tracer.record(tracing.TIMER, self.node_id, tracing.HEARTBEAT, heartbeat)
+        # pformat of the whole table is costly, skip it when nobody reads it
+        if logger.isEnabledFor(logging.INFO):
+            logger.info(tracing.HEARTBEAT_LOG.format(peer=self.node_id, value=heartbeat))
+            logger.info(f"status_dictionary:\n{pformat(self.status_dictionary)}")
+
+    def sending_procedure(self):
+        """
+        Gossip procedure, send randomly chosen neighbors the entries that changed since the table version
+        they last acknowledged
+        """
+        # log lines are only built when someone reads them
+        is_logging = logger.isEnabledFor(logging.INFO)
 
         # Choose random neighbors
         logger.info("Determining which node to send...")
-        random_neighbors = random.sample(neighbors_port, neighbors_to_choose)
+        random_neighbors = self.random.sample(self.neighbors_port, self.neighbors_to_choose)
 
-        # Get node id from port
-        random_neighbors_id = []
-        for neighbor in random_neighbors:
-            random_neighbors_id.append(f"node-{node_ports[neighbor]}")
+        if is_logging:
+            # Get node id from port
+            random_neighbors_id = []
+            for neighbor in random_neighbors:
+                random_neighbors_id.append(f"node-{self.node_ports[neighbor]}")
 
-        # Send message to random neighbors
-        logger.info(f"Send messages to {' and '.join(random_neighbors_id)}")
-        
+            # Send message to random neighbors
+            logger.info(f"Send messages to {' and '.join(random_neighbors_id)}")
+
+        # heartbeats advance every round, so a neighbor picked again a few rounds later still misses most rows
+        self.gossip_round += 1
+        is_anti_entropy = self.anti_entropy_rounds > 0 and self.gossip_round % self.anti_entropy_rounds == 0
         for neighbor in random_neighbors:
-            UdpSocket.send(f"node-{node_id}~{status_dictionary}", neighbor)
-
-
-def listening_procedure(port, node_id, fault_duration):
-    """
-    TODO: complete the listening/receiving procedure
-    :param port: the port of the node
-    :param node_id: node id
-    :param fault_duration: duration to assume that a node is a fault
-    :global status_dictionary: status dictionary
-    :global logger: use this to print the answer
-    """
-
-    # Initialize socket
-    logger.info("Initiating socket...")
-    udp_socket = UdpSocket(port)
-
-    # Listen to all incoming messages
-    while True:
-
-        # Receive message
-        message = udp_socket.listen()
-        sender, content = message[0].split("~")
-        content_dict = literal_eval(content)
-
-        logger.info(f"Receive message from {sender}...")
-        logger.info(f"Incoming message:\n{pformat(content_dict)}")
-
-        # Update status dictionary
-        for key, value in content_dict.items():
-            if value[0] > status_dictionary[key][0]:
-                status_dictionary[key] = value
-
-        # initialize dead thread checker, one for each node
-        thread = threading.Thread(target=check_dead_single_node, args=(fault_duration, sender))
-        thread.name = f"dead_thread_{sender}"
-        logger.info(f"Thread {thread.name} started")
-        thread.start()
-
-def check_dead_single_node(fault_duration, node_id):
-    # every single nodes have its own dead checker
-
-    initial_status = status_dictionary[node_id][0]
-    time.sleep(fault_duration)
-    if initial_status == status_dictionary[node_id][0]:
-        status_dictionary[node_id][1] = False
-        logger.info(f"This node become a fault: {node_id}")
-        logger.info(f"Node fault status_dictionary:\n{pformat(status_dictionary)}")
-
-def thread_exception_handler(args):
-    logger.error(f"Uncaught exception", exc_info=(args.exc_type, args.exc_value, args.exc_traceback))
+            ids = self.members.ids if is_anti_entropy else \
+                self.members.changed_since(self.acked_versions.get(neighbor, 0))
+            entries = self.members.entries(ids)
+            if is_logging:
+                logger.info(tracing.GOSSIP_SEND_LOG.format(value=len(entries), peer=self.node_ports[neighbor],
+                                                           anti_entropy=" (anti-entropy)" if is_anti_entropy else ""))
+            if self.tracer is not None:
+                self.tracer.record(tracing.SEND, self.node_ports[neighbor],
+                                   tracing.ANTI_ENTROPY if is_anti_entropy else tracing.GOSSIP, len(entries))
+            self.transport.sendto(gossip_codec.encode_array(self.node_id, entries, self.members.table_version),
+                                  ("127.0.0.1", neighbor))
+
+    def listening_procedure(self, data, now):
+        """
+        Merge an incoming gossip message into the membership table and acknowledge it
+        :param data: received datagram
+        :param now: current time
+        """
+        try:
+            if gossip_codec.is_ack(data):
+                self.on_ack(*gossip_codec.decode_ack(data))
+                return
+            _, sender_id, table_version, count = gossip_codec.decode_header(data)
+        except ValueError:
+            logger.exception("Drop malformed message")
+            return
+
+        if logger.isEnabledFor(logging.INFO):
+            logger.info(tracing.GOSSIP_RECEIVE_LOG.format(peer=sender_id))
+            logger.info(tracing.GOSSIP_INCOMING_LOG.format(value=count))
+        if self.tracer is not None:
+            self.tracer.record(tracing.RECV, sender_id, tracing.GOSSIP, count)
+
+        # max-merge every entry of the datagram at once
+        ids, heartbeats, revived = self.members.merge(gossip_codec.decode_array(data, count), now)
+        if len(ids):
+            self.failure_detector.heartbeats(ids, heartbeats, now)
+        if len(revived) and (self.tracer is not None or logger.isEnabledFor(logging.INFO)):
+            for member_id in revived.tolist():
+                heartbeat = int(self.members.heartbeat[member_id])
+                if self.tracer is not None:
+                    self.tracer.record(tracing.STATE, member_id, tracing.REVIVED, heartbeat)
+                logger.info(tracing.REVIVED_LOG.format(peer=member_id, value=heartbeat))
+
+        # from now on the sender only sends what changed after the table version it sent
+        if sender_id in self.ports_by_id:
+            self.transport.sendto(gossip_codec.encode_ack(self.node_id, table_version),
+                                  ("127.0.0.1", self.ports_by_id[sender_id]))
+
+    def on_ack(self, sender_id, table_version):
+        """
+        A neighbor has every row of the membership table as of table_version
+        :param sender_id: id of the neighbor
+        :param table_version: table version of the gossip message it acknowledged
+        """
+        port = self.ports_by_id.get(sender_id)
+        if port is not None and table_version > self.acked_versions.get(port, 0):
+            self.acked_versions[port] = table_version
+
+    def failure_detection_procedure(self, now):
+        """
+        Mark every member whose heartbeat did not advance within fault_duration as a fault
+        :param now: current time
+        """
+        for member_id in self.failure_detector.tick(now):
+            self.members.alive[member_id] = False
+            member = f"node-{member_id}"
+            if self.fault_listener is not None:
+                self.fault_listener(member, now)
+            if self.tracer is not None:
+                self.tracer.record(tracing.STATE, member_id, tracing.FAULTY, int(self.members.heartbeat[member_id]))
+            logger.info(tracing.FAULT_LOG.format(peer=member_id))
+            if logger.isEnabledFor(logging.INFO):
+                logger.info(f"Node fault status_dictionary:\n{pformat(self.status_dictionary)}")
+
+    def suspicion_levels(self, now):
+        """
+        :param now: current time
+        :return: suspicion of every member, phi with a phi threshold, else the fraction of fault_duration
+                 since its heartbeat last advanced
+        """
+        return {f"node-{member_id}": self.failure_detector.suspicion(member_id, now)
+                for member_id in self.members.ids.tolist()}
+
+    async def heartbeat_loop(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            await asyncio.sleep(self.heartbeat_duration)
+            self.increase_heartbeat(loop.time())
+            self.sending_procedure()
+
+    async def failure_detection_loop(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            await asyncio.sleep(self.tick_duration)
+            self.failure_detection_procedure(loop.time())
+
+    async def run(self, port):
+        """
+        Listen on the port and run heartbeat, gossip and fault detection on the running event loop
+        :param port: the port of the node
+        """
+        loop = asyncio.get_running_loop()
+        logger.info("Initiating socket...")
+        transport, _ = await loop.create_datagram_endpoint(lambda: GossipProtocol(self),
+                                                           local_addr=("127.0.0.1", port))
+        tracing.add_signal_handlers(loop, self, f"logs/node{self.node_id}.trace")
+        try:
+            logger.info("Executing the heartbeat and failure detection loops...")
+            await asyncio.gather(self.heartbeat_loop(), self.failure_detection_loop())
+        finally:
+            transport.close()
+
 
 def reload_logging_windows(filename):
     log = logging.getLogger()
@@ -108,14 +243,14 @@ def reload_logging_windows(filename):
                         level=logging.INFO)
 
 def main(heartbeat_duration=1, num_of_neighbors_to_choose=1,
-         fault_duration=1, port=1000, node_id=1, neighbors_ports=(1000,)):
+         fault_duration=1, port=1000, node_id=1, neighbors_ports=(1000,),
+         anti_entropy_rounds=10, phi_threshold=0, trace=False):
     reload_logging_windows(f"logs/node{node_id}.txt")
     global logger
     logger = logging.getLogger(__name__)
-
-    # make num_of_neighbors_to_choose a global variable
-    global neighbors_to_choose
-    neighbors_to_choose = num_of_neighbors_to_choose
+    if trace:
+        # the trace takes over from the log, which keeps warnings only
+        logging.getLogger().setLevel(logging.WARNING)
 
     try:
         logger.info(f"Node with id {node_id} is running...")
@@ -124,38 +259,20 @@ def main(heartbeat_duration=1, num_of_neighbors_to_choose=1,
         logger.debug(f"port: {port}")
         logger.debug(f"num_of_neighbors_to_choose: {num_of_neighbors_to_choose}")
         logger.debug(f"neighbors_ports: {neighbors_ports}")
+        logger.debug(f"anti_entropy_rounds: {anti_entropy_rounds}")
+        logger.debug(f"phi_threshold: {phi_threshold}")
+        logger.debug(f"trace: {trace}")
 
-        
-
-        logger.info("Configure the status_dictionary global variable...")
-        global status_dictionary
-        status_dictionary = {}
-        node_ports = {}
-        for i in range(len(neighbors_ports)):
-            status_dictionary[f"node-{i + 1}"] = [0, True]
-            node_ports[neighbors_ports[i]] = i+1
-
-            # initialize dead thread checker, one for each node
-            thread = threading.Thread(target=check_dead_single_node, args=(fault_duration, f"node-{i + 1}"))
-            thread.name = f"dead_thread_{i+1}"
-            thread.start()
-            logger.info(f"Thread {thread.name} started")
-
-        neighbors_ports.remove(port)
-        logger.info(f"status_dictionary:\n{pformat(status_dictionary)}")
+        logger.info("Configure the node and its status_dictionary...")
+        node_ports = {neighbor_port: i + 1 for i, neighbor_port in enumerate(neighbors_ports)}
+        node = GossipNode(node_id, heartbeat_duration, num_of_neighbors_to_choose, fault_duration,
+                          node_ports, anti_entropy_rounds, phi_threshold=phi_threshold)
+        if trace:
+            node.tracer = tracing.Tracer(node_id)
+        logger.info(f"status_dictionary:\n{pformat(node.status_dictionary)}")
         logger.info("Done configuring the status_dictionary...")
 
-        logger.info("Executing the listening procedure...")
-        threading.excepthook = thread_exception_handler
-        thread = threading.Thread(target=listening_procedure, args=(port, node_id, fault_duration))
-        thread.name = "listening_thread"
-        thread.start()
-        logger.info("Executing the sending procedure...")
-        thread = threading.Thread(target=sending_procedure,
-                         args=(heartbeat_duration,
-                               node_id, neighbors_ports, node_ports))
-        thread.name = "sending_thread"
-        thread.start()
+        asyncio.run(node.run(port))
 
     except Exception as e:
         logger.exception("Caught Error")
@@ -164,4 +281,4 @@ def main(heartbeat_duration=1, num_of_neighbors_to_choose=1,
 
 
 if __name__ == '__main__':
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,208 @@
+import heapq
+import itertools
+import random
+
+import tracing
+from node import GossipNode
+from swim import SwimNode
+
+
+# Simulator taken from assignment 1
+class SimTimer:
+
+    def __init__(self):
+        self.is_cancelled = False
+
+    def cancel(self):
+        self.is_cancelled = True
+
+
+class Simulator:
+    """
+    Discrete-event simulator with virtual time.
+
+    Every timer and every message delivery is an event ordered by virtual time, and every
+    random choice (latency, loss, reordering) comes from one seeded generator, so a run only
+    depends on its seed and finishes as fast as its events can be processed.
+    """
+
+    def __init__(self, seed=0, latency=(0.001, 0.005), loss=0.0, reorder=0.0, reorder_delay=0.01):
+        """
+        :param seed: seed of every random choice of the network
+        :param latency: (lower bound, upper bound) of the delay of a message, in seconds
+        :param loss: probability of a message to be dropped
+        :param reorder: probability of a message to get an extra delay of up to reorder_delay
+        :param reorder_delay: largest extra delay of a reordered message, in seconds
+        """
+        self.now = 0.0
+        self.random = random.Random(seed)
+        self.latency = latency
+        self.loss = loss
+        self.reorder = reorder
+        self.reorder_delay = reorder_delay
+
+        self.events = []
+        self.sequence = itertools.count()
+        self.handlers = {}
+        self.groups = None
+
+        self.sent = 0
+        self.delivered = 0
+        self.dropped = 0
+
+    def time(self):
+        return self.now
+
+    def call_later(self, delay, callback, *args):
+        timer = SimTimer()
+        heapq.heappush(self.events, (self.now + delay, next(self.sequence), timer, callback, args))
+        return timer
+
+    def register(self, port, handler):
+        # handler is called with the payload of every message delivered to the port
+        self.handlers[port] = handler
+
+    def unregister(self, port):
+        # a crashed node, messages to it are dropped
+        self.handlers.pop(port, None)
+
+    def partition(self, *groups):
+        # only ports within the same group can reach each other, ports in no group form one more group
+        self.groups = {port: index for index, group in enumerate(groups) for port in group}
+
+    def heal(self):
+        self.groups = None
+
+    def is_reachable(self, source, destination):
+        if self.groups is None:
+            return True
+        return self.groups.get(source, -1) == self.groups.get(destination, -1)
+
+    def send(self, source, destination, payload):
+        self.sent += 1
+        if not self.is_reachable(source, destination) or self.random.random() < self.loss:
+            self.dropped += 1
+            return
+        delay = self.random.uniform(*self.latency)
+        if self.reorder and self.random.random() < self.reorder:
+            delay += self.random.uniform(0, self.reorder_delay)
+        self.call_later(delay, self.deliver, destination, payload)
+
+    def deliver(self, destination, payload):
+        handler = self.handlers.get(destination)
+        if handler is None:
+            self.dropped += 1
+            return
+        self.delivered += 1
+        handler(payload)
+
+    def run(self, until=None, stop=None):
+        """
+        Process events in virtual time order
+        :param until: virtual time to stop at, None to run until no event is left
+        :param stop: called after every event, the run stops as soon as it returns True
+        :return: virtual time at the end of the run
+        """
+        while self.events:
+            when, _, timer, callback, args = self.events[0]
+            if until is not None and when > until:
+                break
+            heapq.heappop(self.events)
+            if timer.is_cancelled:
+                continue
+            self.now = when
+            callback(*args)
+            if stop is not None and stop():
+                return self.now
+        if until is not None:
+            self.now = max(self.now, until)
+        return self.now
+
+
+class SimTransport:
+    """
+    Drop-in replacement of the node's datagram transport sending through a Simulator
+    """
+
+    def __init__(self, simulator: Simulator, node_id: int):
+        self.simulator = simulator
+        self.node_id = node_id
+        self.messages_sent = 0
+        self.bytes_sent = 0
+
+    def sendto(self, data, addr):
+        self.messages_sent += 1
+        self.bytes_sent += len(data)
+        self.simulator.send(self.node_id, addr[1], data)
+
+
+class GossipSimulation:
+    """
+    Gossip nodes on a simulated network, node ids double as addresses
+    """
+
+    def __init__(self, number_of_nodes, heartbeat_duration, num_of_neighbors_to_choose, fault_duration,
+                 anti_entropy_rounds=10, seed=0, swim=False, phi_threshold=None,
+                 **network):
+        """
+        :param number_of_nodes: number of nodes
+        :param heartbeat_duration: heartbeat duration
+        :param num_of_neighbors_to_choose: number of neighbors to gossip with every heartbeat
+        :param fault_duration: duration to assume that a node is a fault
+        :param anti_entropy_rounds: send the full status dictionary every this many rounds
+        :param seed: seed of the network and of every node
+        :param swim: run SwimNode instead, num_of_neighbors_to_choose is then its number of indirect probes
+        :param phi_threshold: phi-accrual threshold of the GossipNode failure detector, None for fault_duration
+        :param network: latency, loss, reorder and reorder_delay of the Simulator
+        """
+        self.simulator = Simulator(seed, **network)
+        self.nodes = {}
+        self.timers = {}
+        # number of gossip rounds, protocol periods with swim, every node ran so far
+        self.rounds = {}
+
+        node_ports = {node_id: node_id for node_id in range(1, number_of_nodes + 1)}
+        for node_id in node_ports:
+            rng = random.Random(f"{seed}-{node_id}")
+            if swim:
+                node = SwimNode(node_id, heartbeat_duration, num_of_neighbors_to_choose, fault_duration, node_ports,
+                                rng=rng)
+            else:
+                node = GossipNode(node_id, heartbeat_duration, num_of_neighbors_to_choose, fault_duration,
+                                  node_ports, anti_entropy_rounds, now=0.0, rng=rng,
+                                  phi_threshold=phi_threshold)
+            node.transport = SimTransport(self.simulator, node_id)
+            self.nodes[node_id] = node
+            self.rounds[node_id] = 0
+            self.simulator.register(node_id, lambda data, node=node: node.listening_procedure(data,
+                                                                                              self.simulator.now))
+            # start at a random phase so the nodes do not all gossip at the same instant
+            phase = self.simulator.random.uniform(0, heartbeat_duration)
+            self.timers[node_id] = self.simulator.call_later(phase, self.heartbeat, node)
+        self.tick_duration = node.tick_duration
+        self.simulator.call_later(self.tick_duration, self.failure_detection)
+
+    def heartbeat(self, node):
+        node.increase_heartbeat(self.simulator.now)
+        node.sending_procedure()
+        self.rounds[node.node_id] += 1
+        self.timers[node.node_id] = self.simulator.call_later(node.heartbeat_duration, self.heartbeat, node)
+
+    def failure_detection(self):
+        for node in self.nodes.values():
+            node.failure_detection_procedure(self.simulator.now)
+        self.simulator.call_later(self.tick_duration, self.failure_detection)
+
+    def trace(self, node_id, capacity=65536):
+        # trace a node, with virtual timestamps
+        self.nodes[node_id].tracer = tracing.Tracer(node_id, capacity, self.simulator.time)
+        return self.nodes[node_id].tracer
+
+    def kill(self, node_id):
+        # the node stops sending and receiving, like killing its process
+        self.nodes.pop(node_id)
+        self.timers.pop(node_id).cancel()
+        self.simulator.unregister(node_id)
+
+    def run(self, until):
+        return self.simulator.run(until=until)
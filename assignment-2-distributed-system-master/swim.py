@@ -0,0 +1,336 @@
+import asyncio
+import heapq
+import logging
+import math
+import random
+from pprint import pformat
+
+import gossip_codec
+import tracing
+from node import GossipProtocol, reload_logging_windows
+
+logger = logging.getLogger(__name__)
+
+# states of a member, with the same incarnation number a later state overrides an earlier one
+ALIVE = 0
+SUSPECT = 1
+FAULTY = 2
+STATE_NAMES = ("alive", "suspect", "faulty")
+
+# updates piggybacked on one probe message, so its size does not grow with the cluster
+MAX_PIGGYBACK = 6
+
+
+def supersedes(incarnation, state, current_incarnation, current_state):
+    """
+    Precedence of two updates about the same member: the higher incarnation number wins,
+    then faulty over suspect over alive
+    :return: True if (incarnation, state) overrides (current_incarnation, current_state)
+    """
+    return (incarnation, state) > (current_incarnation, current_state)
+
+
+class SwimNode:
+    """
+    A node detecting failures by probing instead of by heartbeat counters, after SWIM.
+
+    Every protocol period (heartbeat_duration) the node pings one member. Without an ack
+    within a third of the period, it asks num_of_indirect_probes other members to ping it
+    on its behalf. A member that acknowledged neither way by the end of the period is
+    suspected, and declared faulty if it does not refute the suspicion within fault_duration.
+    A member refutes by raising its incarnation number. Membership updates only travel
+    piggybacked on pings and acks, so every node sends a constant number of messages of a
+    constant size per period, whatever the size of the cluster.
+    """
+
+    def __init__(self, node_id, heartbeat_duration, num_of_indirect_probes, fault_duration, node_ports, rng=None):
+        """
+        :param node_id: node id
+        :param heartbeat_duration: duration of a protocol period, one member is probed every period
+        :param num_of_indirect_probes: number of members asked to ping a member that did not ack in time
+        :param fault_duration: duration a member stays suspected before it is declared a fault
+        :param node_ports: a dictionary with every node's port as the key and its id as the value
+        :param rng: random generator ordering the probes, a seeded one makes runs reproducible
+        """
+        self.node_id = node_id
+        self.heartbeat_duration = heartbeat_duration
+        self.indirect_probes = num_of_indirect_probes
+        self.fault_duration = fault_duration
+        self.node_ports = node_ports
+        self.ports = {other_id: port for port, other_id in node_ports.items()}
+        self.random = rng if rng is not None else random
+        self.transport = None
+
+        self.ping_timeout = heartbeat_duration / 3
+        # fine enough for the ping timeout as well as for the suspicion timeout
+        self.tick_duration = min(heartbeat_duration, fault_duration) / 10
+
+        # [incarnation, state] of every member, status_dictionary keeps [incarnation, alive] like GossipNode
+        self.members = {}
+        self.status_dictionary = {}
+        for other_id in sorted(node_ports.values()):
+            self.members[other_id] = [0, ALIVE]
+            self.status_dictionary[f"node-{other_id}"] = [0, True]
+        self.suspected_at = {}
+
+        # member id to the number of messages its latest update is still piggybacked on
+        self.updates = {}
+        self.retransmit_limit = 3 * math.ceil(math.log2(len(node_ports) + 1))
+
+        self.probe_order = []
+        self.period_started_at = 0.0
+        self.probe_target = None
+        self.probe_sequence = 0
+        self.probe_deadline = 0.0
+        self.is_probe_acked = False
+        self.is_indirect_probe_sent = False
+        self.sequence = 0
+        # sequence of a ping sent on behalf of another member to (requester id, its sequence, expiry time)
+        self.relays = {}
+        # called with (member key, now) whenever this node declares a member a fault
+        self.fault_listener = None
+        # a tracing.Tracer while the node is traced
+        self.tracer = None
+
+    def increase_heartbeat(self, now):
+        """
+        Start a new protocol period, the member probed in the previous one is suspected
+        unless it acknowledged, directly or through another member
+        :param now: current time
+        """
+        if self.tracer is not None:
+            self.tracer.record(tracing.TIMER, self.node_id, tracing.PROTOCOL_PERIOD, self.members[self.node_id][0])
+        logger.info(tracing.PROTOCOL_PERIOD_LOG.format(value=self.members[self.node_id][0]))
+        if self.probe_target is not None and not self.is_probe_acked:
+            logger.info(f"No ack from node-{self.probe_target} within the protocol period")
+            self.suspect(self.probe_target, now)
+        self.probe_target = None
+        self.period_started_at = now
+
+    def sending_procedure(self):
+        """
+        Ping the next member of a shuffled round-robin over the members not known to be faulty,
+        so every member is probed within two rounds over the list
+        """
+        target = self.next_target()
+        if target is None:
+            return
+        self.sequence += 1
+        self.probe_target = target
+        self.probe_sequence = self.sequence
+        self.probe_deadline = self.period_started_at + self.ping_timeout
+        self.is_probe_acked = False
+        self.is_indirect_probe_sent = False
+        logger.info(f"Ping node-{target}")
+        self.send(gossip_codec.PING, target, self.probe_sequence, target)
+
+    def next_target(self):
+        while True:
+            if not self.probe_order:
+                self.probe_order = [other_id for other_id, (_, state) in self.members.items()
+                                    if other_id != self.node_id and state != FAULTY]
+                if not self.probe_order:
+                    return None
+                self.random.shuffle(self.probe_order)
+            target = self.probe_order.pop()
+            # a member may have been declared a fault since the list was shuffled
+            if self.members[target][1] != FAULTY:
+                return target
+
+    def send(self, message_type, destination, sequence, target):
+        entries = self.piggyback(destination)
+        if self.tracer is not None:
+            self.tracer.record(tracing.SEND, destination, message_type, len(entries))
+        if logger.isEnabledFor(logging.INFO):
+            logger.info(tracing.PROBE_SEND_LOG.format(message=tracing.MESSAGE_NAMES[message_type], value=len(entries),
+                                                      peer=destination))
+        self.transport.sendto(gossip_codec.encode_probe(message_type, self.node_id, sequence, target, entries),
+                              ("127.0.0.1", self.ports[destination]))
+
+    def piggyback(self, destination):
+        """
+        Pick the updates to piggyback on a message, the least disseminated ones first
+        :param destination: member the message is sent to, told first if it is suspected so it can refute
+        :return: a list of (node id, incarnation, state) tuples
+        """
+        chosen = heapq.nlargest(MAX_PIGGYBACK, self.updates, key=self.updates.get)
+        if self.members[destination][1] == SUSPECT and destination not in chosen:
+            chosen = [destination] + chosen[:MAX_PIGGYBACK - 1]
+
+        entries = []
+        for member_id in chosen:
+            if member_id in self.updates:
+                self.updates[member_id] -= 1
+                if self.updates[member_id] == 0:
+                    del self.updates[member_id]
+            incarnation, state = self.members[member_id]
+            entries.append((member_id, incarnation, state))
+        return entries
+
+    def listening_procedure(self, data, now):
+        """
+        Merge the updates piggybacked on an incoming probe message and answer it
+        :param data: received datagram
+        :param now: current time
+        """
+        try:
+            message_type, sender_id, sequence, target_id, count = gossip_codec.decode_probe_header(data)
+        except ValueError:
+            logger.exception("Drop malformed message")
+            return
+        if sender_id not in self.members or target_id not in self.members:
+            logger.warning(f"Drop message from unknown node-{sender_id}")
+            return
+        if self.tracer is not None:
+            self.tracer.record(tracing.RECV, sender_id, message_type, count)
+        if logger.isEnabledFor(logging.INFO):
+            logger.info(tracing.PROBE_RECEIVE_LOG.format(message=tracing.MESSAGE_NAMES[message_type], value=count,
+                                                         peer=sender_id))
+
+        for member_id, incarnation, state in gossip_codec.iter_entries(data, count, gossip_codec.PROBE_HEADER.size):
+            self.merge(member_id, incarnation, state, now)
+
+        if message_type == gossip_codec.PING:
+            self.send(gossip_codec.ACK, sender_id, sequence, self.node_id)
+        elif message_type == gossip_codec.PING_REQ:
+            logger.info(f"Ping node-{target_id} on behalf of node-{sender_id}")
+            self.sequence += 1
+            self.relays[self.sequence] = (sender_id, sequence, now + self.heartbeat_duration)
+            self.send(gossip_codec.PING, target_id, self.sequence, target_id)
+        elif sequence == self.probe_sequence and target_id == self.probe_target:
+            logger.info(f"Receive ack of node-{target_id} from node-{sender_id}")
+            self.is_probe_acked = True
+        elif sequence in self.relays:
+            requester_id, requester_sequence, _ = self.relays.pop(sequence)
+            self.send(gossip_codec.ACK, requester_id, requester_sequence, target_id)
+
+    def merge(self, member_id, incarnation, state, now):
+        if member_id == self.node_id:
+            if state != ALIVE and incarnation >= self.members[member_id][0]:
+                # refute with an incarnation number nobody has heard of yet
+                logger.info(f"Refute being {STATE_NAMES[state]} at incarnation {incarnation}")
+                self.update(member_id, incarnation + 1, ALIVE, now)
+            return
+        current = self.members.get(member_id)
+        if current is not None and supersedes(incarnation, state, *current):
+            self.update(member_id, incarnation, state, now)
+
+    def suspect(self, member_id, now):
+        incarnation, state = self.members[member_id]
+        if state == ALIVE:
+            self.update(member_id, incarnation, SUSPECT, now)
+
+    def update(self, member_id, incarnation, state, now):
+        """
+        Record a new update about a member and piggyback it on the next messages
+        :param member_id: node id of the member
+        :param incarnation: incarnation number of the update
+        :param state: ALIVE, SUSPECT or FAULTY
+        :param now: current time, the suspicion timeout starts from it
+        """
+        was_faulty = self.members[member_id][1] == FAULTY
+        if self.tracer is not None:
+            self.tracer.record(tracing.STATE, member_id, state, incarnation)
+        self.members[member_id] = [incarnation, state]
+        self.status_dictionary[f"node-{member_id}"] = [incarnation, state != FAULTY]
+        self.updates[member_id] = self.retransmit_limit
+        if state == SUSPECT:
+            self.suspected_at[member_id] = now
+        else:
+            self.suspected_at.pop(member_id, None)
+
+        if state == FAULTY:
+            logger.info(tracing.FAULT_LOG.format(peer=member_id))
+            if self.fault_listener is not None and not was_faulty:
+                self.fault_listener(f"node-{member_id}", now)
+            if logger.isEnabledFor(logging.INFO):
+                logger.info(f"Node fault status_dictionary:\n{pformat(self.status_dictionary)}")
+        else:
+            logger.info(tracing.STATE_LOG.format(peer=member_id, state=STATE_NAMES[state], value=incarnation))
+
+    def failure_detection_procedure(self, now):
+        """
+        Probe indirectly once the ping timed out, and declare a fault every member suspected for fault_duration
+        :param now: current time
+        """
+        if (self.probe_target is not None and not self.is_probe_acked and not self.is_indirect_probe_sent
+                and now >= self.probe_deadline):
+            self.is_indirect_probe_sent = True
+            helpers = [other_id for other_id, (_, state) in self.members.items()
+                       if other_id not in (self.node_id, self.probe_target) and state != FAULTY]
+            helpers = self.random.sample(helpers, min(self.indirect_probes, len(helpers)))
+            if self.tracer is not None:
+                self.tracer.record(tracing.TIMER, self.probe_target, tracing.PING_TIMEOUT,
+                                   self.members[self.node_id][0])
+            # the ping-req sent to every helper is logged next
+            logger.info(tracing.PING_TIMEOUT_LOG.format(peer=self.probe_target))
+            for helper in helpers:
+                self.send(gossip_codec.PING_REQ, helper, self.probe_sequence, self.probe_target)
+
+        for member_id, suspected_at in list(self.suspected_at.items()):
+            if now - suspected_at >= self.fault_duration:
+                self.update(member_id, self.members[member_id][0], FAULTY, now)
+
+        # the requester gave up on a relayed ping at the end of its protocol period
+        for sequence in [sequence for sequence, (_, _, expires_at) in self.relays.items() if expires_at <= now]:
+            del self.relays[sequence]
+
+    async def heartbeat_loop(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            await asyncio.sleep(self.heartbeat_duration)
+            self.increase_heartbeat(loop.time())
+            self.sending_procedure()
+
+    async def failure_detection_loop(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            await asyncio.sleep(self.tick_duration)
+            self.failure_detection_procedure(loop.time())
+
+    async def run(self, port):
+        """
+        Listen on the port and run the protocol periods and fault detection on the running event loop
+        :param port: the port of the node
+        """
+        loop = asyncio.get_running_loop()
+        logger.info("Initiating socket...")
+        transport, _ = await loop.create_datagram_endpoint(lambda: GossipProtocol(self),
+                                                           local_addr=("127.0.0.1", port))
+        tracing.add_signal_handlers(loop, self, f"logs/node{self.node_id}.trace")
+        try:
+            logger.info("Executing the probe and failure detection loops...")
+            await asyncio.gather(self.heartbeat_loop(), self.failure_detection_loop())
+        finally:
+            transport.close()
+
+
+def main(heartbeat_duration=1, num_of_indirect_probes=1,
+         fault_duration=1, port=1000, node_id=1, neighbors_ports=(1000,), trace=False):
+    reload_logging_windows(f"logs/node{node_id}.txt")
+    global logger
+    logger = logging.getLogger(__name__)
+    if trace:
+        # the trace takes over from the log, which keeps warnings only
+        logging.getLogger().setLevel(logging.WARNING)
+
+    try:
+        logger.info(f"SWIM node with id {node_id} is running...")
+        logger.debug(f"heartbeat_duration: {heartbeat_duration}")
+        logger.debug(f"fault_duration: {fault_duration}")
+        logger.debug(f"port: {port}")
+        logger.debug(f"num_of_indirect_probes: {num_of_indirect_probes}")
+        logger.debug(f"neighbors_ports: {neighbors_ports}")
+        logger.debug(f"trace: {trace}")
+
+        node_ports = {neighbor_port: i + 1 for i, neighbor_port in enumerate(neighbors_ports)}
+        node = SwimNode(node_id, heartbeat_duration, num_of_indirect_probes, fault_duration, node_ports)
+        if trace:
+            node.tracer = tracing.Tracer(node_id)
+        logger.info(f"status_dictionary:\n{pformat(node.status_dictionary)}")
+
+        asyncio.run(node.run(port))
+
+    except Exception as e:
+        logger.exception("Caught Error")
+        raise
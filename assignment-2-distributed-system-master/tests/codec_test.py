@@ -0,0 +1,62 @@
+import unittest
+
+import numpy as np
+
+import gossip_codec
+
+
+class CodecTest(unittest.TestCase):
+
+    def test_encode_decode_round_trip(self):
+        entries = [(1, 5, 1), (2, 0, 0), (70000, 2 ** 32 - 1, 1)]
+        data = gossip_codec.encode(7, entries, 12)
+        version, sender_id, table_version, count = gossip_codec.decode_header(data)
+        self.assertEqual((gossip_codec.VERSION, 7, 12, 3), (version, sender_id, table_version, count))
+        self.assertEqual(entries, list(gossip_codec.iter_entries(data, count)))
+
+    def test_array_encoding_matches_tuple_encoding(self):
+        entries = [(1, 5, 1), (3, 9, 0)]
+        array = np.array(entries, dtype=gossip_codec.ENTRY_DTYPE)
+        data = gossip_codec.encode_array(4, array, 2)
+        self.assertEqual(gossip_codec.encode(4, entries, 2), data)
+        decoded = gossip_codec.decode_array(data, gossip_codec.decode_header(data)[3])
+        self.assertEqual([1, 3], decoded["node_id"].tolist())
+        self.assertEqual([5, 9], decoded["heartbeat"].tolist())
+        self.assertEqual([1, 0], decoded["alive"].tolist())
+
+    def test_ack_round_trip(self):
+        data = gossip_codec.encode_ack(3, 2 ** 32 - 1)
+        self.assertTrue(gossip_codec.is_ack(data))
+        self.assertFalse(gossip_codec.is_ack(gossip_codec.encode(3, [])))
+        self.assertEqual((3, 2 ** 32 - 1), gossip_codec.decode_ack(data))
+        with self.assertRaises(ValueError):
+            gossip_codec.decode_ack(data[:-1])
+        with self.assertRaises(ValueError):
+            gossip_codec.decode_header(data)
+
+    def test_probe_round_trip(self):
+        entries = [(2, 3, 1), (5, 0, 2)]
+        data = gossip_codec.encode_probe(gossip_codec.PING_REQ, 1, 42, 5, entries)
+        message_type, sender_id, sequence, target_id, count = gossip_codec.decode_probe_header(data)
+        self.assertEqual((gossip_codec.PING_REQ, 1, 42, 5, 2), (message_type, sender_id, sequence, target_id, count))
+        self.assertEqual(entries, list(gossip_codec.iter_entries(data, count, gossip_codec.PROBE_HEADER.size)))
+
+    def test_malformed_messages_are_rejected(self):
+        data = gossip_codec.encode(1, [(1, 1, 1), (2, 1, 1)])
+        with self.assertRaises(ValueError):
+            gossip_codec.decode_header(data[:3])
+        with self.assertRaises(ValueError):
+            gossip_codec.decode_header(data[:-1])
+        # the gossip and probe formats reject each other
+        with self.assertRaises(ValueError):
+            gossip_codec.decode_probe_header(data)
+        with self.assertRaises(ValueError):
+            gossip_codec.decode_header(gossip_codec.encode_probe(gossip_codec.ACK, 1, 1, 1, []))
+
+    def test_too_many_entries(self):
+        with self.assertRaises(ValueError):
+            gossip_codec.encode(1, [(1, 1, 1)] * (gossip_codec.MAX_ENTRIES + 1))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,72 @@
+import unittest
+
+import numpy as np
+
+from failure_detector import FailureDetector, PhiAccrualDetector
+
+
+class FailureDetectorTest(unittest.TestCase):
+
+    def test_fault_after_fault_duration(self):
+        detector = FailureDetector(fault_duration=2.0, tick_duration=0.2, now=0.0)
+        detector.watch(np.array([1, 2]), 0, now=0.0)
+        for tick in range(1, 9):
+            detector.heartbeat(1, tick, now=tick * 0.2)
+            self.assertEqual([], detector.tick(tick * 0.2))
+        faulty = []
+        for tick in range(9, 13):
+            detector.heartbeat(1, tick, now=tick * 0.2)
+            faulty.extend(detector.tick(tick * 0.2))
+        self.assertEqual([2], faulty)
+
+    def test_heartbeat_must_advance(self):
+        detector = FailureDetector(fault_duration=1.0, tick_duration=0.1, now=0.0)
+        detector.watch(np.array([1]), 3, now=0.0)
+        self.assertFalse(detector.heartbeat(1, 3, now=0.5))
+        self.assertTrue(detector.heartbeat(1, 4, now=0.5))
+        self.assertEqual([], detector.tick(1.2))
+        self.assertEqual([1], detector.tick(1.6))
+
+    def test_a_fault_is_watched_again_once_it_comes_back(self):
+        detector = FailureDetector(fault_duration=1.0, tick_duration=0.1, now=0.0)
+        detector.watch(np.array([1]), 0, now=0.0)
+        self.assertEqual([1], detector.tick(1.2))
+        detector.heartbeat(1, 1, now=1.5)
+        self.assertEqual([], detector.tick(2.0))
+        self.assertEqual([1], detector.tick(2.7))
+
+    def test_deadlines_beyond_the_wheel(self):
+        # a deadline more than one turn of the wheel away waits in its slot for the next turn
+        detector = FailureDetector(fault_duration=0.5, tick_duration=0.1, now=0.0)
+        detector.watch(np.array([1]), 0, now=0.0)
+        for tick in range(1, 30):
+            detector.heartbeat(1, tick, now=tick * 0.1)
+            self.assertEqual([], detector.tick(tick * 0.1))
+
+
+class PhiAccrualDetectorTest(unittest.TestCase):
+
+    def test_regular_heartbeats_are_not_suspected(self):
+        detector = PhiAccrualDetector(fault_duration=4.0, tick_duration=0.1, now=0.0, threshold=8.0)
+        detector.watch(np.array([1]), 0, now=0.0)
+        for beat in range(1, 50):
+            detector.heartbeat(1, beat, now=beat * 1.0)
+            self.assertEqual([], detector.tick(beat * 1.0))
+        # a few missed heartbeats are enough against a regular sender
+        self.assertEqual([1], detector.tick(53.0))
+
+    def test_phi_grows_with_silence(self):
+        detector = PhiAccrualDetector(fault_duration=4.0, tick_duration=0.1, now=0.0)
+        detector.watch(np.array([1]), 0, now=0.0)
+        for beat in range(1, 20):
+            detector.heartbeat(1, beat, now=beat * 1.0)
+        self.assertLess(detector.suspicion(1, 19.5), detector.suspicion(1, 21.0))
+
+    def test_threshold_must_be_positive(self):
+        for threshold in (0, -1.0):
+            with self.assertRaises(ValueError):
+                PhiAccrualDetector(fault_duration=4.0, tick_duration=0.1, now=0.0, threshold=threshold)
+
+
+if __name__ == '__main__':
+    unittest.main()
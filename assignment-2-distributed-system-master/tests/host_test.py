@@ -0,0 +1,88 @@
+import asyncio
+import logging
+import unittest
+
+from host import DESTINATION, GossipHost, HostProtocol, parse_remote_hosts
+from node import GossipNode
+
+
+class RecordingHost:
+
+    def __init__(self):
+        self.delivered = []
+
+    def deliver(self, node_id, data):
+        self.delivered.append((node_id, data))
+
+
+class HostProtocolTest(unittest.TestCase):
+
+    def test_datagrams_are_routed_by_destination(self):
+        host = RecordingHost()
+        HostProtocol(host).datagram_received(DESTINATION.pack(7) + b"gossip", ("127.0.0.1", 1))
+        self.assertEqual([(7, b"gossip")], host.delivered)
+
+    def test_short_datagrams_are_dropped(self):
+        host = RecordingHost()
+        with self.assertLogs("host", "ERROR"):
+            HostProtocol(host).datagram_received(b"ab", ("127.0.0.1", 1))
+        self.assertEqual([], host.delivered)
+
+
+class GossipHostTest(unittest.TestCase):
+
+    def setUp(self):
+        logging.disable(logging.INFO)
+
+    def tearDown(self):
+        logging.disable(logging.NOTSET)
+
+    def test_parse_remote_hosts(self):
+        self.assertEqual({3: ("127.0.0.1", 7001), 4: ("127.0.0.1", 7001), 5: ("localhost", 7002)},
+                         parse_remote_hosts(["3-4@127.0.0.1:7001", "5@localhost:7002"]))
+        with self.assertRaises(ValueError):
+            parse_remote_hosts(["3-4:7001"])
+
+    def test_nodes_gossip_across_two_hosts(self):
+        async def run_hosts():
+            # nodes 1 and 2 on the first host, 3 and 4 on the second, on ports picked by the system
+            hosts = [GossipHost(0), GossipHost(0)]
+            tasks = [await host.start(0.1) for host in hosts]
+            ports = [host.transport.get_extra_info("sockname")[1] for host in hosts]
+            hosts[0].remote_hosts = {3: ("127.0.0.1", ports[1]), 4: ("127.0.0.1", ports[1])}
+            hosts[1].remote_hosts = {1: ("127.0.0.1", ports[0]), 2: ("127.0.0.1", ports[0])}
+            node_ports = {node_id: node_id for node_id in range(1, 5)}
+            for node_id in node_ports:
+                hosts[(node_id - 1) // 2].add_node(GossipNode(node_id, 0.1, 2, 1.0, node_ports,
+                                                              now=hosts[0].loop.time()))
+            await asyncio.sleep(1.0)
+            statuses = {node_id: dict(node.status_dictionary) for host in hosts
+                        for node_id, node in host.nodes.items()}
+            for host, task in zip(hosts, tasks):
+                for node_id in list(host.nodes):
+                    host.kill_node(node_id)
+                task.cancel()
+                host.transport.close()
+            return statuses
+
+        statuses = asyncio.run(run_hosts())
+        for node_id in (1, 2):
+            self.assertGreater(statuses[node_id]["node-3"][0], 0)
+            self.assertGreater(statuses[node_id]["node-4"][0], 0)
+        for node_id in (3, 4):
+            self.assertGreater(statuses[node_id]["node-1"][0], 0)
+        self.assertTrue(all(alive for status in statuses.values() for _, alive in status.values()))
+
+    def test_tracing_a_node_of_another_host_is_reported(self):
+        async def toggle():
+            host = GossipHost(0, {3: ("127.0.0.1", 1)})
+            host.loop = asyncio.get_running_loop()
+            return host.toggle_tracing(3)
+
+        logging.disable(logging.NOTSET)
+        with self.assertLogs("host", "ERROR"):
+            self.assertFalse(asyncio.run(toggle()))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,55 @@
+import unittest
+
+import numpy as np
+
+import gossip_codec
+from membership import MembershipTable
+
+
+def entries(*rows):
+    return np.array(list(rows), dtype=gossip_codec.ENTRY_DTYPE)
+
+
+class MembershipTableTest(unittest.TestCase):
+
+    def test_merge_keeps_higher_heartbeats(self):
+        members = MembershipTable([1, 2, 3], now=0.0)
+        members.heartbeat[2] = 5
+        ids, heartbeats, revived = members.merge(entries((2, 4, 1), (3, 7, 1)), now=1.0)
+        self.assertEqual([3], ids.tolist())
+        self.assertEqual([7], heartbeats.tolist())
+        self.assertEqual(0, len(revived))
+        self.assertEqual(5, members.heartbeat[2])
+        self.assertEqual(1.0, members.updated_at[3])
+
+    def test_merge_drops_unknown_nodes(self):
+        members = MembershipTable([1, 2], now=0.0)
+        ids, _, _ = members.merge(entries((3, 1, 1), (9, 1, 1), (2, 1, 1)), now=1.0)
+        self.assertEqual([2], ids.tolist())
+
+    def test_merge_revives_a_fault(self):
+        members = MembershipTable([1, 2], now=0.0)
+        members.alive[2] = False
+        _, _, revived = members.merge(entries((2, 1, 1)), now=1.0)
+        self.assertEqual([2], revived.tolist())
+        self.assertTrue(members.alive[2])
+
+    def test_changed_since(self):
+        members = MembershipTable([1, 2, 3], now=0.0)
+        self.assertEqual([], members.changed_since(0).tolist())
+        members.increase_heartbeat(1, now=1.0)
+        table_version = members.table_version
+        members.merge(entries((2, 4, 1), (3, 0, 1)), now=1.0)
+        self.assertEqual([1, 2], members.changed_since(0).tolist())
+        self.assertEqual([2], members.changed_since(table_version).tolist())
+        self.assertEqual([], members.changed_since(members.table_version).tolist())
+
+    def test_status_dictionary(self):
+        members = MembershipTable([2, 1], now=0.0)
+        members.increase_heartbeat(2, now=1.0)
+        members.alive[1] = False
+        self.assertEqual({"node-1": [0, False], "node-2": [1, True]}, members.status_dictionary())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,60 @@
+import logging
+import random
+import unittest
+
+import gossip_codec
+from node import GossipNode
+
+
+class RecordingTransport:
+
+    def __init__(self):
+        self.sent = []
+
+    def sendto(self, data, addr):
+        self.sent.append((data, addr[1]))
+
+
+class GossipNodeTest(unittest.TestCase):
+
+    def setUp(self):
+        logging.disable(logging.INFO)
+        self.node = GossipNode(1, 1.0, 1, 4.0, {1: 1, 2: 2}, anti_entropy_rounds=0, now=0.0, rng=random.Random(0))
+        self.node.transport = RecordingTransport()
+
+    def tearDown(self):
+        logging.disable(logging.NOTSET)
+
+    def gossip(self):
+        # (node id, heartbeat) of every entry sent to node 2
+        self.node.transport.sent = []
+        self.node.sending_procedure()
+        data, port = self.node.transport.sent[0]
+        self.assertEqual(2, port)
+        count = gossip_codec.decode_header(data)[3]
+        return [(node_id, heartbeat) for node_id, heartbeat, _ in gossip_codec.iter_entries(data, count)]
+
+    def test_incoming_gossip_is_acknowledged(self):
+        self.node.listening_procedure(gossip_codec.encode(2, [(2, 3, 1)], 7), now=0.5)
+        self.assertEqual([(gossip_codec.encode_ack(1, 7), 2)], self.node.transport.sent)
+
+    def test_neighbors_get_what_changed_since_their_ack(self):
+        self.node.increase_heartbeat(now=1.0)
+        self.assertEqual([(1, 1)], self.gossip())
+        # the message may have been lost, what was not acknowledged is sent again
+        self.node.increase_heartbeat(now=2.0)
+        self.assertEqual([(1, 2)], self.gossip())
+        acked_version = self.node.members.table_version
+
+        self.node.listening_procedure(gossip_codec.encode(2, [(2, 3, 1)], 1), now=2.5)
+        self.node.listening_procedure(gossip_codec.encode_ack(2, acked_version), now=2.5)
+        self.assertEqual([(2, 3)], self.gossip())
+        # a late acknowledgement of an older message changes nothing
+        self.node.listening_procedure(gossip_codec.encode_ack(2, 1), now=2.5)
+        self.assertEqual([(2, 3)], self.gossip())
+        self.node.listening_procedure(gossip_codec.encode_ack(2, self.node.members.table_version), now=2.5)
+        self.assertEqual([], self.gossip())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,66 @@
+import unittest
+
+from simulation import GossipSimulation
+
+
+def record_faults(simulation):
+    # (observer id, member id) of every fault declared
+    faults = []
+    for node in simulation.nodes.values():
+        node.fault_listener = lambda member, now, node=node: faults.append((node.node_id, int(member.split("-")[1])))
+    return faults
+
+
+class GossipSimulationTest(unittest.TestCase):
+
+    def assert_detects_kill(self, simulation):
+        faults = record_faults(simulation)
+        simulation.run(20)
+        self.assertEqual([], faults)
+        simulation.kill(5)
+        simulation.run(40)
+        self.assertEqual({(node_id, 5) for node_id in range(1, 5)}, set(faults))
+        for node in simulation.nodes.values():
+            self.assertFalse(node.status_dictionary["node-5"][1])
+            self.assertTrue(node.status_dictionary["node-1"][1])
+
+    def test_gossip_detects_a_killed_node(self):
+        self.assert_detects_kill(GossipSimulation(5, 1.0, 2, 6.0, seed=1))
+
+    def test_phi_accrual_detects_a_killed_node(self):
+        self.assert_detects_kill(GossipSimulation(5, 1.0, 2, 6.0, seed=1, phi_threshold=8.0))
+
+    def test_swim_detects_a_killed_node(self):
+        self.assert_detects_kill(GossipSimulation(5, 1.0, 2, 3.0, seed=1, swim=True))
+
+    def test_rounds_count_the_heartbeats_of_every_node(self):
+        simulation = GossipSimulation(5, 1.0, 2, 6.0, seed=1)
+        simulation.run(10)
+        self.assertEqual({node_id: 10 for node_id in range(1, 6)}, simulation.rounds)
+
+    def test_anti_entropy_repairs_lost_messages(self):
+        simulation = GossipSimulation(5, 1.0, 2, 6.0, anti_entropy_rounds=3, seed=2, loss=0.2)
+        faults = record_faults(simulation)
+        simulation.run(40)
+        self.assertEqual([], faults)
+        heartbeats = [node.status_dictionary["node-1"][0] for node in simulation.nodes.values()]
+        self.assertLessEqual(max(heartbeats) - min(heartbeats), 4)
+
+    def test_swim_suspect_refutes_before_it_is_a_fault(self):
+        # node 5 is cut off shorter than the suspicion timeout, it refutes once it hears it is suspected
+        simulation = GossipSimulation(5, 1.0, 2, 6.0, seed=3, swim=True)
+        faults = record_faults(simulation)
+        simulation.run(10)
+        simulation.simulator.partition([1, 2, 3, 4], [5])
+        simulation.run(14)
+        self.assertTrue(any(node.members[5][1] != 0 for node_id, node in simulation.nodes.items() if node_id != 5))
+        simulation.simulator.heal()
+        simulation.run(40)
+        self.assertEqual([], faults)
+        self.assertGreater(simulation.nodes[5].members[5][0], 0)
+        for node in simulation.nodes.values():
+            self.assertEqual(0, node.members[5][1])
+
+
+if __name__ == '__main__':
+    unittest.main()
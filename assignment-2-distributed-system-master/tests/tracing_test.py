@@ -0,0 +1,73 @@
+import collections
+import logging
+import os
+import tempfile
+import unittest
+
+import tracing
+from simulation import GossipSimulation
+
+
+class RecordingHandler(logging.Handler):
+
+    def __init__(self):
+        super().__init__()
+        self.lines = []
+
+    def emit(self, record):
+        self.lines.extend(record.getMessage().split("\n"))
+
+
+class TracingTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.handler = RecordingHandler()
+        root = logging.getLogger()
+        self.previous = root.handlers, root.level
+        root.handlers = [self.handler]
+        root.setLevel(logging.INFO)
+
+    def tearDown(self):
+        root = logging.getLogger()
+        root.handlers, level = self.previous
+        root.setLevel(level)
+        self.directory.cleanup()
+
+    def test_dump_and_read_wrap_around(self):
+        tracer = tracing.Tracer(3, capacity=4, clock=lambda: 1.0)
+        for value in range(6):
+            tracer.record(tracing.TIMER, 3, tracing.HEARTBEAT, value)
+        path = os.path.join(self.directory.name, "node3.trace")
+        tracer.dump(path)
+        node_id, _, events = tracing.read(path)
+        self.assertEqual(3, node_id)
+        # the oldest events were overwritten, the rest come oldest first
+        self.assertEqual([2, 3, 4, 5], [value for _, _, _, _, value in events])
+
+    def assert_renders_the_logs(self, swim):
+        simulation = GossipSimulation(5, 1.0, 2, 3.0, anti_entropy_rounds=3, seed=1, swim=swim)
+        tracers = [simulation.trace(node_id) for node_id in simulation.nodes]
+        simulation.run(10)
+        simulation.kill(5)
+        simulation.run(25)
+
+        rendered = collections.Counter()
+        for tracer in tracers:
+            path = os.path.join(self.directory.name, f"node{tracer.node_id}.trace")
+            tracer.dump(path)
+            for _, event, peer, detail, value in tracing.read(path)[2]:
+                rendered.update(tracing.render(event, peer, detail, value).split("\n"))
+        self.assertGreater(sum(rendered.values()), 100)
+        # every rendered line is a line the nodes logged
+        self.assertEqual(collections.Counter(), rendered - collections.Counter(self.handler.lines))
+
+    def test_render_matches_gossip_logs(self):
+        self.assert_renders_the_logs(swim=False)
+
+    def test_render_matches_swim_logs(self):
+        self.assert_renders_the_logs(swim=True)
+
+
+if __name__ == '__main__':
+    unittest.main()
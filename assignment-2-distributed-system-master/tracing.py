@@ -0,0 +1,196 @@
+import logging
+import signal
+import struct
+import time
+from argparse import ArgumentParser
+
+import gossip_codec
+
+# Binary trace of one node (little endian):
+#   header: magic, version (uint8), node id (uint32), wall clock minus event clock (float64), number of events (uint64)
+#   event:  time (float64), event type (uint8), peer node id (uint32), detail (uint8), value (int64)
+MAGIC = b"GTRC"
+VERSION = 1
+FILE_HEADER = struct.Struct("<4sBIdQ")
+RECORD = struct.Struct("<dBIBq")
+
+# event types
+SEND = 1
+RECV = 2
+STATE = 3
+TIMER = 4
+
+# detail of SEND and RECV, the kind of message, the value is its number of entries
+GOSSIP = 0
+ANTI_ENTROPY = 4
+MESSAGE_NAMES = {GOSSIP: "gossip", ANTI_ENTROPY: "anti-entropy gossip", gossip_codec.PING: "ping",
+                 gossip_codec.ACK: "ack", gossip_codec.PING_REQ: "ping-req"}
+
+# detail of STATE, the new state of the peer, the value is its incarnation number,
+# or its heartbeat for a gossip member that is alive again
+ALIVE = 0
+SUSPECT = 1
+FAULTY = 2
+REVIVED = 3
+STATE_NAMES = {ALIVE: "alive", SUSPECT: "suspect", FAULTY: "faulty"}
+
+# detail of TIMER, the value is the heartbeat or incarnation number of the node
+HEARTBEAT = 0
+PING_TIMEOUT = 1
+PROTOCOL_PERIOD = 2
+
+# the log line of every event, the nodes log them and render fills them from the trace, so a
+# dumped trace reads exactly like the log it replaces. fields are named after the event fields
+HEARTBEAT_LOG = "Increase heartbeat node-{peer} to {value}"
+GOSSIP_SEND_LOG = "Send {value} entries to node-{peer}{anti_entropy}"
+GOSSIP_RECEIVE_LOG = "Receive message from node-{peer}..."
+GOSSIP_INCOMING_LOG = "Incoming message: {value} entries"
+REVIVED_LOG = "node-{peer} is alive again at heartbeat {value}"
+FAULT_LOG = "This node become a fault: node-{peer}"
+PROBE_SEND_LOG = "Send {message} with {value} entries to node-{peer}"
+PROBE_RECEIVE_LOG = "Receive {message} with {value} entries from node-{peer}"
+STATE_LOG = "node-{peer} is {state} at incarnation {value}"
+PROTOCOL_PERIOD_LOG = "Start a protocol period at incarnation {value}"
+PING_TIMEOUT_LOG = "No ack from node-{peer} in time"
+
+
+class Tracer:
+    """
+    Preallocated ring buffer of the binary events of one node.
+
+    Recording an event packs five numbers in place, nothing is formatted or allocated, so a
+    traced node pays about what one logging call that is filtered out costs. The events are
+    only turned into text offline, by the dump tool. Once the buffer is full the oldest events
+    are overwritten.
+    """
+
+    def __init__(self, node_id, capacity=65536, clock=time.monotonic):
+        """
+        :param node_id: node id
+        :param capacity: number of events kept
+        :param clock: clock of the event timestamps, the one of the node's event loop
+        """
+        self.node_id = node_id
+        self.capacity = capacity
+        self.clock = clock
+        self.buffer = bytearray(RECORD.size * capacity)
+        self.count = 0
+        # the dump prints wall clock times
+        self.clock_offset = time.time() - clock()
+
+    def record(self, event, peer=0, detail=0, value=0):
+        RECORD.pack_into(self.buffer, (self.count % self.capacity) * RECORD.size,
+                         self.clock(), event, peer, detail, value)
+        self.count += 1
+
+    def dump(self, path):
+        """
+        Write the events in the buffer to a file, oldest first
+        :param path: path of the trace file
+        """
+        with open(path, "wb") as f:
+            f.write(FILE_HEADER.pack(MAGIC, VERSION, self.node_id, self.clock_offset,
+                                     min(self.count, self.capacity)))
+            if self.count <= self.capacity:
+                f.write(self.buffer[:self.count * RECORD.size])
+            else:
+                # the oldest event is the one the next record overwrites
+                split = (self.count % self.capacity) * RECORD.size
+                f.write(self.buffer[split:])
+                f.write(self.buffer[:split])
+
+
+def toggle(node, path, clock, capacity=65536):
+    """
+    Start tracing a node, or stop and dump its trace if it is traced already
+    :param node: a GossipNode or SwimNode
+    :param path: path of the trace file
+    :param clock: clock of the node's event loop
+    """
+    if node.tracer is None:
+        node.tracer = Tracer(node.node_id, capacity, clock)
+        logging.warning(f"Tracing node-{node.node_id}")
+    else:
+        node.tracer.dump(path)
+        node.tracer = None
+        logging.warning(f"Stopped tracing node-{node.node_id}, trace written to {path}")
+
+
+def dump(node, path):
+    if node.tracer is not None:
+        node.tracer.dump(path)
+        logging.warning(f"Trace of node-{node.node_id} written to {path}")
+
+
+def add_signal_handlers(loop, node, path):
+    """
+    SIGUSR1 starts or stops tracing the node of this process, SIGUSR2 dumps its trace
+    :param loop: the running asyncio event loop
+    :param node: a GossipNode or SwimNode
+    :param path: path of the trace file
+    """
+    # there are no user signals on Windows
+    if hasattr(signal, "SIGUSR1"):
+        loop.add_signal_handler(signal.SIGUSR1, toggle, node, path, loop.time)
+        loop.add_signal_handler(signal.SIGUSR2, dump, node, path)
+
+
+def read(path):
+    """
+    :param path: path of a trace file
+    :return: (node id, clock offset, list of (time, event type, peer, detail, value) tuples)
+    """
+    with open(path, "rb") as f:
+        data = f.read()
+    magic, version, node_id, clock_offset, count = FILE_HEADER.unpack_from(data)
+    if magic != MAGIC or version != VERSION:
+        raise ValueError(f"{path} is not a gossip trace")
+    events = data[FILE_HEADER.size:FILE_HEADER.size + RECORD.size * count]
+    return node_id, clock_offset, list(RECORD.iter_unpack(events))
+
+
+def render(event, peer, detail, value):
+    """
+    :return: the log lines of an event, one per line
+    """
+    if event == SEND and detail in (GOSSIP, ANTI_ENTROPY):
+        return GOSSIP_SEND_LOG.format(peer=peer, value=value,
+                                      anti_entropy=" (anti-entropy)" if detail == ANTI_ENTROPY else "")
+    if event == SEND:
+        return PROBE_SEND_LOG.format(message=MESSAGE_NAMES.get(detail, detail), peer=peer, value=value)
+    if event == RECV and detail == GOSSIP:
+        return GOSSIP_RECEIVE_LOG.format(peer=peer) + "\n" + GOSSIP_INCOMING_LOG.format(value=value)
+    if event == RECV:
+        return PROBE_RECEIVE_LOG.format(message=MESSAGE_NAMES.get(detail, detail), peer=peer, value=value)
+    if event == STATE and detail == FAULTY:
+        return FAULT_LOG.format(peer=peer)
+    if event == STATE and detail == REVIVED:
+        return REVIVED_LOG.format(peer=peer, value=value)
+    if event == STATE:
+        return STATE_LOG.format(peer=peer, state=STATE_NAMES.get(detail, detail), value=value)
+    if detail == PING_TIMEOUT:
+        return PING_TIMEOUT_LOG.format(peer=peer)
+    if detail == PROTOCOL_PERIOD:
+        return PROTOCOL_PERIOD_LOG.format(value=value)
+    return HEARTBEAT_LOG.format(peer=peer, value=value)
+
+
+def main():
+    parser = ArgumentParser(description="Print binary traces of gossip nodes as log lines, merged by time")
+    parser.add_argument("paths", nargs="+", help="Trace files, e.g. logs/node1.trace")
+    args = parser.parse_args()
+
+    lines = []
+    for path in args.paths:
+        node_id, clock_offset, events = read(path)
+        for when, event, peer, detail, value in events:
+            lines.append((when + clock_offset, node_id, render(event, peer, detail, value)))
+    # a stable sort keeps the events of one node in the order they were recorded
+    for when, node_id, message in sorted(lines, key=lambda line: line[0]):
+        for line in message.split("\n"):
+            print(f"{time.strftime('%H:%M:%S', time.localtime(when))}.{int(when % 1 * 1000):03d} "
+                  f"node-{node_id:<4} {line}")
+
+
+if __name__ == '__main__':
+    main()
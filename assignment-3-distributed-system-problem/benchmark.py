@@ -0,0 +1,186 @@
+import json
+import logging
+import tempfile
+import time
+from argparse import ArgumentParser
+
+from host import RaftHost
+from node import NodeStates, Raft
+from simulation import RaftSimulation
+
+
+def percentile(values, fraction):
+    # nearest rank, values must be sorted
+    if not values:
+        return None
+    return values[min(len(values) - 1, max(0, int(round(fraction * len(values))) - 1))]
+
+
+def current_leader(nodes):
+    # the live leader with the highest term, None while there is none
+    leaders = [raft for raft in nodes if raft.current_role == NodeStates.LEADER]
+    return max(leaders, key=lambda raft: raft.current_term, default=None)
+
+
+def measure_simulated_failovers(number_of_nodes, heartbeat_duration, fault_duration, kills, seed,
+                                timeout=60.0, **network):
+    """
+    Kill the leader over and over on a simulated network, restarting it before the next kill
+    :param timeout: seconds to wait for a new leader before counting the failover as failed
+    :param network: latency, loss, reorder and reorder_delay of the Simulator
+    :return: list of failovers, each with the seconds without a leader, terms and messages it took
+    """
+    simulation = RaftSimulation(number_of_nodes, heartbeat_duration, fault_duration, seed=seed, **network)
+    simulator = simulation.simulator
+    simulation.run(until=timeout, stop=lambda: simulation.leader() is not None)
+
+    failovers = []
+    for _ in range(kills):
+        # let the cluster settle, the restarted node catches up meanwhile
+        simulation.run(until=simulator.now + 2 * fault_duration)
+        leader = simulation.leader()
+        if leader is None:
+            simulation.run(until=simulator.now + timeout, stop=lambda: simulation.leader() is not None)
+            leader = simulation.leader()
+            if leader is None:
+                break
+
+        term, sent, killed_at = leader.current_term, simulator.sent, simulator.now
+        simulation.kill(leader.node_id)
+        simulation.run(until=killed_at + timeout,
+                       stop=lambda: simulation.leader() is not None and simulation.leader().current_term > term)
+        new_leader = simulation.leader()
+        is_elected = new_leader is not None and new_leader.current_term > term
+        failovers.append({"failover_time": simulator.now - killed_at if is_elected else None,
+                          "terms": new_leader.current_term - term if is_elected else None,
+                          "messages": simulator.sent - sent})
+        simulation.restart(leader.node_id)
+    return failovers
+
+
+def measure_host_failovers(number_of_nodes, heartbeat_duration, fault_duration, kills, port,
+                           timeout=60.0, poll_duration=0.01):
+    """
+    Kill the leader over and over in a RaftHost, in real time, restarting it before the next kill
+    :param port: port of the host socket, node ports are only addresses within the host
+    :param timeout: seconds to wait for a new leader before counting the failover as failed
+    :param poll_duration: seconds between two checks for a new leader
+    :return: list of failovers, each with the seconds without a leader, terms and messages it took
+    """
+    persistent = tempfile.TemporaryDirectory(prefix="raft-benchmark-")
+    ports = list(range(1, number_of_nodes + 1))
+    host = RaftHost(port)
+    host.start()
+
+    def new_node(node_id, is_continue):
+        return Raft(node_id, ports[node_id - 1], ports, fault_duration, is_continue, heartbeat_duration,
+                    persistent_dir=persistent.name)
+
+    def wait_for_leader(term, deadline):
+        while time.monotonic() < deadline:
+            leader = current_leader(list(host.nodes.values()))
+            if leader is not None and leader.current_term > term:
+                return leader
+            time.sleep(poll_duration)
+        return None
+
+    for node_id in range(1, number_of_nodes + 1):
+        host.add_node(new_node(node_id, False))
+
+    failovers = []
+    for _ in range(kills):
+        time.sleep(2 * fault_duration)
+        leader = wait_for_leader(-1, time.monotonic() + timeout)
+        if leader is None:
+            break
+
+        term, sent, killed_at = leader.current_term, host.routed, time.monotonic()
+        host.kill_node(leader.port)
+        new_leader = wait_for_leader(term, killed_at + timeout)
+        failovers.append({"failover_time": time.monotonic() - killed_at if new_leader is not None else None,
+                          "terms": new_leader.current_term - term if new_leader is not None else None,
+                          "messages": host.routed - sent})
+        host.add_node(new_node(leader.node_id, True))
+
+    host.stop()
+    persistent.cleanup()
+    return failovers
+
+
+def summarize(failovers):
+    # percentiles of every metric over the failovers that elected a new leader
+    summary = {"kills": len(failovers),
+               "failed": sum(1 for failover in failovers if failover["failover_time"] is None)}
+    for metric in ("failover_time", "terms", "messages"):
+        values = sorted(failover[metric] for failover in failovers if failover["failover_time"] is not None)
+        for name, fraction in (("p50", 0.5), ("p90", 0.9), ("p99", 0.99)):
+            summary[f"{metric}_{name}"] = percentile(values, fraction)
+        summary[f"{metric}_max"] = values[-1] if values else None
+    return summary
+
+
+def format_value(value):
+    if value is None:
+        return "-"
+    return f"{value:.3f}" if isinstance(value, float) else str(value)
+
+
+def main():
+    parser = ArgumentParser(description="Measure how long a Raft cluster stays without a leader after the leader dies")
+    parser.add_argument("-n", type=int, nargs="+", dest="nodes",
+                        help="The numbers of nodes", default=[3, 5, 7])
+    parser.add_argument("-b", type=float, nargs="+", dest="heartbeats",
+                        help="The heartbeat durations", default=[1.0])
+    parser.add_argument("-f", type=float, nargs="+", dest="fault_durations",
+                        help="The lower bounds of the election timeout", default=[1.5])
+    parser.add_argument("-k", type=int, dest="kills",
+                        help="The number of times the leader is killed per seed", default=20)
+    parser.add_argument("-s", type=int, dest="seeds",
+                        help="The number of seeds, each one is a separate cluster", default=5)
+    parser.add_argument("-l", type=float, dest="loss",
+                        help="The probability of a message to be dropped, simulation only", default=0.0)
+    parser.add_argument("-p", type=int, dest="port",
+                        help="Port of the host socket, only with -H", default=7574)
+    parser.add_argument("-H", action="store_true", dest="host_mode",
+                        help="Run the nodes in a RaftHost in real time instead of the simulator")
+    parser.add_argument("-o", type=str, dest="output",
+                        help="Also write every failover and the summaries to this json file")
+    args = parser.parse_args()
+
+    # the nodes log every message, keep the output to the results
+    logging.basicConfig(level=logging.WARNING)
+
+    header = ["nodes", "heartbeat", "fault", "kills", "failed", "time_p50", "time_p90", "time_p99", "time_max",
+              "terms_p50", "terms_max", "messages_p50", "messages_max"]
+    print(" ".join(f"{column:>12}" for column in header))
+
+    results = []
+    for number_of_nodes in args.nodes:
+        for heartbeat_duration in args.heartbeats:
+            for fault_duration in args.fault_durations:
+                failovers = []
+                for seed in range(args.seeds):
+                    if args.host_mode:
+                        # hosts are not torn down, every run takes a fresh port
+                        port = args.port + len(results) * args.seeds + seed
+                        failovers += measure_host_failovers(number_of_nodes, heartbeat_duration, fault_duration,
+                                                            args.kills, port)
+                    else:
+                        failovers += measure_simulated_failovers(number_of_nodes, heartbeat_duration,
+                                                                 fault_duration, args.kills, seed, loss=args.loss)
+                summary = summarize(failovers)
+                row = [number_of_nodes, heartbeat_duration, fault_duration, summary["kills"], summary["failed"],
+                       summary["failover_time_p50"], summary["failover_time_p90"], summary["failover_time_p99"],
+                       summary["failover_time_max"], summary["terms_p50"], summary["terms_max"],
+                       summary["messages_p50"], summary["messages_max"]]
+                print(" ".join(f"{format_value(value):>12}" for value in row))
+                results.append({"nodes": number_of_nodes, "heartbeat_duration": heartbeat_duration,
+                                "fault_duration": fault_duration, "summary": summary, "failovers": failovers})
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
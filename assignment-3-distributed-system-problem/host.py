@@ -0,0 +1,126 @@
+import json
+import logging
+import threading
+
+import tracing
+from node import EventLoop, Raft, UdpSocket
+
+
+class HostSocket:
+    """
+    Stands in for the UdpSocket of one Raft node running inside a RaftHost.
+    Ports are only used as addresses, every node of the host shares the host's socket.
+    """
+
+    def __init__(self, host):
+        self.host = host
+
+    def send(self, message: dict, port: int = 0):
+        self.host.route(json.dumps(message).encode("UTF-8"), port)
+
+    def send_many(self, message: dict, ports: list):
+        # serialize once for every destination, like UdpSocket.send_many
+        message_byte = json.dumps(message).encode("UTF-8")
+        for port in ports:
+            self.host.route(message_byte, port)
+
+
+class RaftHost:
+    """
+    Runs many Raft nodes in one process.
+
+    Messages between nodes of this host are handed over in memory. Messages for nodes on
+    another host go through the host's single UDP socket, tagged with the destination port.
+    Every message and every timer of every node runs on one event loop thread.
+    """
+
+    def __init__(self, host_port: int, remote_hosts: dict = None):
+        """
+        :param host_port: port of the socket shared by every node of this host
+        :param remote_hosts: a dictionary with a remote node's port as the key and its host's port as the value
+        """
+        self.host_port = host_port
+        self.remote_hosts = remote_hosts or {}
+        self.nodes = {}
+        self.loop = EventLoop()
+        self.socket = None
+        # messages sent by the nodes of this host
+        self.routed = 0
+
+    def add_node(self, raft: Raft):
+        # the node shares the host's socket and event loop instead of having its own
+        raft.socket = HostSocket(self)
+        raft.scheduler = self.loop
+        raft.heartbeat_scheduler = self.loop
+        self.loop.call_soon(self.start_node, raft)
+
+    def start_node(self, raft: Raft):
+        self.nodes[raft.port] = raft
+        raft.setup()
+
+    def kill_node(self, port: int):
+        # safe to call from any thread, the node is stopped on the event loop
+        self.loop.call_soon(self.stop_node, port)
+
+    def stop_node(self, port: int):
+        raft = self.nodes.pop(port, None)
+        if raft is not None:
+            raft.stop()
+            # the trace of a killed node is all that is left of its last moments
+            tracing.dump(raft, self.trace_path(raft.node_id))
+
+    def toggle_tracing(self, port: int):
+        # safe to call from any thread, start tracing the node or stop and dump its trace
+        self.loop.call_soon(self.toggle_node_tracing, port)
+
+    def toggle_node_tracing(self, port: int):
+        raft = self.nodes.get(port)
+        if raft is not None:
+            tracing.toggle(raft, self.trace_path(raft.node_id))
+
+    @staticmethod
+    def trace_path(node_id: int):
+        return f"logs/node{node_id}.trace"
+
+    def route(self, message_byte: bytes, port: int):
+        self.routed += 1
+        if port in self.nodes:
+            self.loop.call_soon(self.deliver, port, message_byte)
+        elif port in self.remote_hosts:
+            envelope = str(port).encode("UTF-8") + b"~" + message_byte
+            self.socket.sc.sendto(envelope, ("127.0.0.1", self.remote_hosts[port]))
+        else:
+            logging.debug(f"Drop message for unknown or killed node on port {port}")
+
+    def deliver(self, port: int, message_byte: bytes):
+        raft = self.nodes.get(port)
+        if raft is not None:
+            raft.on_message(json.loads(message_byte.decode("UTF-8")))
+
+    def listening_procedure(self):
+        # messages from other hosts, "<destination port>~<message>"
+        while True:
+            envelope, _ = self.socket.sc.recvfrom(65535)
+            port, message_byte = envelope.split(b"~", 1)
+            self.loop.call_soon(self.deliver, int(port), message_byte)
+
+    def start(self):
+        self.socket = UdpSocket(self.host_port)
+
+        thread = threading.Thread(target=self.listening_procedure, daemon=True)
+        thread.name = "host_listening_thread"
+        thread.start()
+
+        self.loop_thread = threading.Thread(target=self.loop.run_forever, daemon=True)
+        self.loop_thread.name = "host_event_loop_thread"
+        self.loop_thread.start()
+
+    def stop(self):
+        # kill every node and wait for the event loop to be done with them
+        self.loop.call_soon(self.stop_all_nodes)
+        self.loop.stop()
+        self.loop_thread.join()
+
+    def stop_all_nodes(self):
+        for port in list(self.nodes):
+            self.stop_node(port)
@@ -0,0 +1,238 @@
+import logging
+import threading
+
+from node import MessageType, NodeStates, Raft, UdpSocket
+
+
+class KeyValueStore:
+    """
+    State machine of a replicated key-value store.
+
+    Every command is a batch of operations from one client, tagged with the client id and a
+    sequence number the client increases with every batch. The store keeps the sequence number
+    and the results of the last batch of every client (its session), so a batch that reaches the
+    log twice, because the client retried it, is only applied once.
+    """
+
+    def __init__(self):
+        self.data = {}
+        # client id to [sequence number, results] of the last batch applied
+        self.sessions = {}
+
+    def apply(self, command):
+        """
+        :param command: client_id, sequence and operations, each operation is
+                        ["put", key, value], ["get", key] or ["delete", key]
+        :return: the result of every operation, None for a batch older than the last one of its client
+        """
+        last_sequence, results = self.sessions.get(command["client_id"], (0, None))
+        if command["sequence"] <= last_sequence:
+            logging.info(f"Skip duplicate batch {command['sequence']} of client {command['client_id']}")
+            return results if command["sequence"] == last_sequence else None
+
+        results = [self.execute(operation) for operation in command["operations"]]
+        self.sessions[command["client_id"]] = [command["sequence"], results]
+        return results
+
+    def execute(self, operation):
+        # get returns the value, put and delete return the previous one, None for a missing key
+        if operation[0] == "put":
+            previous = self.data.get(operation[1])
+            self.data[operation[1]] = operation[2]
+            return previous
+        if operation[0] == "delete":
+            return self.data.pop(operation[1], None)
+        return self.data.get(operation[1])
+
+    def snapshot(self):
+        return {"data": self.data, "sessions": self.sessions}
+
+    def restore(self, snapshot):
+        # None for a node without a snapshot yet
+        if snapshot is None:
+            self.data = {}
+            self.sessions = {}
+            return
+        self.data = dict(snapshot["data"])
+        self.sessions = {client_id: list(session) for client_id, session in snapshot["sessions"].items()}
+
+
+class KeyValueServer:
+    """
+    Client endpoint of a Raft node running a KeyValueStore.
+
+    The leader appends every batch with a put or a delete to the log and answers once it is
+    applied. A batch of gets only does not go through the log, it is answered after a ReadIndex
+    round. Any other node answers with the port of the leader it knows about, so the client can
+    send the batch there instead.
+    """
+
+    def __init__(self, raft: Raft):
+        self.raft = raft
+        # (client id, sequence) of the batches in the log and not applied yet, to the port waiting for them
+        self.pending = {}
+
+    def on_message(self, msg):
+        # client requests are handled here, everything else goes to the Raft node
+        if msg["type"] == MessageType.KV_REQUEST:
+            self.on_request(msg)
+        else:
+            self.raft.on_message(msg)
+
+    def on_request(self, msg):
+        raft = self.raft
+        if raft.is_stopped:
+            return
+        if raft.current_role != NodeStates.LEADER:
+            self.reject(msg["client_id"], msg["sequence"], msg["port"])
+            return
+
+        request = (msg["client_id"], msg["sequence"])
+        last_sequence, results = raft.state_machine.sessions.get(msg["client_id"], (0, None))
+        if msg["sequence"] <= last_sequence:
+            # a retry of a batch already applied, its answer was lost
+            if msg["sequence"] == last_sequence:
+                self.reply(msg["client_id"], msg["sequence"], msg["port"], results)
+            return
+        if request in self.pending:
+            # a retry of a batch still being replicated, it is answered once, wherever the client is now
+            self.pending[request] = msg["port"]
+            return
+
+        if all(operation[0] == "get" for operation in msg["operations"]):
+            raft.read(lambda is_leader: self.on_read(msg, is_leader))
+            return
+
+        command = {"client_id": msg["client_id"], "sequence": msg["sequence"], "operations": msg["operations"]}
+        self.pending[request] = msg["port"]
+        raft.submit(command, lambda results: self.on_applied(request, results))
+
+    def on_read(self, msg, is_leader):
+        if not is_leader:
+            self.reject(msg["client_id"], msg["sequence"], msg["port"])
+            return
+        results = [self.raft.state_machine.execute(operation) for operation in msg["operations"]]
+        self.reply(msg["client_id"], msg["sequence"], msg["port"], results)
+
+    def on_applied(self, request, results):
+        port = self.pending.pop(request, None)
+        if port is None:
+            return
+        if results is None:
+            # leadership was lost before the batch committed, the client retries it at the new leader
+            self.reject(request[0], request[1], port)
+        else:
+            self.reply(request[0], request[1], port, results)
+
+    def reply(self, client_id, sequence, port, results):
+        response = {"type": MessageType.KV_RESPONSE,
+                    "client_id": client_id,
+                    "sequence": sequence,
+                    "success": True,
+                    "results": results,
+                    "leader": self.raft.port}
+        self.raft.socket.send(response, port)
+
+    def reject(self, client_id, sequence, port):
+        # point the client at the leader, None while no leader is known
+        raft = self.raft
+        leader = raft.known_ports[raft.current_leader] \
+            if raft.current_leader is not None and raft.current_leader != raft.node_id else None
+        response = {"type": MessageType.KV_RESPONSE,
+                    "client_id": client_id,
+                    "sequence": sequence,
+                    "success": False,
+                    "results": None,
+                    "leader": leader}
+        self.raft.socket.send(response, port)
+
+    def listening_procedure(self):
+        logging.info("Listen for any inputs...")
+        while True:
+            msg, sender = self.raft.socket.listen()
+            self.raft.scheduler.call_soon(self.on_message, msg)
+
+    def start(self):
+        # like Raft.start, with client requests handled by this endpoint
+        raft = self.raft
+        raft.socket = UdpSocket(raft.port)
+        raft.scheduler.call_soon(raft.setup)
+
+        thread = threading.Thread(target=self.listening_procedure, daemon=True)
+        thread.name = "listening_thread"
+        thread.start()
+
+        raft.scheduler.run_forever()
+
+
+class KeyValueClient:
+    """
+    Client of a replicated key-value store, with one batch in flight at a time.
+
+    Every batch gets the next sequence number and is retried with that same number until it is
+    answered, at the leader the last answer pointed at, or at the next server after retry_duration
+    without an answer.
+    """
+
+    def __init__(self, client_id: str, port: int, servers_ports: list, socket, scheduler, retry_duration: float = 1.0):
+        """
+        :param client_id: id of the client, unique across every client of the cluster
+        :param port: port answers are sent to
+        :param servers_ports: ports of every node of the cluster
+        :param socket: provides send(message, port)
+        :param scheduler: provides call_later(delay, callback) returning a cancellable timer
+        :param retry_duration: seconds without an answer before the batch is sent to the next server
+        """
+        self.client_id = client_id
+        self.port = port
+        self.servers_ports = servers_ports
+        self.socket = socket
+        self.scheduler = scheduler
+        self.retry_duration = retry_duration
+        self.leader_port = servers_ports[0]
+        self.sequence = 0
+        self.request = None
+        self.callback = None
+        self.retry_timer = None
+
+    def submit(self, operations: list, callback):
+        """
+        :param operations: ["put", key, value], ["get", key] or ["delete", key], applied in this order
+        :param callback: called with the result of every operation once the batch is applied
+        """
+        if self.request is not None:
+            raise RuntimeError("A batch is already in flight")
+        self.sequence += 1
+        self.request = {"type": MessageType.KV_REQUEST,
+                        "client_id": self.client_id,
+                        "sequence": self.sequence,
+                        "port": self.port,
+                        "operations": operations}
+        self.callback = callback
+        self.send_request()
+
+    def send_request(self):
+        self.socket.send(self.request, self.leader_port)
+        self.retry_timer = self.scheduler.call_later(self.retry_duration, self.on_retry_timeout)
+
+    def on_retry_timeout(self):
+        # the server may be down or cut off, try the next one
+        self.leader_port = self.servers_ports[(self.servers_ports.index(self.leader_port) + 1) %
+                                              len(self.servers_ports)]
+        self.send_request()
+
+    def on_message(self, msg):
+        if self.request is None or msg["type"] != MessageType.KV_RESPONSE or msg["sequence"] != self.sequence:
+            return
+        self.retry_timer.cancel()
+        if msg["success"]:
+            callback = self.callback
+            self.request = None
+            self.callback = None
+            callback(msg["results"])
+        elif msg["leader"] is not None:
+            self.leader_port = msg["leader"]
+            self.send_request()
+        else:
+            # no leader yet, give the election time before asking again
+            self.retry_timer = self.scheduler.call_later(self.retry_duration, self.on_retry_timeout)
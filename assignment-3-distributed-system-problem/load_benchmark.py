@@ -0,0 +1,120 @@
+import json
+import logging
+import random
+import time
+from argparse import ArgumentParser
+
+from benchmark import format_value, percentile
+from simulation import RaftSimulation
+
+
+def measure_load(number_of_nodes, number_of_clients, batch_size, duration, heartbeat_duration, fault_duration,
+                 read_ratio=0.0, number_of_keys=1000, seed=0, timeout=60.0, raft_options=None, **network):
+    """
+    Closed-loop load on a simulated key-value store: every client sends its next batch as soon as
+    the previous one is answered
+    :param batch_size: number of operations in a batch
+    :param duration: virtual seconds of load measured, after a leader was elected
+    :param read_ratio: probability of a batch to hold gets only, the others hold puts only
+    :param number_of_keys: number of distinct keys operations pick from
+    :param timeout: virtual seconds to wait for the first leader
+    :param raft_options: other arguments of every Raft node
+    :param network: latency, loss, reorder and reorder_delay of the Simulator
+    :return: throughput and latency of the batches answered within duration
+    """
+    simulation = RaftSimulation(number_of_nodes, heartbeat_duration, fault_duration, seed=seed, key_value=True,
+                                raft_options=raft_options, **network)
+    simulator = simulation.simulator
+    simulation.run(until=timeout, stop=lambda: simulation.leader() is not None)
+    started_at = simulator.now
+    rng = random.Random(seed)
+    latencies = []
+    sent = simulator.sent
+
+    def next_batch(client):
+        is_read = rng.random() < read_ratio
+        operations = [["get", f"key{rng.randrange(number_of_keys)}"] if is_read else
+                      ["put", f"key{rng.randrange(number_of_keys)}", rng.randrange(1 << 30)]
+                      for _ in range(batch_size)]
+        submitted_at = simulator.now
+        client.submit(operations, lambda results: on_results(client, submitted_at))
+
+    def on_results(client, submitted_at):
+        if simulator.now > started_at + duration:
+            return
+        latencies.append(simulator.now - submitted_at)
+        next_batch(client)
+
+    wall_started_at = time.perf_counter()
+    for index in range(number_of_clients):
+        # client ports come after the ports of the nodes
+        next_batch(simulation.add_client(f"client{index}", number_of_nodes + 1 + index,
+                                         retry_duration=fault_duration))
+    simulation.run(until=started_at + duration)
+    wall_duration = time.perf_counter() - wall_started_at
+
+    latencies.sort()
+    operations = len(latencies) * batch_size
+    return {"batches": len(latencies),
+            "ops_per_second": operations / duration,
+            "latency_p50": percentile(latencies, 0.5),
+            "latency_p90": percentile(latencies, 0.9),
+            "latency_p99": percentile(latencies, 0.99),
+            "latency_max": latencies[-1] if latencies else None,
+            "messages_per_op": (simulator.sent - sent) / operations if operations else None,
+            "wall_seconds": wall_duration}
+
+
+def main():
+    parser = ArgumentParser(description="Measure throughput and latency of the replicated key-value store "
+                                        "under a closed-loop load")
+    parser.add_argument("-n", type=int, nargs="+", dest="nodes",
+                        help="The numbers of nodes", default=[3, 5, 7])
+    parser.add_argument("-c", type=int, dest="clients",
+                        help="The number of clients, each one with a batch in flight", default=16)
+    parser.add_argument("-B", type=int, dest="batch_size",
+                        help="The number of operations in a batch", default=8)
+    parser.add_argument("-d", type=float, dest="duration",
+                        help="The virtual seconds of load", default=10.0)
+    parser.add_argument("-r", type=float, dest="read_ratio",
+                        help="The probability of a batch to hold gets only", default=0.0)
+    parser.add_argument("-k", type=int, dest="keys",
+                        help="The number of distinct keys", default=1000)
+    parser.add_argument("-b", type=float, dest="heartbeat",
+                        help="The heartbeat duration", default=0.05)
+    parser.add_argument("-f", type=float, dest="fault_duration",
+                        help="The lower bound of the election timeout", default=0.5)
+    parser.add_argument("-w", type=int, dest="pipeline_window",
+                        help="The number of batches in flight per follower", default=1)
+    parser.add_argument("-s", type=int, dest="seed",
+                        help="The seed of the simulation", default=0)
+    parser.add_argument("-l", type=float, dest="loss",
+                        help="The probability of a message to be dropped", default=0.0)
+    parser.add_argument("-o", type=str, dest="output",
+                        help="Also write the results to this json file")
+    args = parser.parse_args()
+
+    # the nodes log every message, keep the output to the results
+    logging.basicConfig(level=logging.WARNING)
+
+    header = ["nodes", "batches", "ops/s", "lat_p50", "lat_p90", "lat_p99", "lat_max", "msgs/op", "wall_s"]
+    print(" ".join(f"{column:>12}" for column in header))
+
+    results = []
+    for number_of_nodes in args.nodes:
+        result = measure_load(number_of_nodes, args.clients, args.batch_size, args.duration, args.heartbeat,
+                              args.fault_duration, args.read_ratio, args.keys, args.seed,
+                              raft_options={"pipeline_window": args.pipeline_window}, loss=args.loss)
+        row = [number_of_nodes, result["batches"], result["ops_per_second"], result["latency_p50"],
+               result["latency_p90"], result["latency_p99"], result["latency_max"], result["messages_per_op"],
+               result["wall_seconds"]]
+        print(" ".join(f"{format_value(value):>12}" for value in row))
+        results.append(dict(result, nodes=number_of_nodes))
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
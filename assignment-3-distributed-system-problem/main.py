@@ -1,10 +1,14 @@
 import logging
 import multiprocessing
+import os
 import random
+import signal
 import sys
 import time
 from argparse import ArgumentParser
+import multiraft
 import node
+from host import HostSocket, RaftHost
 
 # RUN IN PYTHON 3.8.8
 
@@ -37,7 +41,37 @@ def handle_exception(exc_type, exc_value, exc_traceback):
     logger.error(f"Uncaught exception", exc_info=(exc_type, exc_value, exc_traceback))
 
 
-def manual_event_input(args, starting_port, port_used, number_of_nodes):
+def send_config_request(host, ports, action, target_id, target_port):
+    # every node gets it, followers forward it to the leader, which ignores what is already done
+    msg = {"type": node.MessageType.CONFIG_REQUEST, "action": action,
+           "target_id": target_id, "target_port": target_port}
+    client_socket = HostSocket(host) if host is not None else node.UdpSocket()
+    client_socket.send_many(msg, ports)
+
+
+def kill_process(args, node_id):
+    process = list_nodes[node_id - 1]
+    if node_id in args.traced and hasattr(signal, "SIGUSR2"):
+        # let the node write its trace first
+        os.kill(process.pid, signal.SIGUSR2)
+        time.sleep(0.5)
+    process.kill()
+
+
+def start_multi_raft_process(args, node_id, port_used, is_continue):
+    # one process per node taking part in every group, see multiraft.py
+    process = NodeProcess(target=multiraft.main, args=(
+        float(args.heartbeat),
+        float(args.fault_duration),
+        port_used[node_id - 1],
+        node_id, port_used,
+        args.number_of_groups, is_continue, args.fsync_interval
+    ))
+    process.start()
+    return process
+
+
+def manual_event_input(args, starting_port, port_used, number_of_nodes, host=None):
     logger.info("Give input to processes...")
     time.sleep(3)
     while True:
@@ -46,11 +80,73 @@ def manual_event_input(args, starting_port, port_used, number_of_nodes):
         input_value = input("Give input here: ")
         logger.debug(f"input_value: {input_value}")
         logger.info("Process the input...")
-        if "k" in input_value:
+        if args.number_of_groups and input_value[:1] not in ("k", "r", "e"):
+            logger.warning("Multi-raft nodes only take k<node id>, r<node id> and e")
+        elif input_value.startswith("c"):
+            # "c<node id> <command>" submits a client command, followers forward it to the leader
+            node_id, command = input_value[1:].split(" ", 1)
+            msg = {"type": node.MessageType.CLIENT_REQUEST, "command": command}
+            client_socket = HostSocket(host) if host is not None else node.UdpSocket()
+            client_socket.send(msg, port_used[int(node_id) - 1])
+            logger.info(f"Submit command {command} to node {node_id}...")
+        elif input_value.startswith("a"):
+            # "a" starts one more node as a learner, the leader makes it a voter once it caught up
+            node_id = len(port_used) + 1
+            # a new list, the running nodes keep the configuration they started with
+            port_used = port_used + [starting_port + node_id - 1]
+            if host is not None:
+                host.add_node(node.Raft(node_id, port_used[-1], port_used, float(args.fault_duration), False,
+                                        float(args.heartbeat), fsync_interval=args.fsync_interval, is_learner=True))
+            else:
+                process = NodeProcess(target=node.main, args=(
+                    float(args.heartbeat),
+                    float(args.fault_duration),
+                    port_used[-1],
+                    node_id, port_used,
+                    False, args.fsync_interval, True
+                ))
+                list_nodes.append(process)
+                process.start()
+            number_of_nodes += 1
+            send_config_request(host, port_used[:-1], "add", node_id, port_used[-1])
+            logger.info(f"Add node {node_id}...")
+        elif input_value.startswith("d"):
+            # "d<node id>" removes a node from the configuration, it keeps running until killed
+            node_id = int(input_value[1:])
+            send_config_request(host, port_used, "remove", node_id, port_used[node_id - 1])
+            logger.info(f"Remove node {node_id}...")
+        elif "k" in input_value:
             logger.debug("Kill node input is working...")
             input_value = int(input_value[1:])
-            list_nodes[input_value - 1].kill()
+            if host is not None:
+                host.kill_node(port_used[input_value - 1])
+            else:
+                kill_process(args, input_value)
             logger.info(f"Kill node {input_value}...")
+        elif input_value.startswith("t"):
+            # "t<node id>" starts tracing a node, or stops and writes its trace to logs/node<id>.trace
+            node_id = int(input_value[1:])
+            if host is not None:
+                host.toggle_tracing(port_used[node_id - 1])
+            elif hasattr(signal, "SIGUSR1"):
+                os.kill(list_nodes[node_id - 1].pid, signal.SIGUSR1)
+            if node_id in args.traced:
+                args.traced.remove(node_id)
+            else:
+                args.traced.append(node_id)
+            logger.info(f"Toggle tracing of node {node_id}...")
+        elif "r" in input_value and host is not None:
+            logger.info("Restart node input is working...")
+            node_id = int(input_value[1:])
+            host.add_node(node.Raft(node_id, starting_port + node_id - 1, port_used,
+                                    float(args.fault_duration), True, float(args.heartbeat),
+                                    fsync_interval=args.fsync_interval))
+            logger.info(f"Node {node_id} has running...")
+        elif "r" in input_value and args.number_of_groups:
+            logger.info("Restart node input is working...")
+            node_id = int(input_value[1:])
+            list_nodes[node_id - 1] = start_multi_raft_process(args, node_id, port_used, True)
+            logger.info(f"Node {node_id} has running...")
         elif "r" in input_value:
             logger.info("Restart node input is working...")
             node_id = int(input_value[1:])
@@ -59,16 +155,21 @@ def manual_event_input(args, starting_port, port_used, number_of_nodes):
                 float(args.fault_duration),
                 starting_port + node_id - 1,
                 node_id, port_used,
-                True
+                True, args.fsync_interval, False, node_id in args.traced
             ))
             list_nodes[node_id - 1] = process
             process.start()
             logger.info(f"Node {node_id} has running...")
+        elif "e" in input_value and host is not None:
+            logger.info("Stop all nodes...")
+            for port in port_used:
+                host.kill_node(port)
+            logger.info("Done stopping all the nodes...")
         elif "e" in input_value:
             logger.info("Stop all nodes...")
-            for node_id in range(number_of_nodes):
+            for node_id in range(number_of_nodes, 0, -1):
+                kill_process(args, node_id)
                 process = list_nodes.pop()
-                process.kill()
                 logger.debug(f"Kill process with ID: {process.name}")
             logger.info("Done stopping all the nodes...")
 
@@ -83,7 +184,21 @@ def main():
                         help="The particular duration to assume a leader node to be a fault", default=1.5)
     parser.add_argument("-p", type=str, dest="port",
                         help="Starting port", default=6574)
+    parser.add_argument("-s", type=float, dest="fsync_interval",
+                        help="Seconds of saved state sharing one fsync, 0 to fsync every save", default=0.0)
+    parser.add_argument("-H", action="store_true", dest="host_mode",
+                        help="Run every node in this process, sharing one socket, "
+                             "instead of one process and one port per node")
+    parser.add_argument("-T", type=int, nargs="*", dest="traced",
+                        help="Ids of the nodes to trace in place of logging, their trace is written to "
+                             "logs/node<id>.trace when they are killed. Input t<id> starts or stops "
+                             "tracing a node at runtime", default=[])
+    parser.add_argument("-M", type=int, dest="number_of_groups",
+                        help="Run this many Raft groups on every node, one process per node sharing "
+                             "one socket and one write-ahead log between its groups", default=0)
     args = parser.parse_args()
+    if args.number_of_groups and (args.host_mode or args.traced):
+        parser.error("-M cannot be combined with -H or -T")
 
     sys.excepthook = handle_exception
 
@@ -98,6 +213,32 @@ def main():
     logger.debug(f"number_of_nodes: {number_of_nodes}")
     logger.debug(f"heartbeat: {float(args.heartbeat)}")
 
+    if args.host_mode:
+        # the node ports are only addresses within the host, the host binds a single port
+        logger.info("Start running multiple nodes in a single host...")
+        reload_logging_config_node("host.txt")
+        host = RaftHost(starting_port + number_of_nodes)
+        host.start()
+        for node_id in range(number_of_nodes):
+            host.add_node(node.Raft(node_id + 1, starting_port + node_id, port_used,
+                                    float(args.fault_duration), False, float(args.heartbeat),
+                                    fsync_interval=args.fsync_interval))
+            if node_id + 1 in args.traced:
+                host.toggle_tracing(starting_port + node_id)
+        logger.info("Done running multiple nodes...")
+        manual_event_input(args, starting_port, port_used, number_of_nodes, host)
+        return
+
+    if args.number_of_groups:
+        logger.info(f"Start running multiple nodes with {args.number_of_groups} groups each...")
+        for node_id in range(number_of_nodes):
+            logger.info(f"Run node {node_id+1}...")
+            reload_logging_config_node(f"node{node_id + 1}.txt")
+            list_nodes.append(start_multi_raft_process(args, node_id + 1, port_used, False))
+        logger.info("Done running multiple nodes...")
+        manual_event_input(args, starting_port, port_used, number_of_nodes)
+        return
+
     logger.info("Start running multiple nodes...")
     for node_id in range(number_of_nodes):
         logger.info(f"Run node {node_id+1}...")
@@ -106,7 +247,8 @@ def main():
             float(args.heartbeat),
             float(args.fault_duration),
             starting_port + node_id,
-            node_id + 1, port_used
+            node_id + 1, port_used,
+            False, args.fsync_interval, False, node_id + 1 in args.traced
         ))
         process.start()
         list_nodes.append(process)
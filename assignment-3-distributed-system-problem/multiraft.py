@@ -0,0 +1,191 @@
+import json
+import logging
+import math
+import threading
+
+from node import EventLoop, NodeStates, Raft, UdpSocket, reload_logging_windows, thread_exception_handler
+from storage import SharedLog
+
+# a coalesced datagram stays below the largest UDP payload
+MAX_DATAGRAM_SIZE = 60000
+
+
+class TickScheduler:
+    """
+    Rounds every deadline up to a multiple of tick_duration, so the timers of many groups fire
+    together and the messages they send leave in the same datagrams
+    """
+
+    def __init__(self, scheduler, tick_duration: float):
+        self.scheduler = scheduler
+        self.tick_duration = tick_duration
+
+    def time(self):
+        return self.scheduler.time()
+
+    def call_later(self, delay: float, callback, *args):
+        now = self.time()
+        # rounded first, so float noise cannot push a timer to the next tick
+        tick = math.ceil(round((now + delay) / self.tick_duration, 6))
+        return self.scheduler.call_later(max(0.0, tick * self.tick_duration - now), callback, *args)
+
+
+class GroupSocket:
+    """
+    Stands in for the UdpSocket of one Raft group, messages are tagged with the group id
+    and queued on the node's shared transport
+    """
+
+    def __init__(self, node, group_id: int):
+        self.node = node
+        self.group_id = group_id
+
+    def send(self, message: dict, port: int = 0):
+        self.send_many(message, [port])
+
+    def send_many(self, message: dict, ports: list):
+        # serialize once for every destination, like UdpSocket.send_many
+        message_byte = json.dumps(dict(message, group_id=self.group_id)).encode("UTF-8")
+        for port in ports:
+            self.node.enqueue(message_byte, port)
+
+
+class MultiRaftNode:
+    """
+    One node taking part in many independent Raft groups.
+
+    Every group is a Raft instance of its own, but they share one socket, one event loop and
+    tick-aligned schedulers. Heartbeats of every group fire on the same multiples of
+    heartbeat_duration, and messages of every group for the same destination node are
+    coalesced into as few datagrams as possible, which turns the heartbeats of thousands of
+    groups into a handful of datagrams per pair of nodes and heartbeat. Likewise the groups save
+    their state in one write-ahead log, fsynced once per tick for all of them.
+    """
+
+    def __init__(self, node_id: int, port: int, neighbors_ports: list, lb_fault_duration: float,
+                 heartbeat_duration: float, group_ids, is_continue: bool = False, persistent_dir: str = "persistent",
+                 scheduler=None, transport=None, tick_duration: float = None, flush_delay: float = None,
+                 **raft_options):
+        """
+        :param node_id: node id, the same in every group
+        :param port: port of the node, shared by every group
+        :param neighbors_ports: ports of every node, every group has a replica on each of them
+        :param group_ids: ids of the groups
+        :param persistent_dir: directory of the shared write-ahead log and of the snapshots of every group
+        :param scheduler: event loop running every group, a new EventLoop by default
+        :param transport: provides sendto(data, address), the node's socket by default
+        :param tick_duration: granularity of the other timers, a tenth of the heartbeat by default
+        :param flush_delay: how long messages wait for others to the same node, a tenth of the tick by default
+        :param raft_options: passed to every Raft instance, but fsync_interval goes to the shared log
+        """
+        self.node_id = node_id
+        self.port = port
+        self.loop = scheduler if scheduler is not None else EventLoop()
+        self.scheduler = TickScheduler(self.loop, tick_duration or heartbeat_duration / 10)
+        self.heartbeat_scheduler = TickScheduler(self.loop, heartbeat_duration)
+        self.flush_delay = flush_delay if flush_delay is not None else self.scheduler.tick_duration / 10
+        self.transport = transport
+        self.outbox = {}
+        self.messages_sent = 0
+        self.datagrams_sent = 0
+        self.is_continue = is_continue
+        self.wal = SharedLog(persistent_dir, node_id, self.scheduler, raft_options.pop("fsync_interval", 0.0),
+                             self.group_logs)
+
+        self.groups = {}
+        for group_id in group_ids:
+            raft = Raft(node_id, port, neighbors_ports, lb_fault_duration, is_continue, heartbeat_duration,
+                        scheduler=self.scheduler, heartbeat_scheduler=self.heartbeat_scheduler,
+                        persistent_dir=persistent_dir, storage=self.wal.group(group_id), **raft_options)
+            raft.socket = GroupSocket(self, group_id)
+            self.groups[group_id] = raft
+
+    def setup(self):
+        if not self.is_continue:
+            self.wal.reset()
+        for raft in self.groups.values():
+            raft.setup()
+
+    def enqueue(self, message_byte: bytes, port: int):
+        # the outbox waits a little for the messages of the other groups whose timers fire on the same tick
+        if not self.outbox:
+            self.loop.call_later(self.flush_delay, self.flush)
+        self.outbox.setdefault(port, []).append(message_byte)
+        self.messages_sent += 1
+
+    def flush(self):
+        outbox, self.outbox = self.outbox, {}
+        for port, messages in outbox.items():
+            datagram = []
+            size = 2
+            for message_byte in messages:
+                if datagram and size + len(message_byte) + 1 > MAX_DATAGRAM_SIZE:
+                    self.send_datagram(datagram, port)
+                    datagram = []
+                    size = 2
+                datagram.append(message_byte)
+                size += len(message_byte) + 1
+            self.send_datagram(datagram, port)
+
+    def send_datagram(self, messages: list, port: int):
+        self.transport.sendto(b"[" + b",".join(messages) + b"]", ("127.0.0.1", port))
+        self.datagrams_sent += 1
+
+    def on_datagram(self, data: bytes):
+        for msg in json.loads(data.decode("UTF-8")):
+            raft = self.groups.get(msg["group_id"])
+            if raft is not None:
+                raft.on_message(msg)
+
+    def group_logs(self):
+        # what the shared log keeps of every group when it is compacted
+        return {group_id: (raft.log_offset, raft.log) for group_id, raft in self.groups.items()}
+
+    def leaders(self):
+        # ids of the groups this node leads
+        return [group_id for group_id, raft in self.groups.items() if raft.current_role == NodeStates.LEADER]
+
+    def stop(self):
+        for raft in self.groups.values():
+            raft.stop()
+        self.wal.close()
+
+    def listening_procedure(self, node_socket: UdpSocket):
+        logging.info("Listen for any inputs...")
+        while True:
+            data, _ = node_socket.sc.recvfrom(65535)
+            self.loop.call_soon(self.on_datagram, data)
+
+    def start(self):
+        node_socket = UdpSocket(self.port)
+        self.transport = node_socket.sc
+        self.loop.call_soon(self.setup)
+
+        thread = threading.Thread(target=self.listening_procedure, args=(node_socket,), daemon=True)
+        thread.name = "listening_thread"
+        thread.start()
+
+        self.loop.run_forever()
+
+
+def main(heartbeat_duration=1, lb_fault_duration=1, port=1000, node_id=1, neighbors_ports=(1000,),
+         number_of_groups=1, is_continue=False, fsync_interval=0.0):
+    # the multi-raft counterpart of node.main, one process taking part in every group
+    reload_logging_windows(f"logs/node{node_id}.txt")
+    threading.excepthook = thread_exception_handler
+    try:
+        logging.info(f"Node with id {node_id} is running {number_of_groups} groups...")
+        logging.debug(f"heartbeat_duration: {heartbeat_duration}")
+        logging.debug(f"lower_bound_fault_duration: {lb_fault_duration}")
+        logging.debug(f"port: {port}")
+        logging.debug(f"neighbors_ports: {neighbors_ports}")
+        logging.debug(f"is_continue: {is_continue}")
+        logging.debug(f"fsync_interval: {fsync_interval}")
+
+        node = MultiRaftNode(node_id, port, neighbors_ports, lb_fault_duration, heartbeat_duration,
+                             range(number_of_groups), is_continue, fsync_interval=fsync_interval)
+        logging.info("Execute node.start()...")
+        node.start()
+    except Exception:
+        logging.exception("Caught Error")
+        raise
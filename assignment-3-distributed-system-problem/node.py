@@ -1,28 +1,173 @@
+import heapq
+import itertools
 import logging
+import queue
 import threading
 import socket
 import json
 import random
+import time
+
+from storage import RaftStorage
+import tracing
 
 
 def thread_exception_handler(args):
     logging.error(f"Uncaught exception", exc_info=(args.exc_type, args.exc_value, args.exc_traceback))
 
 
+class EventTimer:
+
+    def __init__(self, when, callback, args):
+        self.when = when
+        self.callback = callback
+        self.args = args
+        self.is_cancelled = False
+
+    def cancel(self):
+        self.is_cancelled = True
+
+
+class EventLoop:
+    """
+    Runs every message handler and every timer on the thread calling run_forever, one at a time.
+
+    Other threads only hand events over through a queue, so the Raft state is never touched by two
+    threads at once, and a timer is an entry in a heap instead of a thread of its own.
+    """
+
+    def __init__(self):
+        self.events = queue.SimpleQueue()
+        self.timers = []
+        self.sequence = itertools.count()
+        self.is_stopped = False
+
+    @staticmethod
+    def time():
+        return time.monotonic()
+
+    def call_soon(self, callback, *args):
+        # safe to call from any thread
+        self.events.put((callback, args))
+
+    def call_later(self, delay: float, callback, *args):
+        # safe to call from any thread, the timer joins the heap on the loop thread
+        timer = EventTimer(self.time() + delay, callback, args)
+        self.events.put((self.add_timer, (timer,)))
+        return timer
+
+    def add_timer(self, timer):
+        heapq.heappush(self.timers, (timer.when, next(self.sequence), timer))
+
+    def stop(self):
+        self.call_soon(setattr, self, "is_stopped", True)
+
+    def run_forever(self):
+        while not self.is_stopped:
+            # timers that are due go first
+            now = self.time()
+            while self.timers and self.timers[0][0] <= now:
+                _, _, timer = heapq.heappop(self.timers)
+                if not timer.is_cancelled:
+                    self.run_callback(timer.callback, timer.args)
+                now = self.time()
+
+            timeout = self.timers[0][0] - now if self.timers else None
+            try:
+                callback, args = self.events.get(timeout=timeout)
+            except queue.Empty:
+                continue
+            self.run_callback(callback, args)
+
+    @staticmethod
+    def run_callback(callback, args):
+        # one failing handler must not stop every other node of the loop
+        try:
+            callback(*args)
+        except Exception:
+            logging.exception("Event loop callback failed")
+
+
 class Raft:
 
     def __init__(self, node_id: int, port: int, neighbors_ports: list, lb_fault_duration: int, is_continue: bool,
-                 heartbeat_duration: float):
+                 heartbeat_duration: float, scheduler=None, rng=None, persistent_dir: str = "persistent",
+                 max_batch_size: int = 64, fsync_interval=0.0, snapshot_threshold: int = 1000,
+                 state_machine=None, lease_reads: bool = False, pre_vote: bool = True,
+                 pipeline_window: int = 1, heartbeat_scheduler=None, is_learner: bool = False, storage=None,
+                 snapshot_chunk_size: int = 16384, max_batch_bytes: int = 32768):
+        # scheduler provides time() and call_later(delay, callback) returning a cancellable timer,
+        # the simulator swaps it (and rng) for virtual time and a seeded generator
+        self.scheduler = scheduler if scheduler is not None else EventLoop()
+        # heartbeats alone may go through another scheduler, multiraft aligns them across groups
+        self.heartbeat_scheduler = heartbeat_scheduler if heartbeat_scheduler is not None else self.scheduler
+        self.random = rng if rng is not None else random
+        self.persistent_dir = persistent_dir
+        # a RaftStorage in persistent_dir by default, multiraft hands every group a view on one shared log
+        self.storage = storage
+        self.fsync_interval = fsync_interval
         self.heartbeat_duration = heartbeat_duration
         self.is_continue = is_continue
         self.lb_fault_duration = lb_fault_duration
         self.neighbors_ports = neighbors_ports
         self.port = port
         self.node_id = node_id
+        self.is_stopped = False
+        self.max_batch_size = max_batch_size
+        # a batch also stops at max_batch_bytes of encoded entries, well within one datagram,
+        # an entry larger than that still goes alone
+        self.max_batch_bytes = max_batch_bytes
+        # batches of max_batch_size entries a follower may have in flight, unacknowledged
+        self.pipeline_window = pipeline_window
+        # compact the log once this many committed entries are not in the snapshot yet, 0 to never do it
+        self.snapshot_threshold = snapshot_threshold
+        # characters of the serialized snapshot sent per INSTALL_SNAPSHOT, escaping the chunk inside the
+        # message at most doubles it, so it stays well within one datagram
+        self.snapshot_chunk_size = snapshot_chunk_size
+        self.state_machine = state_machine if state_machine is not None else LoggingStateMachine()
+        # with lease reads the leader skips the ReadIndex round until round_sent_at + lease_duration of the
+        # last round a majority acknowledged. that majority ignores vote requests for lb_fault_duration after
+        # the round (leader stickiness, see on_vote_request), so no other leader can be elected before,
+        # one heartbeat is kept as a margin for delivery delay and clock drift
+        self.lease_reads = lease_reads
+        # with pre_vote a node only starts an election a majority would vote for, and nodes that heard
+        # from a leader within lb_fault_duration ignore vote requests, so a node coming back from a
+        # partition or a restart cannot depose a working leader
+        self.pre_vote = pre_vote
+        self.lease_duration = lb_fault_duration - heartbeat_duration
+        # neighbors_ports is only the configuration the cluster starts with, with node ids as positions,
+        # later ones are entries of the log. a learner joins a running cluster, it gets the log but
+        # neither votes nor counts toward a majority until a configuration makes it a voter
+        self.is_learner = is_learner
+        # port of every node ever seen in a configuration, members or not
+        self.known_ports = {node_id: node_port for node_id, node_port in enumerate(neighbors_ports, start=1)}
+        # learners to turn into voters once they caught up with the leader
+        self.learners_to_promote = set()
+        # a tracing.Tracer while the node is traced, see tracing.toggle
+        self.tracer = None
 
     def start(self):
         # Setup socket for sending and receiving messages
         self.socket = UdpSocket(self.port)
+        self.scheduler.call_soon(self.setup)
+
+        # this thread only reads the socket, messages are handled on the event loop like timers
+        thread = threading.Thread(target=self.listening_procedure, daemon=True)
+        thread.name = "listening_thread"
+        thread.start()
+
+        self.scheduler.run_forever()
+
+    def listening_procedure(self):
+        # listen to incoming messages
+        logging.info("Listen for any inputs...")
+        while True:
+            msg, sender = self.socket.listen()
+            self.scheduler.call_soon(self.on_message, msg)
+
+    def setup(self):
+        if self.storage is None:
+            self.storage = RaftStorage(self.persistent_dir, self.node_id, self.fsync_interval, self.scheduler)
 
         # Check if the node is recovering from crash or new node
         if self.is_continue:
@@ -35,44 +180,159 @@ class Raft:
         # start election timer
         self.start_election_timer()
 
-        # listen to incoming messages
-        logging.info("Listen for any inputs...")
-        while True:
-            msg, sender = self.socket.listen()
-            if msg["type"] == MessageType.VOTE_REQUEST:
-                logging.info(f"node{msg['node_id']} sends a vote_request")
-                self.on_vote_request(msg)
-            elif msg["type"] == MessageType.VOTE_RESPONSE:
-                self.on_vote_response(msg)
-            elif msg["type"] == MessageType.HEARTBEAT:
-                logging.info(f"node{msg['node_id']} sends a log_request")
-                self.on_heartbeat(msg)
-        
+    def on_message(self, msg):
+        # dispatch an incoming message, whoever delivered it
+        if self.is_stopped:
+            return
+        if self.tracer is not None:
+            self.tracer.record(tracing.RECV, msg.get("node_id", 0), msg["type"], msg.get("current_term", 0))
+        if msg["type"] == MessageType.VOTE_REQUEST:
+            logging.info(f"node{msg['node_id']} sends a vote_request")
+            self.on_vote_request(msg)
+        elif msg["type"] == MessageType.VOTE_RESPONSE:
+            self.on_vote_response(msg)
+        elif msg["type"] == MessageType.HEARTBEAT:
+            logging.info(f"node{msg['node_id']} sends a log_request")
+            self.on_heartbeat(msg)
+        elif msg["type"] == MessageType.LOG_RESPONSE:
+            self.on_log_response(msg)
+        elif msg["type"] == MessageType.CLIENT_REQUEST:
+            self.on_client_request(msg)
+        elif msg["type"] == MessageType.CONFIG_REQUEST:
+            self.on_config_request(msg)
+        elif msg["type"] == MessageType.PRE_VOTE_REQUEST:
+            self.on_pre_vote_request(msg)
+        elif msg["type"] == MessageType.PRE_VOTE_RESPONSE:
+            self.on_pre_vote_response(msg)
+        elif msg["type"] == MessageType.INSTALL_SNAPSHOT:
+            logging.info(f"node{msg['node_id']} sends a snapshot")
+            self.on_install_snapshot(msg)
+
+    def stop(self):
+        # stop timers and ignore any further message, used when a host kills this node
+        self.is_stopped = True
+        self.cancel_election_timer()
+        if getattr(self, "heartbeat_timer", None) is not None:
+            self.heartbeat_timer.cancel()
+        self.storage.close()
+
     def initialize(self):
         # initialize node state
+        self.storage.reset()
         self.current_term = 0
         self.voted_for = None
         self.log = []
+        self.log_offset = 0
+        self.snapshot_term = 0
+        self.snapshot = None
         self.commit_length = 0
+        self.update_config()
         self.current_role = NodeStates.FOLLOWER
         self.current_leader = None
         self.votes_received = []
         self.sent_length = {}
         self.acked_length = {}
+        self.pipelined_length = {}
+        # port -> (snapshot_length, characters acknowledged) of the snapshot being sent to a follower
+        self.snapshot_offsets = {}
+        # (snapshot_length, snapshot_term, leader's term, chunks) of the snapshot being received from the leader
+        self.partial_snapshot = None
+        self.serialized_snapshot = None
+        self.heartbeat_round = 0
+        self.round_sent_at = {}
+        self.confirmed_rounds = {}
+        self.pending_reads = []
+        self.pending_commands = {}
+        self.lease_expiry = 0
+        self.pre_votes_received = []
+        self.leader_heard_at = None
+        self.failed_elections = 0
 
     def recovery_from_crash(self):
         # recover node state, load from file
         self.load_state()
+        self.update_config()
         self.current_role = NodeStates.FOLLOWER
         self.current_leader = None
         self.votes_received = []
         self.sent_length = {}
         self.acked_length = {}
+        self.pipelined_length = {}
+        self.snapshot_offsets = {}
+        self.partial_snapshot = None
+        self.serialized_snapshot = None
+        self.heartbeat_round = 0
+        self.round_sent_at = {}
+        self.confirmed_rounds = {}
+        self.pending_reads = []
+        self.pending_commands = {}
+        self.lease_expiry = 0
+        self.pre_votes_received = []
+        self.leader_heard_at = None
+        self.failed_elections = 0
 
     def on_suspect_leader_failure_or_timeout(self):
         # if leader is suspected to be failed or election timeout
+        if self.is_stopped:
+            return
         logging.info("Leader is suspected to be failed")
+        if self.tracer is not None:
+            self.tracer.record(tracing.TIMER, 0, tracing.ELECTION_TIMEOUT, self.current_term)
+        if self.node_id not in self.voters:
+            # learners and removed nodes never stand for election, a configuration may still make this node a voter
+            self.start_election_timer()
+            return
+        self.failed_elections += 1
+        if self.pre_vote:
+            self.start_pre_vote()
+        else:
+            self.start_election()
+
+    def start_pre_vote(self):
+        # ask whether the others would vote for this node in the next term, without changing any state
+        self.pre_votes_received = [self.node_id]
+        msg = {"type": MessageType.PRE_VOTE_REQUEST,
+               "current_term": self.current_term + 1,
+               "log_length": self.log_length(),
+               "node_id": self.node_id,
+               "last_term": self.term_at(self.log_length() - 1) if self.log_length() > 0 else 0}
+        self.send_many(msg, self.voter_ports())
+
+        self.reset_election_timer()
+
+    def on_pre_vote_request(self, msg):
+        # answer as the vote_request of the next term would be answered, but keep term and vote
+        last_term = self.term_at(self.log_length() - 1) if self.log_length() > 0 else 0
+        log_ok = msg["last_term"] > last_term or (msg["last_term"] == last_term and msg["log_length"] >= self.log_length())
+        vote_granted = msg["current_term"] > self.current_term and log_ok and not self.is_leader_alive()
+        response = {"type": MessageType.PRE_VOTE_RESPONSE,
+                    "current_term": msg["current_term"],
+                    "node_id": self.node_id,
+                    "vote_granted": vote_granted}
+        if msg["node_id"] in self.known_ports:
+            self.send(response, self.known_ports[msg["node_id"]])
+
+    def on_pre_vote_response(self, msg):
+        if self.current_role == NodeStates.LEADER or msg["current_term"] != self.current_term + 1 or \
+                not msg["vote_granted"]:
+            return
+        if msg["node_id"] not in self.pre_votes_received:
+            self.pre_votes_received.append(msg["node_id"])
+        if self.has_quorum(self.pre_votes_received):
+            logging.info(f"Pre-votes received: {self.pre_votes_received}")
+            self.pre_votes_received = []
+            self.start_election()
+
+    def is_leader_alive(self):
+        # leader stickiness, a leader was heard from within the shortest election timeout
+        if self.current_role == NodeStates.LEADER:
+            return True
+        return self.leader_heard_at is not None and \
+            self.scheduler.time() - self.leader_heard_at < self.lb_fault_duration
+
+    def start_election(self):
         self.current_term += 1
+        self.trace_role(NodeStates.CANDIDATE)
         self.current_role = NodeStates.CANDIDATE
         self.voted_for = self.node_id
         self.votes_received = [self.node_id]
@@ -80,45 +340,57 @@ class Raft:
         # to initialize var
         self.last_term = 0
 
-        if len(self.log) > 0:
+        if self.log_length() > 0:
             # get last log index and term
-            last_log_index = len(self.log) - 1
-            self.last_term = self.log[last_log_index].term
+            last_log_index = self.log_length() - 1
+            self.last_term = self.term_at(last_log_index)
 
         msg = {"type": MessageType.VOTE_REQUEST, 
                 "current_term": self.current_term, 
-                "log_length": len(self.log), 
+                "log_length": self.log_length(), 
                 "node_id": self.node_id, 
                 "last_term": self.last_term,}
         
-        # send vote_request to all neighbors
-        for neighbor_port in self.neighbors_ports:
-            if neighbor_port == self.port:
-                continue
-            self.socket.send(msg, neighbor_port)
-        
+        # the vote for itself is saved before any other node can answer it
         self.save_state()
+
+        # send vote_request to every other voter
+        self.send_many(msg, self.voter_ports())
         
         self.reset_election_timer()
 
     def on_vote_request(self, msg):
         # if receive vote_request from candidate
         logging.info("vote procedure is starting...")
+        # lease reads are only safe with leader stickiness, pre-vote or not
+        if (self.pre_vote or self.lease_reads) and msg["current_term"] > self.current_term and \
+                self.is_leader_alive():
+            # do not even adopt the term, the candidate will learn about the leader from its heartbeats
+            logging.info(f"Ignore vote_request of node {msg['node_id']}, the leader is alive")
+            return
+        if msg["node_id"] not in self.known_ports:
+            logging.info(f"Ignore vote_request of unknown node {msg['node_id']}")
+            return
+        candidate_port = self.known_ports[msg["node_id"]]
         if msg["current_term"] > self.current_term:
             logging.info(f"Candidate node {msg['node_id']} has higher term than my term")
             logging.info(f"Change term from {self.current_term} to {msg['current_term']}")
             self.current_term = msg["current_term"]
-            self.current_role = "follower"
+            if self.current_role == NodeStates.LEADER:
+                # a deposed leader needs its election timer back
+                self.start_election_timer()
+            self.trace_role(NodeStates.FOLLOWER)
+            self.current_role = NodeStates.FOLLOWER
             self.voted_for = None
 
         self.last_term = 0
-        if len(self.log) > 0:
+        if self.log_length() > 0:
             # get last log index and term
-            last_log_index = len(self.log) - 1
-            self.last_term = self.log[last_log_index].term
+            last_log_index = self.log_length() - 1
+            self.last_term = self.term_at(last_log_index)
 
         # check if the candidate's log is up-to-date
-        log_ok = msg["last_term"] > self.last_term or (msg["last_term"] == self.last_term and msg["log_length"] >= len(self.log))
+        log_ok = msg["last_term"] > self.last_term or (msg["last_term"] == self.last_term and msg["log_length"] >= self.log_length())
         
         # check condition for voting
         if msg["current_term"] == self.current_term and log_ok and self.voted_for in [None, msg["node_id"]]:
@@ -128,14 +400,18 @@ class Raft:
                     "node_id": self.node_id, 
                     "vote_granted": True}
             logging.info(f"I vote for canidate node {self.voted_for}")
-            self.socket.send(msg, self.neighbors_ports[self.voted_for - 1])
+            # the vote has to be on disk before the candidate can count it
+            self.save_state()
+            self.send(msg, candidate_port)
 
         else:
             msg = {"type": MessageType.VOTE_RESPONSE, 
                     "current_term": self.current_term, 
                     "node_id": self.node_id, 
                     "vote_granted": False}
-            self.socket.send(msg, self.neighbors_ports[self.voted_for - 1])
+            # a term adopted from the candidate is saved before it is answered too
+            self.save_state()
+            self.send(msg, candidate_port)
 
         logging.info(f"Connection for vote_procedure from candidate {self.voted_for} has been closed...")
     
@@ -143,55 +419,278 @@ class Raft:
         # if receive vote_response from candidate
         if self.current_role == NodeStates.CANDIDATE and msg["current_term"] == self.current_term and msg["vote_granted"]:
             logging.info(f"Received vote response from {msg['node_id']}")
-            self.votes_received.append(msg["node_id"])
+            if msg["node_id"] not in self.votes_received:
+                self.votes_received.append(msg["node_id"])
             logging.info(f"Votes received: {self.votes_received}")
 
-            if len(self.votes_received) > (len(self.neighbors_ports) + 1) / 2:
+            if self.has_quorum(self.votes_received):
                 # if received votes from majority of nodes
                 logging.info(f"Node-{self.node_id} elected as leader")
+                self.trace_role(NodeStates.LEADER, self.node_id)
                 self.current_role = NodeStates.LEADER
                 self.current_leader = self.node_id
+                self.failed_elections = 0
 
                 self.cancel_election_timer()
-                
-                # start heartbeat thread
-                self.send_heartbeat()
 
-                for neighbor_port in self.neighbors_ports:
-                    self.sent_length[neighbor_port] = len(self.log)
+                for neighbor_port in self.members.values():
+                    self.sent_length[neighbor_port] = self.log_length()
+                    self.pipelined_length[neighbor_port] = self.log_length()
                     self.acked_length[neighbor_port] = 0
-                    # TODO: replicate log (?)
+                self.confirmed_rounds = {}
+                self.lease_expiry = 0
+                self.learners_to_promote = set()
+
+                # a no-op entry commits something in this term, reads wait for it
+                self.log.append({"term": self.current_term, "command": None})
+                self.storage.append(self.log_length() - 1, self.log[-1:])
+                self.save_state()
+                self.storage.after_sync(self.ack_own_log, self.current_term, self.log_length())
+
+                # start heartbeats, every heartbeat replicates the log
+                self.send_heartbeat()
 
-        
         elif msg["current_term"] > self.current_term:
             self.current_term = msg["current_term"]
+            self.trace_role(NodeStates.FOLLOWER)
             self.current_role = NodeStates.FOLLOWER
             self.voted_for = None
+            self.save_state()
 
             self.reset_election_timer()
 
-    def send_heartbeat(self):
-        # send heartbeat to all neighbors to say that leader is alive
+    def trace_role(self, role, leader=0):
+        # called before the role changes, a follower hearing from its leader again is no change
+        if self.tracer is not None and role != self.current_role:
+            self.tracer.record(tracing.STATE, leader, role, self.current_term)
+
+    def ack_own_log(self, term, length):
+        # the leader only counts toward a majority with the entries that are on its own disk
+        if self.current_role == NodeStates.LEADER and self.current_term == term and \
+                length > self.acked_length.get(self.port, 0):
+            self.acked_length[self.port] = length
+            self.commit_log_entries()
+
+    def send(self, msg, port):
+        # with group commit the message waits for the fsync of what was saved before it
+        self.storage.after_sync(self.socket.send, msg, port)
+
+    def send_many(self, msg, ports):
+        self.storage.after_sync(self.socket.send_many, msg, ports)
+
+    def quorum(self):
+        # only voters count, learners are replicated to but never part of a majority
+        return len(self.voters) // 2 + 1
+
+    def has_quorum(self, node_ids):
+        return len([node_id for node_id in node_ids if node_id in self.voters]) >= self.quorum()
+
+    def voter_ports(self):
+        return [port for node_id, port in self.voters.items() if node_id != self.node_id]
+
+    def follower_ports(self):
+        # every member the leader replicates to, learners included
+        return [port for node_id, port in self.members.items() if node_id != self.node_id]
+
+    def log_length(self):
+        # entries compacted into the snapshot still count, log indexes are absolute
+        return self.log_offset + len(self.log)
+
+    def term_at(self, index):
+        # term of the entry at an absolute index, the snapshot keeps the term of its last entry
+        if index == self.log_offset - 1:
+            return self.snapshot_term
+        return self.log[index - self.log_offset]["term"]
+
+    def on_client_request(self, msg):
+        # a command from a client, followers forward it to the leader they know about
+        if self.current_role == NodeStates.LEADER:
+            self.submit(msg["command"])
+        elif self.current_leader is not None:
+            logging.info(f"Forward client request to leader node {self.current_leader}")
+            self.send(msg, self.known_ports[self.current_leader])
+        else:
+            logging.info("No known leader, drop client request")
+
+    def submit(self, command, callback=None):
+        """
+        Append a client command to the leader's log, it is replicated with the next heartbeat or ack
+        :param command: command for the state machine, anything json can serialize
+        :param callback: called with what the state machine returned once the command is applied,
+                         with None if leadership was lost before it committed
+        :return: index of the command in the log, None if this node is not the leader
+        """
         if self.current_role != NodeStates.LEADER:
+            return None
+        self.log.append({"term": self.current_term, "command": command})
+        if callback is not None:
+            self.pending_commands[self.log_length() - 1] = (self.current_term, callback)
+        self.storage.append(self.log_length() - 1, self.log[-1:])
+        self.save_state()
+        self.storage.after_sync(self.ack_own_log, self.current_term, self.log_length())
+        logging.info(f"Append command to log at index {self.log_length() - 1}")
+        if is_config(command):
+            # a configuration is in effect as soon as it is in the log, committed or not
+            self.update_config()
+
+        # do not wait for the heartbeat once a follower has a full batch pending
+        ports = [port for port in self.follower_ports()
+                 if self.log_length() - self.pipelined_length[port] >= self.max_batch_size]
+        if ports:
+            self.send_batches(ports)
+        return self.log_length() - 1
+
+    def read(self, callback):
+        """
+        Linearizable read that does not go through the log (ReadIndex)
+        :param callback: called with True once the state machine may be read, with False if leadership was lost
+        :return: False if this node is not the leader
+        """
+        if self.current_role != NodeStates.LEADER:
+            return False
+
+        if self.lease_reads and self.is_current_term_committed() and self.scheduler.time() < self.lease_expiry:
+            callback(True)
+            return True
+
+        # the read waits for the next heartbeat round to be acknowledged by a majority,
+        # every read arriving meanwhile shares that round
+        is_round_started = any(read_round > self.heartbeat_round for read_round, _, _ in self.pending_reads)
+        self.pending_reads.append((self.heartbeat_round + 1, self.current_term, callback))
+        if not is_round_started:
+            self.replicate_log()
+        return True
+
+    def is_current_term_committed(self):
+        # before that, the commit_length of this leader may lag behind the one of the previous leader
+        return self.commit_length > 0 and self.term_at(self.commit_length - 1) == self.current_term
+
+    def serve_reads(self):
+        # a round acknowledged by a majority proves this node was still the leader when it was sent
+        rounds = sorted([self.heartbeat_round] * (self.node_id in self.voters) +
+                        [self.confirmed_rounds.get(port, 0) for port in self.voter_ports()],
+                        reverse=True)
+        confirmed_round = rounds[self.quorum() - 1]
+        if confirmed_round in self.round_sent_at:
+            self.lease_expiry = max(self.lease_expiry, self.round_sent_at[confirmed_round] + self.lease_duration)
+        for sent_round in [sent_round for sent_round in self.round_sent_at if sent_round < confirmed_round]:
+            del self.round_sent_at[sent_round]
+
+        if not self.pending_reads or not self.is_current_term_committed():
             return
-        
-        msg = {"type": MessageType.HEARTBEAT, 
-                "current_term": self.current_term, 
-                "node_id": self.node_id}
-        for neighbor_port in self.neighbors_ports:
-            if neighbor_port == self.port:
-                continue
-            self.socket.send(msg, neighbor_port)
-            logging.info(f"Sending heartbeat message to node {neighbor_port}...")
+        ready_reads = [read for read in self.pending_reads if read[0] <= confirmed_round]
+        self.pending_reads = [read for read in self.pending_reads if read[0] > confirmed_round]
+        for _, term, callback in ready_reads:
+            callback(term == self.current_term)
+
+    def send_heartbeat(self):
+        # send heartbeat to all neighbors to say that leader is alive, carrying the log they miss
+        if self.current_role != NodeStates.LEADER or self.is_stopped:
+            # reads waiting for this leadership to be confirmed never will be
+            for _, _, callback in self.pending_reads:
+                callback(False)
+            self.pending_reads = []
+            # neither are commands still waiting to commit, a later leader may overwrite them
+            for _, callback in self.pending_commands.values():
+                callback(None)
+            self.pending_commands = {}
+            return
+
+        if self.tracer is not None:
+            self.tracer.record(tracing.TIMER, 0, tracing.HEARTBEAT, self.current_term)
+        self.replicate_log()
+
+        self.heartbeat_timer = self.heartbeat_scheduler.call_later(self.heartbeat_duration, self.send_heartbeat)
+
+    def replicate_log(self):
+        # every call is a heartbeat round, followers echo its number back to confirm the leadership
+        self.heartbeat_round += 1
+        self.round_sent_at[self.heartbeat_round] = self.scheduler.time()
+
+        # whatever was in flight and is still not acknowledged is sent again
+        followers = self.follower_ports()
+        for port in followers:
+            self.pipelined_length[port] = self.sent_length[port]
+        self.send_batches(followers, is_heartbeat=True)
+
+    def send_batches(self, ports, is_heartbeat=False):
+        """
+        Send batches to the followers until their window of unacknowledged entries is full
+        :param ports: ports of the followers
+        :param is_heartbeat: send at least one message to each follower, even without any entry
+        """
+        window = self.pipeline_window * self.max_batch_size
+        while ports:
+            # followers at the same position get the same batch, so it is serialized once
+            followers_by_prefix = {}
+            for port in ports:
+                prefix_length = self.pipelined_length[port]
+                if is_heartbeat or (prefix_length < self.log_length() and
+                                    prefix_length - self.sent_length[port] < window):
+                    followers_by_prefix.setdefault(prefix_length, []).append(port)
+            is_heartbeat = False
+            ports = []
+
+            for prefix_length, group in followers_by_prefix.items():
+                if prefix_length < self.log_offset:
+                    # the entries these followers miss were compacted, they get the snapshot instead
+                    for port in group:
+                        self.send_snapshot_chunk(port)
+                    continue
 
-        self.heartbeat_thread = threading.Timer(self.heartbeat_duration, self.send_heartbeat)
-        self.heartbeat_thread.start()
+                suffix = self.batch_at(prefix_length)
+                msg = {"type": MessageType.HEARTBEAT,
+                       "current_term": self.current_term,
+                       "node_id": self.node_id,
+                       "prefix_length": prefix_length,
+                       "prefix_term": self.term_at(prefix_length - 1) if prefix_length > 0 else 0,
+                       "commit_length": self.commit_length,
+                       "suffix": suffix,
+                       "round": self.heartbeat_round}
+                self.send_many(msg, group)
+                logging.info(f"Sending heartbeat message with {len(suffix)} entries to nodes {group}...")
+
+                if suffix:
+                    for port in group:
+                        self.pipelined_length[port] = prefix_length + len(suffix)
+                    ports += group
+
+    def batch_at(self, prefix_length):
+        # entries from prefix_length, up to max_batch_size of them and max_batch_bytes once encoded
+        start = prefix_length - self.log_offset
+        suffix = []
+        size = 0
+        for entry in self.log[start:start + self.max_batch_size]:
+            # json.dumps escapes to ascii, characters are bytes, plus the ", " separating entries
+            size += len(json.dumps(entry)) + 2
+            if suffix and size > self.max_batch_bytes:
+                break
+            suffix.append(entry)
+        return suffix
+
+    def send_snapshot_chunk(self, port):
+        # the snapshot goes in chunks from the offset the follower acknowledged, one chunk at a time
+        if self.serialized_snapshot is None or self.serialized_snapshot[0] != self.log_offset:
+            self.serialized_snapshot = (self.log_offset, json.dumps(self.snapshot))
+        data = self.serialized_snapshot[1]
+        snapshot_length, offset = self.snapshot_offsets.get(port, (0, 0))
+        if snapshot_length != self.log_offset:
+            offset = 0
+        chunk = data[offset:offset + self.snapshot_chunk_size]
+        msg = {"type": MessageType.INSTALL_SNAPSHOT,
+               "current_term": self.current_term,
+               "node_id": self.node_id,
+               "snapshot_length": self.log_offset,
+               "snapshot_term": self.snapshot_term,
+               "offset": offset,
+               "data": chunk,
+               "done": offset + len(chunk) == len(data),
+               "round": self.heartbeat_round}
+        self.send(msg, port)
+        logging.info(f"Sending snapshot of {self.log_offset} entries from {offset} of {len(data)} to {port}...")
 
     def on_heartbeat(self, msg):
-        # if receive heartbeat from leader
-        if self.current_role == NodeStates.LEADER:
-            return
-        
+        # if receive heartbeat (log request) from leader
         logging.info("Receive log is starting...")
 
         if msg["current_term"] > self.current_term:
@@ -199,35 +698,369 @@ class Raft:
             self.voted_for = None
 
         if msg["current_term"] == self.current_term:
+            self.trace_role(NodeStates.FOLLOWER, msg["node_id"])
             self.current_role = NodeStates.FOLLOWER
             self.current_leader = msg["node_id"]
+            self.leader_heard_at = self.scheduler.time()
+            self.failed_elections = 0
+
+        # check that the log matches the leader's up to the prefix
+        prefix_length = msg["prefix_length"]
+        # entries in the snapshot are committed, so they match the leader's
+        log_ok = self.log_length() >= prefix_length and \
+            (prefix_length <= self.log_offset or self.term_at(prefix_length - 1) == msg["prefix_term"])
+
+        if msg["current_term"] == self.current_term and log_ok:
+            self.append_entries(prefix_length, msg["commit_length"], msg["suffix"])
+            ack = prefix_length + len(msg["suffix"])
+            success = True
+        else:
+            # tell the leader how long the log is, so it can skip back at once
+            ack = self.log_length()
+            success = False
 
         self.save_state()
-        self.reset_election_timer()
-        
-        # log_ok etc
+        if msg["current_term"] == self.current_term:
+            self.reset_election_timer()
+
+        response = {"type": MessageType.LOG_RESPONSE,
+                    "current_term": self.current_term,
+                    "node_id": self.node_id,
+                    "ack": ack,
+                    "success": success,
+                    "prefix_length": prefix_length,
+                    "round": msg["round"]}
+        self.send(response, self.known_ports[msg["node_id"]])
+
+    def append_entries(self, prefix_length, leader_commit, suffix):
+        # only what this batch proves to match the leader's log can be committed
+        leader_commit = min(leader_commit, prefix_length + len(suffix))
+        if prefix_length < self.log_offset:
+            # the start of the suffix is already in the snapshot
+            suffix = suffix[self.log_offset - prefix_length:]
+            prefix_length = self.log_offset
+
+        # drop a conflicting tail, then append what is new
+        if len(suffix) > 0 and self.log_length() > prefix_length:
+            index = min(self.log_length(), prefix_length + len(suffix)) - 1
+            if self.term_at(index) != suffix[index - prefix_length]["term"]:
+                self.log = self.log[:prefix_length - self.log_offset]
+                self.storage.truncate(prefix_length)
+                if self.config_index >= prefix_length:
+                    # the configuration came with the dropped tail, an earlier one is back in effect
+                    self.update_config()
+
+        if prefix_length + len(suffix) > self.log_length():
+            new_entries = suffix[self.log_length() - prefix_length:]
+            self.storage.append(self.log_length(), new_entries)
+            self.log.extend(new_entries)
+            if any(is_config(entry["command"]) for entry in new_entries):
+                self.update_config()
+
+        if leader_commit > self.commit_length:
+            for entry in self.log[self.commit_length - self.log_offset:leader_commit - self.log_offset]:
+                self.deliver(entry)
+            self.commit_length = leader_commit
+            self.compact_log()
+
+    def on_install_snapshot(self, msg):
+        # the leader no longer has the entries this node misses, it sent its snapshot instead
+        logging.info("Install snapshot is starting...")
+
+        if msg["current_term"] > self.current_term:
+            self.current_term = msg["current_term"]
+            self.voted_for = None
+
+        if msg["current_term"] == self.current_term:
+            self.trace_role(NodeStates.FOLLOWER, msg["node_id"])
+            self.current_role = NodeStates.FOLLOWER
+            self.current_leader = msg["node_id"]
+            self.leader_heard_at = self.scheduler.time()
+            self.failed_elections = 0
+            received = self.receive_snapshot_chunk(msg) if msg["snapshot_length"] > self.commit_length else None
+            ack = msg["snapshot_length"]
+            success = True
+        else:
+            received = None
+            ack = self.log_length()
+            success = False
+
+        self.save_state()
+        if msg["current_term"] == self.current_term:
+            self.reset_election_timer()
+
+        response = {"type": MessageType.LOG_RESPONSE,
+                    "current_term": self.current_term,
+                    "node_id": self.node_id,
+                    "ack": ack,
+                    "success": success,
+                    "prefix_length": msg["snapshot_length"],
+                    "round": msg["round"]}
+        if received is not None:
+            # the snapshot is not complete yet, the leader sends the chunk from there
+            response["snapshot_offset"] = received
+        self.send(response, self.known_ports[msg["node_id"]])
+
+    def receive_snapshot_chunk(self, msg):
+        """
+        Add a chunk to the snapshot being received, install it once the last one is in
+        :param msg: INSTALL_SNAPSHOT message
+        :return: characters of the snapshot received so far, None once it is installed
+        """
+        # chunks of another leader may not be of the same serialization
+        snapshot_id = (msg["snapshot_length"], msg["snapshot_term"], msg["current_term"])
+        if self.partial_snapshot is None or self.partial_snapshot[:3] != snapshot_id or msg["offset"] == 0:
+            self.partial_snapshot = snapshot_id + ([],)
+        chunks = self.partial_snapshot[3]
+        received = sum(len(chunk) for chunk in chunks)
+        if msg["offset"] != received:
+            # a duplicate or a chunk that overtook the one before it
+            return received
+        chunks.append(msg["data"])
+        if not msg["done"]:
+            return received + len(msg["data"])
+        self.partial_snapshot = None
+        self.install_snapshot(msg["snapshot_length"], msg["snapshot_term"], json.loads("".join(chunks)))
+        return None
+
+    def install_snapshot(self, snapshot_length, snapshot_term, snapshot):
+        # entries after the snapshot are kept only if the log agrees with the snapshot
+        if self.log_offset < snapshot_length <= self.log_length() and \
+                self.term_at(snapshot_length - 1) == snapshot_term:
+            self.log = self.log[snapshot_length - self.log_offset:]
+        else:
+            self.log = []
+        self.log_offset = snapshot_length
+        self.snapshot_term = snapshot_term
+        self.snapshot = snapshot
+        self.state_machine.restore(snapshot["state"])
+        self.commit_length = snapshot_length
+        self.storage.save_snapshot(snapshot_length, snapshot_term, snapshot, self.log)
+        self.update_config()
+        logging.info(f"Installed snapshot of {snapshot_length} entries")
+
+    def on_log_response(self, msg):
+        # if receive log response from follower
+        follower_port = self.known_ports.get(msg["node_id"])
+        if msg["current_term"] == self.current_term and self.current_role == NodeStates.LEADER and \
+                follower_port in self.sent_length:
+            if msg["success"] and "snapshot_offset" in msg:
+                # a chunk arrived, send the next one without waiting for the heartbeat. the offset may also
+                # go back, when the follower restarted and lost what it had received
+                if self.snapshot_offsets.get(follower_port) != (msg["prefix_length"], msg["snapshot_offset"]):
+                    self.snapshot_offsets[follower_port] = (msg["prefix_length"], msg["snapshot_offset"])
+                    self.send_batches([follower_port])
+            elif msg["success"] and msg["ack"] >= self.acked_length[follower_port]:
+                self.sent_length[follower_port] = msg["ack"]
+                self.acked_length[follower_port] = msg["ack"]
+                self.pipelined_length[follower_port] = max(self.pipelined_length[follower_port], msg["ack"])
+                self.commit_log_entries()
+                self.promote_learners()
+                # the acknowledgement opened the window, keep it full
+                self.send_batches([follower_port])
+            elif not msg["success"] and msg["prefix_length"] > msg["ack"] >= self.sent_length[follower_port]:
+                # the batch overtook an earlier one still in flight, send it again once that one is acknowledged,
+                # if that one was lost the heartbeat resends both
+                self.pipelined_length[follower_port] = min(self.pipelined_length[follower_port], msg["prefix_length"])
+            elif not msg["success"] and self.sent_length[follower_port] > 0:
+                # roll back whatever is in flight and retry from where the logs may agree
+                self.sent_length[follower_port] = min(self.sent_length[follower_port], msg["prefix_length"] - 1,
+                                                      msg["ack"])
+                self.pipelined_length[follower_port] = self.sent_length[follower_port]
+                self.send_batches([follower_port], is_heartbeat=True)
+
+            # even a rejected batch shows that the follower still takes this node as its leader
+            self.confirmed_rounds[follower_port] = max(self.confirmed_rounds.get(follower_port, 0), msg["round"])
+            self.serve_reads()
+
+        elif msg["current_term"] > self.current_term:
+            self.current_term = msg["current_term"]
+            self.trace_role(NodeStates.FOLLOWER)
+            self.current_role = NodeStates.FOLLOWER
+            self.voted_for = None
+            self.save_state()
+
+            self.reset_election_timer()
+
+    def initial_config(self):
+        # every node of neighbors_ports is a voter, but a learner does not count itself in before it hears otherwise
+        members = [[node_id, port] for node_id, port in enumerate(self.neighbors_ports, start=1)]
+        if self.is_learner:
+            return {"type": "config",
+                    "voters": [member for member in members if member[0] != self.node_id],
+                    "learners": [[self.node_id, self.port]]}
+        return {"type": "config", "voters": members, "learners": []}
+
+    def config_at(self, length):
+        """
+        :param length: length of the log prefix to look at
+        :return: index of the last configuration entry in the prefix (below log_offset if it is in the snapshot)
+                 and that configuration
+        """
+        for index in range(length - 1, self.log_offset - 1, -1):
+            if is_config(self.log[index - self.log_offset]["command"]):
+                return index, self.log[index - self.log_offset]["command"]
+        if self.snapshot is not None:
+            return self.log_offset - 1, self.snapshot["config"]
+        return -1, self.initial_config()
+
+    def update_config(self):
+        # the last configuration in the log is in effect, committed or not
+        self.config_index, config = self.config_at(self.log_length())
+        self.voters = {node_id: port for node_id, port in config["voters"]}
+        self.learners = {node_id: port for node_id, port in config["learners"]}
+        self.members = {**self.voters, **self.learners}
+        self.known_ports.update(self.members)
+        logging.info(f"Configuration: voters {sorted(self.voters)}, learners {sorted(self.learners)}")
+
+        if getattr(self, "current_role", None) == NodeStates.LEADER:
+            # a new member starts where every follower of a new leader starts, the first heartbeat finds its log
+            for port in self.follower_ports():
+                if port not in self.sent_length:
+                    self.sent_length[port] = self.log_length()
+                    self.pipelined_length[port] = self.log_length()
+                    self.acked_length[port] = 0
+
+    def change_config(self, voters: dict, learners: dict):
+        """
+        Append a new configuration to the log. At most one voter is added or removed at a time, so
+        any majority of the old voters overlaps any majority of the new ones
+        :param voters: node id to port of every voter
+        :param learners: node id to port of every learner
+        :return: index of the configuration in the log, None if this node is not the leader or
+                 the previous change is not committed yet
+        """
+        if self.current_role != NodeStates.LEADER or not self.is_current_term_committed() or \
+                self.config_index >= self.commit_length:
+            return None
+        if len(set(voters) ^ set(self.voters)) > 1:
+            raise ValueError("Only one voter can be added or removed at a time")
+        if not voters:
+            raise ValueError("A configuration needs at least one voter")
+        logging.info(f"Change configuration to voters {sorted(voters)}, learners {sorted(learners)}")
+        return self.submit({"type": "config",
+                            "voters": sorted([node_id, port] for node_id, port in voters.items()),
+                            "learners": sorted([node_id, port] for node_id, port in learners.items())})
+
+    def add_learner(self, node_id: int, port: int, promote: bool = True):
+        """
+        Start replicating to a new node without counting it toward a majority
+        :param promote: make it a voter once it caught up with the leader
+        :return: index of the configuration in the log, None if it is a member already or cannot be changed now
+        """
+        if node_id in self.members:
+            return None
+        index = self.change_config(self.voters, {**self.learners, node_id: port})
+        if index is not None and promote:
+            self.learners_to_promote.add(node_id)
+        return index
+
+    def promote_learners(self):
+        # a learner that has every committed entry would not hold back commits as a voter
+        for node_id in sorted(self.learners_to_promote):
+            if node_id not in self.learners:
+                self.learners_to_promote.discard(node_id)
+            elif self.acked_length.get(self.learners[node_id], 0) >= self.commit_length:
+                learners = {learner_id: port for learner_id, port in self.learners.items() if learner_id != node_id}
+                if self.change_config({**self.voters, node_id: self.learners[node_id]}, learners) is not None:
+                    self.learners_to_promote.discard(node_id)
+                return
+
+    def remove_node(self, node_id: int):
+        """
+        Stop replicating to a voter or a learner, a leader removing itself steps down once the change commits
+        :return: index of the configuration in the log, None if it is no member or cannot be changed now
+        """
+        self.learners_to_promote.discard(node_id)
+        if node_id not in self.members:
+            return None
+        return self.change_config({voter_id: port for voter_id, port in self.voters.items() if voter_id != node_id},
+                                  {learner_id: port for learner_id, port in self.learners.items()
+                                   if learner_id != node_id})
+
+    def on_config_request(self, msg):
+        # a membership change from an operator, followers forward it to the leader like client requests
+        if self.current_role == NodeStates.LEADER:
+            if msg["action"] == "add":
+                index = self.add_learner(msg["target_id"], msg["target_port"])
+            else:
+                index = self.remove_node(msg["target_id"])
+            if index is None:
+                logging.info("Nothing to change or another change is in progress, drop config request")
+        elif self.current_leader is not None:
+            logging.info(f"Forward config request to leader node {self.current_leader}")
+            self.send(msg, self.known_ports[self.current_leader])
+        else:
+            logging.info("No known leader, drop config request")
+
+    def commit_log_entries(self):
+        # commit the longest prefix acknowledged by a majority if it ends with an entry of the current term,
+        # the entries of earlier terms before it are committed along with it
+        acked_lengths = sorted((self.acked_length.get(port, 0) for port in self.voters.values()), reverse=True)
+        ready_length = acked_lengths[self.quorum() - 1]
+        if ready_length > self.commit_length and self.term_at(ready_length - 1) == self.current_term:
+            for index in range(self.commit_length, ready_length):
+                result = self.deliver(self.log[index - self.log_offset])
+                if index in self.pending_commands:
+                    term, callback = self.pending_commands.pop(index)
+                    # a command of an earlier leadership may have been replaced since
+                    callback(result if self.term_at(index) == term else None)
+            self.commit_length = ready_length
+            if self.node_id not in self.voters and self.config_index < self.commit_length:
+                # the configuration removing this leader is committed, the others elect a new one
+                logging.info("Step down, this node is no longer a voter")
+                self.trace_role(NodeStates.FOLLOWER)
+                self.current_role = NodeStates.FOLLOWER
+                self.current_leader = None
+                self.start_election_timer()
+        self.compact_log()
+
+    def deliver(self, entry):
+        # apply a committed entry, the no-op of a new leader and configurations have nothing to apply
+        if entry["command"] is not None and not is_config(entry["command"]):
+            return self.state_machine.apply(entry["command"])
+        return None
+
+    def compact_log(self):
+        # replace the committed prefix of the log with a snapshot of the state machine
+        if self.snapshot_threshold <= 0 or self.commit_length - self.log_offset < self.snapshot_threshold:
+            return
+        self.snapshot_term = self.term_at(self.commit_length - 1)
+        # the snapshot replaces configurations too, it keeps the one in effect at its last entry
+        self.snapshot = {"state": self.state_machine.snapshot(), "config": self.config_at(self.commit_length)[1]}
+        self.log = self.log[self.commit_length - self.log_offset:]
+        self.log_offset = self.commit_length
+        self.storage.save_snapshot(self.log_offset, self.snapshot_term, self.snapshot, self.log)
+        logging.info(f"Compacted the log into a snapshot of {self.log_offset} entries")
 
     def save_state(self):
-        # save state to file
-        logging.info("Saving state")
-        with open(f"persistent/node{self.node_id}.txt", "w") as f:
-            f.write(f"{self.current_term}\n{self.voted_for}\n{self.log}\n{self.commit_length}\n")
+        # log entries were already handed to the storage as they changed, only the metadata is left
+        self.storage.save_meta(self.current_term, self.voted_for, self.commit_length)
+        self.storage.sync()
 
     def load_state(self):
-        # load state from file
+        # load state from the snapshot and the write-ahead log written after it
         logging.info("Loading state")
-        with open(f"persistent/node{self.node_id}.txt", "r") as f:
-            self.current_term = int(f.readline())
-            self.voted_for = int(f.readline())
-            self.log = eval(f.readline())
-            self.commit_length = int(f.readline())
-                    
+        self.log_offset, self.snapshot_term, self.snapshot = self.storage.load_snapshot()
+        self.state_machine.restore(self.snapshot["state"] if self.snapshot is not None else None)
+        self.current_term, self.voted_for, commit_length, self.log = self.storage.load(self.log_offset)
+
+        # the state machine only holds the snapshot, committed entries after it are applied again
+        commit_length = min(max(commit_length, self.log_offset), self.log_length())
+        for entry in self.log[:commit_length - self.log_offset]:
+            self.deliver(entry)
+        self.commit_length = commit_length
+        logging.info(f"Recovered term {self.current_term} with a snapshot of {self.log_offset} entries "
+                     f"and {len(self.log)} log entries")
+
     def start_election_timer(self):
         logging.info("Election timer will start...")
-        random_time = random.uniform(self.lb_fault_duration, self.lb_fault_duration + 4)
+        # the window starts as wide as lb_fault_duration and doubles with every election that did not
+        # produce a leader, up to the former fixed 4s
+        spread = min(self.lb_fault_duration * 2 ** self.failed_elections, 4)
+        random_time = self.random.uniform(self.lb_fault_duration, self.lb_fault_duration + spread)
         logging.info(f"Election timer duration: {round(random_time, 1)}s")
-        self.election_timer = threading.Timer(random_time, self.on_suspect_leader_failure_or_timeout)
-        self.election_timer.start()
+        self.election_timer = self.scheduler.call_later(random_time, self.on_suspect_leader_failure_or_timeout)
 
     def reset_election_timer(self):
         self.cancel_election_timer()
@@ -248,8 +1081,12 @@ def reload_logging_windows(filename):
                         level=logging.INFO)
 
 def main(heartbeat_duration=1, lb_fault_duration=1, port=1000,
-         node_id=1, neighbors_ports=(1000,), is_continue=False):
+         node_id=1, neighbors_ports=(1000,), is_continue=False, fsync_interval=0.0, is_learner=False,
+         trace=False):
     reload_logging_windows(f"logs/node{node_id}.txt")
+    if trace:
+        # the binary trace replaces the per message logging, see tracing.py
+        logging.getLogger().setLevel(logging.WARNING)
     threading.excepthook = thread_exception_handler
     try:
         logging.info(f"Node with id {node_id} is running...")
@@ -259,9 +1096,18 @@ def main(heartbeat_duration=1, lb_fault_duration=1, port=1000,
         logging.debug(f"port: {port}")
         logging.debug(f"neighbors_ports: {neighbors_ports}")
         logging.debug(f"is_continue: {is_continue}")
+        logging.debug(f"fsync_interval: {fsync_interval}")
+        logging.debug(f"is_learner: {is_learner}")
+        logging.debug(f"trace: {trace}")
 
         logging.info("Create raft object...")
-        raft = Raft(node_id, port, neighbors_ports, lb_fault_duration, is_continue, heartbeat_duration)
+        raft = Raft(node_id, port, neighbors_ports, lb_fault_duration, is_continue, heartbeat_duration,
+                    fsync_interval=fsync_interval, is_learner=is_learner)
+        trace_path = f"logs/node{node_id}.trace"
+        tracing.add_signal_handlers(raft, trace_path)
+        if trace:
+            # runs first on the event loop, once raft.start() opened the socket
+            raft.scheduler.call_soon(tracing.toggle, raft, trace_path)
 
         logging.info("Execute raft.start()...")
         raft.start()
@@ -283,16 +1129,40 @@ class UdpSocket(NodeSocket):
         super(UdpSocket, self).__init__(socket.SOCK_DGRAM, port)
 
     def listen(self):
-        input_value_byte, address = self.sc.recvfrom(1024)
+        # large enough for a full UDP payload, heartbeats carry batches of log entries
+        input_value_byte, address = self.sc.recvfrom(65535)
         response = json.loads(input_value_byte.decode("UTF-8"))
         return response, address
 
-    @staticmethod
-    def send(message: dict, port: int = 0):
+    def send(self, message: dict, port: int = 0):
+        # reuse the bound socket instead of opening one per datagram
         message = json.dumps(message)
-        client_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-        client_socket.sendto(message.encode("UTF-8"), ("127.0.0.1", port))
-        client_socket.close()
+        self.sc.sendto(message.encode("UTF-8"), ("127.0.0.1", port))
+
+    def send_many(self, message: dict, ports: list):
+        # serialize once, then fan the same datagram out to every port
+        message_byte = json.dumps(message).encode("UTF-8")
+        for port in ports:
+            self.sc.sendto(message_byte, ("127.0.0.1", port))
+
+
+def is_config(command):
+    # configurations are commands of the cluster itself, they never reach the state machine
+    return isinstance(command, dict) and command.get("type") == "config"
+
+
+class LoggingStateMachine:
+    # the default state machine only logs the commands, there is nothing to snapshot
+
+    def apply(self, command):
+        logging.info(f"Deliver committed command: {command}")
+
+    def snapshot(self):
+        return None
+
+    def restore(self, snapshot):
+        pass
+
 
 class NodeStates:
     LEADER = 1
@@ -304,3 +1174,11 @@ class MessageType:
     VOTE_REQUEST = 1
     VOTE_RESPONSE = 2
     HEARTBEAT = 3
+    LOG_RESPONSE = 4
+    CLIENT_REQUEST = 5
+    INSTALL_SNAPSHOT = 6
+    PRE_VOTE_REQUEST = 7
+    PRE_VOTE_RESPONSE = 8
+    KV_REQUEST = 9
+    KV_RESPONSE = 10
+    CONFIG_REQUEST = 11
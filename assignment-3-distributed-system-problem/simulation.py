@@ -0,0 +1,317 @@
+import errno
+import heapq
+import itertools
+import json
+import os
+import random
+import tempfile
+
+from kvstore import KeyValueClient, KeyValueServer, KeyValueStore
+from multiraft import MultiRaftNode
+from node import NodeStates, Raft
+
+
+# Simulator taken from assignment 1
+class SimTimer:
+
+    def __init__(self):
+        self.is_cancelled = False
+
+    def cancel(self):
+        self.is_cancelled = True
+
+
+class Simulator:
+    """
+    Discrete-event simulator with virtual time.
+
+    Every timer and every message delivery is an event ordered by virtual time, and every
+    random choice (latency, loss, reordering) comes from one seeded generator, so a run only
+    depends on its seed and finishes as fast as its events can be processed.
+    """
+
+    def __init__(self, seed=0, latency=(0.001, 0.005), loss=0.0, reorder=0.0, reorder_delay=0.01,
+                 max_datagram_size=65507):
+        """
+        :param seed: seed of every random choice of the network
+        :param latency: (lower bound, upper bound) of the delay of a message, in seconds
+        :param loss: probability of a message to be dropped
+        :param reorder: probability of a message to get an extra delay of up to reorder_delay
+        :param reorder_delay: largest extra delay of a reordered message, in seconds
+        :param max_datagram_size: largest payload a send accepts, the largest UDP payload over IPv4 by default
+        """
+        self.now = 0.0
+        self.random = random.Random(seed)
+        self.latency = latency
+        self.loss = loss
+        self.reorder = reorder
+        self.reorder_delay = reorder_delay
+        self.max_datagram_size = max_datagram_size
+
+        self.events = []
+        self.sequence = itertools.count()
+        self.handlers = {}
+        self.groups = None
+
+        self.sent = 0
+        self.delivered = 0
+        self.dropped = 0
+
+    def time(self):
+        return self.now
+
+    def call_later(self, delay, callback, *args):
+        timer = SimTimer()
+        heapq.heappush(self.events, (self.now + delay, next(self.sequence), timer, callback, args))
+        return timer
+
+    def register(self, port, handler):
+        # handler is called with the payload of every message delivered to the port
+        self.handlers[port] = handler
+
+    def unregister(self, port):
+        # a crashed node, messages to it are dropped
+        self.handlers.pop(port, None)
+
+    def partition(self, *groups):
+        # only ports within the same group can reach each other, ports in no group form one more group
+        self.groups = {port: index for index, group in enumerate(groups) for port in group}
+
+    def heal(self):
+        self.groups = None
+
+    def is_reachable(self, source, destination):
+        if self.groups is None:
+            return True
+        return self.groups.get(source, -1) == self.groups.get(destination, -1)
+
+    def send(self, source, destination, payload):
+        if len(payload) > self.max_datagram_size:
+            # like sendto, a datagram too large is refused rather than truncated
+            raise OSError(errno.EMSGSIZE, f"Message too long: {len(payload)} bytes")
+        self.sent += 1
+        if not self.is_reachable(source, destination) or self.random.random() < self.loss:
+            self.dropped += 1
+            return
+        delay = self.random.uniform(*self.latency)
+        if self.reorder and self.random.random() < self.reorder:
+            delay += self.random.uniform(0, self.reorder_delay)
+        self.call_later(delay, self.deliver, destination, payload)
+
+    def deliver(self, destination, payload):
+        handler = self.handlers.get(destination)
+        if handler is None:
+            self.dropped += 1
+            return
+        self.delivered += 1
+        handler(payload)
+
+    def run(self, until=None, stop=None):
+        """
+        Process events in virtual time order
+        :param until: virtual time to stop at, None to run until no event is left
+        :param stop: called after every event, the run stops as soon as it returns True
+        :return: virtual time at the end of the run
+        """
+        while self.events:
+            when, _, timer, callback, args = self.events[0]
+            if until is not None and when > until:
+                break
+            heapq.heappop(self.events)
+            if timer.is_cancelled:
+                continue
+            self.now = when
+            callback(*args)
+            if stop is not None and stop():
+                return self.now
+        if until is not None:
+            self.now = max(self.now, until)
+        return self.now
+
+
+class SimSocket:
+    """
+    Drop-in replacement of UdpSocket sending through a Simulator
+    """
+
+    def __init__(self, simulator: Simulator, port: int):
+        self.simulator = simulator
+        self.port = port
+
+    def send(self, message: dict, port: int = 0):
+        self.simulator.send(self.port, port, json.dumps(message).encode("UTF-8"))
+
+    def send_many(self, message: dict, ports: list):
+        message_byte = json.dumps(message).encode("UTF-8")
+        for port in ports:
+            self.simulator.send(self.port, port, message_byte)
+
+    def listen(self):
+        raise RuntimeError("A simulated node is driven by on_message, not by listen()")
+
+
+class SimTransport:
+    """
+    Drop-in replacement of a node's datagram socket sending through a Simulator
+    """
+
+    def __init__(self, simulator: Simulator, port: int):
+        self.simulator = simulator
+        self.port = port
+
+    def sendto(self, data, addr):
+        self.simulator.send(self.port, addr[1], data)
+
+
+class RaftSimulation:
+    """
+    Raft nodes on a simulated network, the simulator also drives their timers.
+    Node ids double as ports.
+    """
+
+    def __init__(self, number_of_nodes, heartbeat_duration, lb_fault_duration, seed=0,
+                 persistent_dir=None, key_value=False, raft_options=None, **network):
+        """
+        :param number_of_nodes: number of nodes
+        :param heartbeat_duration: heartbeat duration
+        :param lb_fault_duration: lower bound of the election timeout
+        :param seed: seed of the network and of every node
+        :param persistent_dir: where the nodes save their state, a temporary directory by default
+        :param key_value: run a KeyValueStore behind a KeyValueServer on every node
+        :param raft_options: other arguments of every Raft node
+        :param network: latency, loss, reorder, reorder_delay and max_datagram_size of the Simulator
+        """
+        self.simulator = Simulator(seed, **network)
+        self.key_value = key_value
+        self.raft_options = raft_options or {}
+        self.heartbeat_duration = heartbeat_duration
+        self.lb_fault_duration = lb_fault_duration
+        if persistent_dir is None:
+            self.temporary_dir = tempfile.TemporaryDirectory(prefix="raft-simulation-")
+            persistent_dir = self.temporary_dir.name
+        self.persistent_dir = persistent_dir
+        self.ports = list(range(1, number_of_nodes + 1))
+        self.nodes = {}
+        self.servers = {}
+        for node_id in self.ports:
+            self.start_node(node_id, False)
+
+    def start_node(self, node_id, is_continue, is_learner=False):
+        raft = Raft(node_id, node_id, self.ports, self.lb_fault_duration, is_continue, self.heartbeat_duration,
+                    scheduler=self.simulator, rng=random.Random(self.simulator.random.random()),
+                    persistent_dir=self.persistent_dir,
+                    state_machine=KeyValueStore() if self.key_value else None, is_learner=is_learner,
+                    **self.raft_options)
+        raft.socket = SimSocket(self.simulator, node_id)
+        self.nodes[node_id] = raft
+        if self.key_value:
+            server = KeyValueServer(raft)
+            self.servers[node_id] = server
+            self.simulator.register(node_id, lambda message_byte: server.on_message(json.loads(message_byte)))
+        else:
+            self.simulator.register(node_id, lambda message_byte: raft.on_message(json.loads(message_byte)))
+        raft.setup()
+        return raft
+
+    def add_node(self, promote=True):
+        """
+        Start one more node as a learner and ask the leader to add it
+        :param promote: let the leader make it a voter once it caught up
+        :return: the new node, None if there is no leader or another change is in progress
+        """
+        leader = self.leader()
+        if leader is None:
+            return None
+        node_id = len(self.ports) + 1
+        if leader.add_learner(node_id, node_id, promote) is None:
+            return None
+        # a new list, the running nodes keep the configuration they started with
+        self.ports = self.ports + [node_id]
+        return self.start_node(node_id, False, is_learner=True)
+
+    def add_client(self, client_id, port, retry_duration=1.0):
+        # a KeyValueClient on a port of its own, next to the ports of the nodes
+        client = KeyValueClient(client_id, port, self.ports, SimSocket(self.simulator, port), self.simulator,
+                                retry_duration)
+        self.simulator.register(port, lambda message_byte: client.on_message(json.loads(message_byte)))
+        return client
+
+    def kill(self, node_id):
+        # the node stops its timers and its messages are dropped, like killing its process
+        raft = self.nodes.pop(node_id)
+        self.servers.pop(node_id, None)
+        raft.stop()
+        self.simulator.unregister(node_id)
+        return raft
+
+    def restart(self, node_id):
+        # the r<id> command of main.py: recover the node from its persistent state
+        return self.start_node(node_id, True)
+
+    def leader(self):
+        # the live leader with the highest term, None while there is none
+        leaders = [raft for raft in self.nodes.values() if raft.current_role == NodeStates.LEADER]
+        return max(leaders, key=lambda raft: raft.current_term, default=None)
+
+    def run(self, until=None, stop=None):
+        return self.simulator.run(until=until, stop=stop)
+
+
+class MultiRaftSimulation:
+    """
+    MultiRaftNodes on a simulated network, each one taking part in every group.
+    Node ids double as ports.
+    """
+
+    def __init__(self, number_of_nodes, number_of_groups, heartbeat_duration, lb_fault_duration, seed=0,
+                 persistent_dir=None, **network):
+        """
+        :param number_of_nodes: number of nodes
+        :param number_of_groups: number of Raft groups, replicated on every node
+        :param heartbeat_duration: heartbeat duration
+        :param lb_fault_duration: lower bound of the election timeout
+        :param seed: seed of the network and of every group
+        :param persistent_dir: where the groups save their state, a temporary directory by default
+        :param network: latency, loss, reorder, reorder_delay and max_datagram_size of the Simulator
+        """
+        self.simulator = Simulator(seed, **network)
+        if persistent_dir is None:
+            self.temporary_dir = tempfile.TemporaryDirectory(prefix="multiraft-simulation-")
+            persistent_dir = self.temporary_dir.name
+        self.persistent_dir = persistent_dir
+        self.number_of_groups = number_of_groups
+        self.heartbeat_duration = heartbeat_duration
+        self.lb_fault_duration = lb_fault_duration
+        self.ports = list(range(1, number_of_nodes + 1))
+        self.nodes = {}
+        for node_id in self.ports:
+            self.start_node(node_id, False)
+
+    def start_node(self, node_id, is_continue):
+        node = MultiRaftNode(node_id, node_id, self.ports, self.lb_fault_duration, self.heartbeat_duration,
+                             range(self.number_of_groups), is_continue,
+                             persistent_dir=os.path.join(self.persistent_dir, f"node{node_id}"),
+                             scheduler=self.simulator, transport=SimTransport(self.simulator, node_id),
+                             rng=random.Random(self.simulator.random.random()))
+        self.nodes[node_id] = node
+        self.simulator.register(node_id, node.on_datagram)
+        node.setup()
+        return node
+
+    def kill(self, node_id):
+        # see RaftSimulation.kill, every group of the node stops at once
+        node = self.nodes.pop(node_id)
+        node.stop()
+        self.simulator.unregister(node_id)
+        return node
+
+    def restart(self, node_id):
+        # every group recovers from the shared write-ahead log
+        return self.start_node(node_id, True)
+
+    def leaders(self):
+        # group id to the id of the node leading it, for every group with a leader
+        return {group_id: node.node_id for node in self.nodes.values() for group_id in node.leaders()}
+
+    def run(self, until=None, stop=None):
+        return self.simulator.run(until=until, stop=stop)
@@ -0,0 +1,468 @@
+import json
+import logging
+import os
+import struct
+import zlib
+
+# metadata record: sequence number, current_term, voted_for (-1 for None), commit_length, crc32 of the rest
+META = struct.Struct("!QQqQI")
+# header of a write-ahead log record: record type, payload length, crc32 of the payload
+RECORD = struct.Struct("!BII")
+# payload of an APPEND record: index and term of the entry, followed by its command as json
+ENTRY = struct.Struct("!QQ")
+# payload of a TRUNCATE record: the new length of the log
+LENGTH = struct.Struct("!Q")
+# header of a snapshot: number of entries it covers, term of the last one, crc32 of the state as json
+SNAPSHOT = struct.Struct("!QQI")
+
+APPEND = 1
+TRUNCATE = 2
+
+
+def replace_file(path, data, durable=True):
+    # write a new version next to the file, then swap them, a crash leaves one or the other
+    temporary_path = path + ".tmp"
+    with open(temporary_path, "wb") as f:
+        f.write(data)
+        if durable:
+            f.flush()
+            os.fsync(f.fileno())
+    os.replace(temporary_path, path)
+    if durable:
+        # the rename itself is only durable once the directory is
+        directory_fd = os.open(os.path.dirname(path) or ".", os.O_RDONLY)
+        try:
+            os.fsync(directory_fd)
+        finally:
+            os.close(directory_fd)
+
+
+class RaftStorage:
+    """
+    Persistent state of one Raft node.
+
+    Log entries are appended to a write-ahead log of checksummed records, a conflicting tail is
+    dropped by appending a TRUNCATE record, so saving never rewrites what is already on disk.
+    current_term, voted_for and commit_length live in a fixed-size metadata record updated in
+    place. It alternates between two slots, a torn write leaves the previous record intact.
+
+    A snapshot replaces the committed prefix of the log, the write-ahead log is then rewritten
+    with the entries after it only, so recovery reads at most one snapshot and a short tail.
+
+    With group commit, what was written is only durable once the shared fsync ran. Messages
+    that tell others about it are held until then, see after_sync.
+    """
+
+    def __init__(self, directory: str, node_id: int, fsync_interval=0.0, scheduler=None):
+        """
+        :param directory: directory of the files, created if missing
+        :param node_id: node id, names the files
+        :param fsync_interval: 0 to fsync on every sync, a positive number of seconds to share one fsync
+                               between every sync within that interval (group commit),
+                               None to leave flushing to the operating system
+        :param scheduler: provides call_later(delay, callback), needed by a positive fsync_interval
+        """
+        os.makedirs(directory, exist_ok=True)
+        self.wal_path = os.path.join(directory, f"node{node_id}.wal")
+        self.meta_path = os.path.join(directory, f"node{node_id}.meta")
+        self.snapshot_path = os.path.join(directory, f"node{node_id}.snapshot")
+        self.wal_fd = os.open(self.wal_path, os.O_RDWR | os.O_CREAT | os.O_APPEND, 0o644)
+        self.meta_fd = os.open(self.meta_path, os.O_RDWR | os.O_CREAT, 0o644)
+        self.fsync_interval = fsync_interval
+        self.scheduler = scheduler
+        self.fsync_timer = None
+        # (callback, args) held until the pending fsync ran
+        self.held = []
+
+        self.buffer = []
+        self.meta = None
+        self.pending_meta = None
+        self.meta_sequence = 0
+
+    def reset(self):
+        # a new node, forget whatever a previous run left behind
+        os.ftruncate(self.wal_fd, 0)
+        os.ftruncate(self.meta_fd, 0)
+        if os.path.exists(self.snapshot_path):
+            os.remove(self.snapshot_path)
+        self.buffer = []
+        self.meta = None
+        self.pending_meta = None
+        self.meta_sequence = 0
+
+    def load_snapshot(self):
+        """
+        :return: number of entries in the snapshot, term of the last one and the state machine's snapshot
+        """
+        if not os.path.exists(self.snapshot_path):
+            return 0, 0, None
+        with open(self.snapshot_path, "rb") as f:
+            data = f.read()
+        length, term, checksum = SNAPSHOT.unpack_from(data)
+        if zlib.crc32(data[SNAPSHOT.size:]) != checksum:
+            # the log prefix it replaced is gone, there is nothing to fall back to
+            raise ValueError(f"Corrupted snapshot {self.snapshot_path}")
+        return length, term, json.loads(data[SNAPSHOT.size:].decode("UTF-8"))
+
+    def load(self, log_offset: int = 0):
+        """
+        Recover the state by scanning the write-ahead log, a torn record at its tail is cut off
+        :param log_offset: number of entries in the snapshot, records before it are skipped
+        :return: current_term, voted_for, commit_length and the log entries after the snapshot
+        """
+        current_term, voted_for, commit_length = self.load_meta()
+
+        with open(self.wal_path, "rb") as f:
+            data = f.read()
+        log = []
+        offset = 0
+        while offset + RECORD.size <= len(data):
+            record_type, length, checksum = RECORD.unpack_from(data, offset)
+            payload = data[offset + RECORD.size:offset + RECORD.size + length]
+            if len(payload) < length or zlib.crc32(payload) != checksum:
+                break
+            if record_type == APPEND:
+                index, term = ENTRY.unpack_from(payload)
+                if index >= log_offset:
+                    del log[index - log_offset:]
+                    log.append({"term": term, "command": json.loads(payload[ENTRY.size:].decode("UTF-8"))})
+            elif record_type == TRUNCATE:
+                del log[max(LENGTH.unpack(payload)[0] - log_offset, 0):]
+            else:
+                break
+            offset += RECORD.size + length
+
+        if offset < len(data):
+            # a crash in the middle of a write, the following records would land after garbage
+            os.ftruncate(self.wal_fd, offset)
+
+        return current_term, voted_for, commit_length, log
+
+    def load_meta(self):
+        # the valid slot with the highest sequence number wins
+        data = os.pread(self.meta_fd, 2 * META.size, 0)
+        best = None
+        for slot in range(len(data) // META.size):
+            record = data[slot * META.size:(slot + 1) * META.size]
+            sequence, current_term, voted_for, commit_length, checksum = META.unpack(record)
+            if zlib.crc32(record[:-4]) != checksum:
+                continue
+            if best is None or sequence > best[0]:
+                best = (sequence, current_term, voted_for, commit_length)
+
+        if best is None:
+            return 0, None, 0
+        self.meta_sequence, current_term, voted_for, commit_length = best
+        self.meta = (current_term, None if voted_for < 0 else voted_for, commit_length)
+        return self.meta
+
+    def append(self, index: int, entries: list):
+        # entries starting at index, anything after index is dropped on recovery
+        for offset, entry in enumerate(entries):
+            command = json.dumps(entry["command"]).encode("UTF-8")
+            self.write_record(APPEND, ENTRY.pack(index + offset, entry["term"]) + command)
+
+    def truncate(self, length: int):
+        self.write_record(TRUNCATE, LENGTH.pack(length))
+
+    def write_record(self, record_type, payload):
+        self.buffer.append(RECORD.pack(record_type, len(payload), zlib.crc32(payload)))
+        self.buffer.append(payload)
+
+    def save_snapshot(self, length: int, term: int, snapshot, log: list):
+        """
+        Replace the log up to length with a snapshot
+        :param length: number of entries the snapshot covers
+        :param term: term of the last entry it covers
+        :param snapshot: state of the state machine, anything json can serialize
+        :param log: entries after the snapshot, the only ones left in the write-ahead log
+        """
+        data = json.dumps(snapshot).encode("UTF-8")
+        self.replace(self.snapshot_path, SNAPSHOT.pack(length, term, zlib.crc32(data)) + data)
+
+        # the entries still buffered are part of log, they are written with the rest of it
+        self.buffer = []
+        self.append(length, log)
+        records = b"".join(self.buffer)
+        self.buffer = []
+        os.close(self.wal_fd)
+        self.replace(self.wal_path, records)
+        self.wal_fd = os.open(self.wal_path, os.O_RDWR | os.O_CREAT | os.O_APPEND, 0o644)
+
+    def replace(self, path, data):
+        replace_file(path, data, self.fsync_interval is not None)
+
+    def save_meta(self, current_term: int, voted_for, commit_length: int):
+        if (current_term, voted_for, commit_length) != self.meta:
+            self.pending_meta = (current_term, voted_for, commit_length)
+
+    def sync(self):
+        """
+        Write what was saved since the last sync, then fsync it or leave it to the group commit
+        """
+        if not self.buffer and self.pending_meta is None:
+            # an idle heartbeat, nothing to write
+            return
+
+        if self.buffer:
+            os.write(self.wal_fd, b"".join(self.buffer))
+            self.buffer = []
+
+        if self.pending_meta is not None:
+            current_term, voted_for, commit_length = self.pending_meta
+            self.meta_sequence += 1
+            record = META.pack(self.meta_sequence, current_term, -1 if voted_for is None else voted_for,
+                               commit_length, 0)[:-4]
+            os.pwrite(self.meta_fd, record + struct.pack("!I", zlib.crc32(record)),
+                      (self.meta_sequence % 2) * META.size)
+            self.meta = self.pending_meta
+            self.pending_meta = None
+
+        if self.fsync_interval == 0:
+            self.fsync()
+        elif self.fsync_interval is not None and self.fsync_timer is None:
+            # every sync until the timer fires shares the same fsync
+            self.fsync_timer = self.scheduler.call_later(self.fsync_interval, self.fsync)
+
+    def after_sync(self, callback, *args):
+        """
+        Call back once everything synced so far is on disk: right away, unless a group commit
+        is still pending. A vote or an acknowledgement must not reach a peer before what it
+        promises survives a crash
+        """
+        if self.fsync_timer is None:
+            callback(*args)
+        else:
+            self.held.append((callback, args))
+
+    def fsync(self):
+        self.fsync_timer = None
+        os.fsync(self.wal_fd)
+        os.fsync(self.meta_fd)
+        held, self.held = self.held, []
+        for callback, args in held:
+            callback(*args)
+
+    def close(self):
+        if self.fsync_timer is not None:
+            self.fsync_timer.cancel()
+            self.fsync_timer = None
+        # a stopped node sends nothing
+        self.held = []
+        os.close(self.wal_fd)
+        os.close(self.meta_fd)
+
+
+# header of a record of a shared write-ahead log: group id, then what RECORD holds
+GROUP_RECORD = struct.Struct("!IBII")
+# payload of a META record: current_term, voted_for (-1 for None), commit_length
+META_PAYLOAD = struct.Struct("!QqQ")
+
+META_RECORD = 3
+
+
+class SharedLog:
+    """
+    One write-ahead log for every Raft group of a node.
+
+    A node taking part in many groups would otherwise keep a log and a metadata file open per
+    group, and fsync each of them. Here the records of every group go to one file, tagged with
+    the group id, and the metadata is one more record instead of a file of its own. Whatever the
+    groups save within a tick is written and fsynced together, once.
+
+    The log only grows, so once it is larger than compact_size it is rewritten with the current
+    state of every group, what their snapshots do not cover. Snapshots stay one file per group,
+    only open while they are read or written.
+    """
+
+    def __init__(self, directory: str, node_id: int, scheduler, fsync_interval=0.0, logs=None,
+                 compact_size: int = 64 * 1024 * 1024):
+        """
+        :param directory: directory of the files, created if missing
+        :param node_id: node id, names the files
+        :param scheduler: provides call_later(delay, callback), a TickScheduler aligns the fsync on its ticks
+        :param fsync_interval: delay of the shared fsync, rounded up by the scheduler,
+                               None to leave flushing to the operating system
+        :param logs: returns {group id: (log_offset, log)} of every group, needed to compact the log
+        :param compact_size: size in bytes above which the log is compacted
+        """
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.node_id = node_id
+        self.wal_path = os.path.join(directory, f"node{node_id}.wal")
+        self.wal_fd = os.open(self.wal_path, os.O_RDWR | os.O_CREAT | os.O_APPEND, 0o644)
+        self.scheduler = scheduler
+        self.fsync_interval = fsync_interval
+        self.logs = logs
+        self.compact_size = compact_size
+        self.fsync_timer = None
+        self.held = []
+        self.buffer = []
+        self.groups = {}
+        # group id to its records, read once when the first group recovers
+        self.recovered = None
+
+    def group(self, group_id: int):
+        """
+        :param group_id: group id
+        :return: the storage of that group, to be handed to its Raft instance
+        """
+        storage = GroupStorage(self, group_id)
+        self.groups[group_id] = storage
+        return storage
+
+    def reset(self):
+        # a new node, forget whatever a previous run left behind
+        os.ftruncate(self.wal_fd, 0)
+        self.buffer = []
+        self.recovered = {}
+
+    def write_record(self, group_id, record_type, payload):
+        checksum = self.checksum(group_id, record_type, payload)
+        self.buffer.append(GROUP_RECORD.pack(group_id, record_type, len(payload), checksum))
+        self.buffer.append(payload)
+
+    @staticmethod
+    def checksum(group_id, record_type, payload):
+        # covers the group id too, a damaged one must not hand a record to another group
+        return zlib.crc32(payload, zlib.crc32(struct.pack("!IB", group_id, record_type)))
+
+    def recover(self, group_id):
+        """
+        :param group_id: group id
+        :return: the (record type, payload) records of that group, in the order they were written
+        """
+        if self.recovered is None:
+            self.recovered = {}
+            with open(self.wal_path, "rb") as f:
+                data = f.read()
+            offset = 0
+            while offset + GROUP_RECORD.size <= len(data):
+                record_group, record_type, length, checksum = GROUP_RECORD.unpack_from(data, offset)
+                payload = data[offset + GROUP_RECORD.size:offset + GROUP_RECORD.size + length]
+                if len(payload) < length or self.checksum(record_group, record_type, payload) != checksum:
+                    break
+                self.recovered.setdefault(record_group, []).append((record_type, payload))
+                offset += GROUP_RECORD.size + length
+
+            if offset < len(data):
+                # a crash in the middle of a write, the following records would land after garbage
+                os.ftruncate(self.wal_fd, offset)
+        return self.recovered.pop(group_id, [])
+
+    def sync(self):
+        # the first group saving something within a tick schedules the write and fsync of everything
+        if self.buffer and self.fsync_timer is None:
+            self.fsync_timer = self.scheduler.call_later(self.fsync_interval or 0.0, self.fsync)
+
+    def after_sync(self, callback, *args):
+        # see RaftStorage.after_sync
+        if self.fsync_timer is None:
+            callback(*args)
+        else:
+            self.held.append((callback, args))
+
+    def fsync(self):
+        self.fsync_timer = None
+        os.write(self.wal_fd, b"".join(self.buffer))
+        self.buffer = []
+        if self.fsync_interval is not None:
+            os.fsync(self.wal_fd)
+        if self.logs is not None and os.fstat(self.wal_fd).st_size > self.compact_size:
+            self.compact()
+        held, self.held = self.held, []
+        for callback, args in held:
+            callback(*args)
+
+    def compact(self):
+        # rewrite the log with the metadata and the log entries of every group, nothing else
+        for group_id, (log_offset, log) in self.logs().items():
+            storage = self.groups[group_id]
+            if storage.meta is not None:
+                storage.write_record(META_RECORD, storage.meta_payload(*storage.meta))
+            storage.append(log_offset, log)
+        records = b"".join(self.buffer)
+        self.buffer = []
+        os.close(self.wal_fd)
+        replace_file(self.wal_path, records, self.fsync_interval is not None)
+        self.wal_fd = os.open(self.wal_path, os.O_RDWR | os.O_CREAT | os.O_APPEND, 0o644)
+        logging.info(f"Compacted the shared write-ahead log to {len(records)} bytes")
+
+    def close(self):
+        if self.fsync_timer is not None:
+            self.fsync_timer.cancel()
+            self.fsync_timer = None
+        # a stopped node sends nothing
+        self.held = []
+        os.close(self.wal_fd)
+
+
+class GroupStorage(RaftStorage):
+    """
+    Persistent state of one Raft group of a node, a view on the node's SharedLog.
+    Only the snapshot is a file of its own
+    """
+
+    def __init__(self, shared: SharedLog, group_id: int):
+        self.shared = shared
+        self.group_id = group_id
+        self.snapshot_path = os.path.join(shared.directory, f"node{shared.node_id}.group{group_id}.snapshot")
+        self.fsync_interval = shared.fsync_interval
+        self.meta = None
+        self.pending_meta = None
+
+    def reset(self):
+        # the shared log itself is reset once, by the node
+        if os.path.exists(self.snapshot_path):
+            os.remove(self.snapshot_path)
+        self.meta = None
+        self.pending_meta = None
+
+    def load(self, log_offset: int = 0):
+        # see RaftStorage.load, the last META record holds the metadata
+        current_term, voted_for, commit_length = 0, None, 0
+        log = []
+        for record_type, payload in self.shared.recover(self.group_id):
+            if record_type == APPEND:
+                index, term = ENTRY.unpack_from(payload)
+                if index >= log_offset:
+                    del log[index - log_offset:]
+                    log.append({"term": term, "command": json.loads(payload[ENTRY.size:].decode("UTF-8"))})
+            elif record_type == TRUNCATE:
+                del log[max(LENGTH.unpack(payload)[0] - log_offset, 0):]
+            elif record_type == META_RECORD:
+                current_term, voted_for, commit_length = META_PAYLOAD.unpack(payload)
+                voted_for = None if voted_for < 0 else voted_for
+                self.meta = (current_term, voted_for, commit_length)
+        return current_term, voted_for, commit_length, log
+
+    def write_record(self, record_type, payload):
+        self.shared.write_record(self.group_id, record_type, payload)
+
+    @staticmethod
+    def meta_payload(current_term, voted_for, commit_length):
+        return META_PAYLOAD.pack(current_term, -1 if voted_for is None else voted_for, commit_length)
+
+    def save_snapshot(self, length: int, term: int, snapshot, log: list):
+        # see RaftStorage.save_snapshot. the records before it stay in the shared log until it is
+        # compacted, the entries after it are written again after a TRUNCATE, so what they held
+        # before, e.g. a conflicting tail replaced by an installed snapshot, is dropped on recovery
+        data = json.dumps(snapshot).encode("UTF-8")
+        self.replace(self.snapshot_path, SNAPSHOT.pack(length, term, zlib.crc32(data)) + data)
+        self.truncate(length)
+        self.append(length, log)
+        self.shared.sync()
+
+    def sync(self):
+        if self.pending_meta is not None:
+            self.write_record(META_RECORD, self.meta_payload(*self.pending_meta))
+            self.meta = self.pending_meta
+            self.pending_meta = None
+        self.shared.sync()
+
+    def after_sync(self, callback, *args):
+        self.shared.after_sync(callback, *args)
+
+    def close(self):
+        # the shared log is closed by the node
+        pass
@@ -0,0 +1,113 @@
+import json
+import logging
+import unittest
+
+from kvstore import KeyValueStore
+from simulation import RaftSimulation
+
+
+class KeyValueStoreTest(unittest.TestCase):
+
+    def test_operations(self):
+        store = KeyValueStore()
+        results = store.apply({"client_id": "c", "sequence": 1,
+                               "operations": [["put", "k", 1], ["put", "k", 2], ["get", "k"], ["delete", "k"],
+                                              ["get", "k"]]})
+        self.assertEqual([None, 1, 2, 2, None], results)
+
+    def test_retried_batch_is_applied_once(self):
+        store = KeyValueStore()
+        command = {"client_id": "c", "sequence": 1, "operations": [["put", "k", 1]]}
+        self.assertEqual([None], store.apply(command))
+        store.apply({"client_id": "c", "sequence": 2, "operations": [["put", "k", 2]]})
+        # the answer of the last batch is kept, an older one is ignored
+        self.assertEqual([1], store.apply({"client_id": "c", "sequence": 2, "operations": [["put", "k", 2]]}))
+        self.assertIsNone(store.apply(command))
+        self.assertEqual({"k": 2}, store.data)
+
+    def test_snapshot_and_restore(self):
+        store = KeyValueStore()
+        store.apply({"client_id": "c", "sequence": 1, "operations": [["put", "k", 1]]})
+        restored = KeyValueStore()
+        restored.restore(store.snapshot())
+        self.assertEqual(store.data, restored.data)
+        self.assertEqual(store.sessions, restored.sessions)
+
+
+class KeyValueClusterTest(unittest.TestCase):
+
+    def setUp(self):
+        logging.disable(logging.INFO)
+
+    def tearDown(self):
+        logging.disable(logging.NOTSET)
+
+    def test_client_is_redirected_to_the_leader(self):
+        simulation = RaftSimulation(3, 0.1, 0.3, key_value=True)
+        simulation.run(30, stop=lambda: simulation.leader() is not None)
+        follower = next(node_id for node_id in simulation.nodes if node_id != simulation.leader().node_id)
+        client = simulation.add_client("c", 100)
+        client.leader_port = follower
+        results = []
+        client.submit([["put", "k", "v"]], results.append)
+        simulation.run(simulation.simulator.now + 2)
+        self.assertEqual([[None]], results)
+        self.assertEqual(simulation.leader().port, client.leader_port)
+
+        client.submit([["get", "k"]], results.append)
+        simulation.run(simulation.simulator.now + 2)
+        self.assertEqual([[None], ["v"]], results)
+
+    def test_lost_answers_do_not_apply_a_batch_twice(self):
+        simulation = RaftSimulation(3, 0.1, 0.3, key_value=True, seed=4, loss=0.3)
+        simulation.run(30, stop=lambda: simulation.leader() is not None)
+        client = simulation.add_client("c", 100, retry_duration=0.2)
+        results = []
+        for index in range(10):
+            client.submit([["put", "counter", index]], results.append)
+            simulation.run(simulation.simulator.now + 30, stop=lambda: client.request is None)
+        # every put returned the value of the one before it, none was applied twice
+        self.assertEqual([[None]] + [[index] for index in range(9)], results)
+        simulation.simulator.loss = 0.0
+        simulation.run(simulation.simulator.now + 2)
+        for server in simulation.servers.values():
+            self.assertEqual({"counter": 9}, server.raft.state_machine.data)
+
+
+    def test_large_client_batches_are_replicated_within_a_datagram(self):
+        simulation = RaftSimulation(3, 0.1, 0.3, key_value=True)
+        simulation.run(30, stop=lambda: simulation.leader() is not None)
+        # the follower catching up gets batches of max_batch_size entries, each one a batch of 64 puts
+        lagging = next(node_id for node_id in simulation.nodes if node_id != simulation.leader().node_id)
+        simulation.kill(lagging)
+        clients = [simulation.add_client(f"c{index}", 100 + index) for index in range(16)]
+        for batch in range(4):
+            for index, client in enumerate(clients):
+                client.submit([["put", f"key-{index}-{batch}-{operation}", operation] for operation in range(64)],
+                              lambda result: None)
+            simulation.run(simulation.simulator.now + 30,
+                           stop=lambda: all(client.request is None for client in clients))
+        simulation.restart(lagging)
+        simulation.run(simulation.simulator.now + 2)
+        for server in simulation.servers.values():
+            self.assertEqual(16 * 4 * 64, len(server.raft.state_machine.data))
+
+    def test_snapshot_larger_than_a_datagram_is_installed_in_chunks(self):
+        simulation = RaftSimulation(3, 0.1, 0.3, key_value=True, raft_options={"snapshot_threshold": 50})
+        simulation.run(30, stop=lambda: simulation.leader() is not None)
+        lagging = next(node_id for node_id in simulation.nodes if node_id != simulation.leader().node_id)
+        simulation.kill(lagging)
+        client = simulation.add_client("c", 100)
+        for batch in range(400):
+            client.submit([["put", f"key-{batch}-{index}", "v" * 20] for index in range(10)], lambda result: None)
+            simulation.run(simulation.simulator.now + 30, stop=lambda: client.request is None)
+        leader = simulation.leader()
+        self.assertGreater(len(json.dumps(leader.snapshot)), simulation.simulator.max_datagram_size)
+
+        raft = simulation.restart(lagging)
+        simulation.run(simulation.simulator.now + 5)
+        self.assertGreater(raft.log_offset, 0)
+        self.assertEqual(leader.state_machine.data, raft.state_machine.data)
+
+if __name__ == '__main__':
+    unittest.main()
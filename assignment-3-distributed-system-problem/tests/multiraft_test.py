@@ -0,0 +1,42 @@
+import logging
+import os
+import unittest
+
+from simulation import MultiRaftSimulation
+
+
+class MultiRaftSimulationTest(unittest.TestCase):
+
+    def setUp(self):
+        logging.disable(logging.INFO)
+
+    def tearDown(self):
+        logging.disable(logging.NOTSET)
+
+    def test_many_groups_share_one_log_per_node(self):
+        simulation = MultiRaftSimulation(3, 200, 0.1, 0.3)
+        simulation.run(5)
+        self.assertEqual(200, len(simulation.leaders()))
+        for node in simulation.nodes.values():
+            self.assertEqual([f"node{node.node_id}.wal"], os.listdir(node.wal.directory))
+
+    def test_restarted_node_recovers_every_group(self):
+        simulation = MultiRaftSimulation(3, 20, 0.1, 0.3)
+        simulation.run(5)
+        for group_id, node_id in simulation.leaders().items():
+            simulation.nodes[node_id].groups[group_id].submit(f"command of group {group_id}")
+        simulation.run(6)
+
+        node = simulation.nodes[1]
+        logs = {group_id: raft.log for group_id, raft in node.groups.items()}
+        terms = {group_id: raft.current_term for group_id, raft in node.groups.items()}
+        simulation.kill(1)
+        node = simulation.restart(1)
+        self.assertEqual(logs, {group_id: raft.log for group_id, raft in node.groups.items()})
+        self.assertEqual(terms, {group_id: raft.current_term for group_id, raft in node.groups.items()})
+        simulation.run(10)
+        self.assertEqual(20, len(simulation.leaders()))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,217 @@
+import logging
+import unittest
+
+from node import NodeStates
+from simulation import RaftSimulation
+
+
+def committed_commands(raft):
+    # commands of the committed entries the node still has in its log
+    return [entry["command"] for entry in raft.log[:raft.commit_length - raft.log_offset]]
+
+
+class RaftSimulationTest(unittest.TestCase):
+
+    def setUp(self):
+        logging.disable(logging.INFO)
+
+    def tearDown(self):
+        logging.disable(logging.NOTSET)
+
+    def run_until_leader(self, simulation, timeout=30):
+        simulation.run(simulation.simulator.now + timeout, stop=lambda: simulation.leader() is not None)
+        leader = simulation.leader()
+        self.assertIsNotNone(leader)
+        return leader
+
+    def replicate(self, simulation, commands):
+        leader = self.run_until_leader(simulation)
+        for command in commands:
+            leader.submit(command)
+        simulation.run(simulation.simulator.now + 1)
+        return leader
+
+    def test_killed_leader_is_replaced_in_a_later_term(self):
+        simulation = RaftSimulation(5, 0.1, 0.3)
+        leader = self.run_until_leader(simulation)
+        simulation.run(simulation.simulator.now + 1)
+        for raft in simulation.nodes.values():
+            self.assertEqual(leader.current_term, raft.current_term)
+            self.assertEqual(leader.node_id, raft.current_leader)
+
+        simulation.kill(leader.node_id)
+        new_leader = self.run_until_leader(simulation)
+        self.assertNotEqual(leader.node_id, new_leader.node_id)
+        self.assertGreater(new_leader.current_term, leader.current_term)
+        self.assertEqual(1, sum(raft.current_role == NodeStates.LEADER for raft in simulation.nodes.values()))
+
+    def test_one_leader_per_term_and_no_committed_entry_lost(self):
+        for seed in range(3):
+            simulation = RaftSimulation(5, 0.1, 0.3, seed=seed, raft_options={"fsync_interval": 0.02}, loss=0.05)
+            leaders = {}
+            committed = {}
+
+            def check():
+                for raft in simulation.nodes.values():
+                    if raft.current_role == NodeStates.LEADER:
+                        self.assertEqual(raft.node_id, leaders.setdefault(raft.current_term, raft.node_id))
+                    # committed entries never change, on whichever node they are
+                    for index, entry in enumerate(raft.log[:raft.commit_length - raft.log_offset], raft.log_offset):
+                        self.assertEqual(entry, committed.setdefault(index, entry))
+                return False
+
+            for round_number in range(5):
+                leader = self.run_until_leader(simulation)
+                for index in range(5):
+                    leader.submit(f"{round_number}-{index}")
+                simulation.run(simulation.simulator.now + 1, stop=check)
+                victim = simulation.leader().node_id
+                simulation.kill(victim)
+                simulation.run(simulation.simulator.now + 1, stop=check)
+                simulation.restart(victim)
+            simulation.run(simulation.simulator.now + 3, stop=check)
+
+            leader = self.run_until_leader(simulation)
+            self.assertGreaterEqual(leader.commit_length, 25)
+            for raft in simulation.nodes.values():
+                self.assertEqual(committed_commands(leader)[:raft.commit_length], committed_commands(raft))
+
+    def test_restarted_node_recovers_its_log(self):
+        simulation = RaftSimulation(3, 0.1, 0.3)
+        leader = self.replicate(simulation, ["a", "b", "c"])
+        follower = next(raft for raft in simulation.nodes.values() if raft is not leader)
+        log, term = follower.log, follower.current_term
+        simulation.kill(follower.node_id)
+        follower = simulation.restart(follower.node_id)
+        self.assertEqual(log, follower.log)
+        self.assertEqual(term, follower.current_term)
+
+    def test_entries_are_replicated_and_committed(self):
+        simulation = RaftSimulation(3, 0.1, 0.3)
+        leader = self.replicate(simulation, ["a", "b", "c"])
+        for raft in simulation.nodes.values():
+            self.assertEqual(leader.log, raft.log)
+            self.assertEqual(len(leader.log), raft.commit_length)
+        self.assertEqual(["a", "b", "c"], [entry["command"] for entry in leader.log if entry["command"] is not None])
+
+    def test_deposed_leader_drops_its_uncommitted_tail(self):
+        simulation = RaftSimulation(5, 0.1, 0.3, seed=1)
+        old_leader = self.replicate(simulation, ["a"])
+        others = [node_id for node_id in simulation.nodes if node_id != old_leader.node_id]
+        simulation.simulator.partition([old_leader.node_id], others)
+        old_leader.submit("lost")
+        simulation.run(simulation.simulator.now + 5)
+        new_leader = max((raft for raft in simulation.nodes.values() if raft is not old_leader),
+                         key=lambda raft: (raft.current_role == NodeStates.LEADER, raft.current_term))
+        self.assertEqual(NodeStates.LEADER, new_leader.current_role)
+        new_leader.submit("kept")
+        simulation.run(simulation.simulator.now + 1)
+
+        simulation.simulator.heal()
+        simulation.run(simulation.simulator.now + 3)
+        commands = [entry["command"] for entry in old_leader.log]
+        self.assertNotIn("lost", commands)
+        self.assertIn("kept", commands)
+        self.assertEqual(new_leader.log, old_leader.log)
+
+    def test_lagging_node_catches_up_from_a_snapshot(self):
+        simulation = RaftSimulation(3, 0.1, 0.3, raft_options={"snapshot_threshold": 5})
+        leader = self.run_until_leader(simulation)
+        lagging = next(node_id for node_id in simulation.nodes if node_id != leader.node_id)
+        simulation.kill(lagging)
+        self.replicate(simulation, [f"c{index}" for index in range(20)])
+        leader = simulation.leader()
+        self.assertGreater(leader.log_offset, 0)
+
+        raft = simulation.restart(lagging)
+        simulation.run(simulation.simulator.now + 2)
+        self.assertGreater(raft.log_offset, 0)
+        self.assertEqual(leader.commit_length, raft.commit_length)
+        self.assertEqual(leader.log[raft.log_offset - leader.log_offset:], raft.log[max(leader.log_offset - raft.log_offset, 0):])
+
+    def test_pre_vote_keeps_a_partitioned_node_from_raising_its_term(self):
+        for pre_vote, grows in ((True, False), (False, True)):
+            simulation = RaftSimulation(3, 0.1, 0.3, raft_options={"pre_vote": pre_vote})
+            leader = self.run_until_leader(simulation)
+            follower = next(raft for raft in simulation.nodes.values() if raft is not leader)
+            term = follower.current_term
+            simulation.simulator.partition([follower.node_id],
+                                           [node_id for node_id in simulation.nodes if node_id != follower.node_id])
+            simulation.run(simulation.simulator.now + 5)
+            self.assertEqual(grows, follower.current_term > term)
+            simulation.simulator.heal()
+            simulation.run(simulation.simulator.now + 2)
+            if not grows:
+                # the cluster was never disturbed
+                self.assertIs(leader, simulation.leader())
+                self.assertEqual(term, leader.current_term)
+
+    def test_read_index(self):
+        simulation = RaftSimulation(3, 0.1, 0.3)
+        leader = self.replicate(simulation, ["a"])
+        reads = []
+        self.assertTrue(leader.read(reads.append))
+        self.assertEqual([], reads)
+        simulation.run(simulation.simulator.now + 1)
+        self.assertEqual([True], reads)
+
+        follower = next(raft for raft in simulation.nodes.values() if raft is not leader)
+        self.assertFalse(follower.read(reads.append))
+
+    def test_read_index_of_a_deposed_leader_fails(self):
+        simulation = RaftSimulation(3, 0.1, 0.3)
+        leader = self.replicate(simulation, ["a"])
+        simulation.simulator.partition([leader.node_id], [raft.node_id for raft in simulation.nodes.values()
+                                                           if raft is not leader])
+        reads = []
+        leader.read(reads.append)
+        simulation.run(simulation.simulator.now + 3)
+        simulation.simulator.heal()
+        simulation.run(simulation.simulator.now + 2)
+        self.assertEqual([False], reads)
+
+    def test_no_lease_read_after_a_new_leader_is_elected(self):
+        # a follower coming back from a partition with a higher term must not be elected while the
+        # leader still serves reads from its lease, pre-vote or not
+        for pre_vote in (True, False):
+            simulation = RaftSimulation(5, 0.5, 3.0, raft_options={"lease_reads": True, "pre_vote": pre_vote})
+            leader = self.replicate(simulation, ["a"])
+            follower = next(raft for raft in simulation.nodes.values() if raft is not leader)
+            others = [node_id for node_id in simulation.nodes if node_id not in (leader.node_id, follower.node_id)]
+            simulation.simulator.partition([follower.node_id], [leader.node_id] + others)
+            simulation.run(simulation.simulator.now + 10)
+            simulation.simulator.partition([leader.node_id], [follower.node_id] + others)
+            stale_reads = []
+
+            def check():
+                if any(raft.current_role == NodeStates.LEADER and raft.current_term > leader.current_term
+                       for raft in simulation.nodes.values()):
+                    reads = []
+                    leader.read(reads.append)
+                    stale_reads.extend(reads)
+                return False
+
+            simulation.run(simulation.simulator.now + 5, stop=check)
+            self.assertNotIn(True, stale_reads)
+
+    def test_add_and_remove_members(self):
+        simulation = RaftSimulation(3, 0.1, 0.3)
+        self.replicate(simulation, ["a", "b"])
+        learner = simulation.add_node()
+        self.assertIsNotNone(learner)
+        simulation.run(simulation.simulator.now + 3)
+        leader = simulation.leader()
+        self.assertIn(learner.node_id, leader.voters)
+        self.assertEqual(leader.commit_length, learner.commit_length)
+
+        removed = next(node_id for node_id in leader.voters if node_id != leader.node_id)
+        self.assertIsNotNone(leader.remove_node(removed))
+        simulation.run(simulation.simulator.now + 2)
+        self.assertNotIn(removed, leader.voters)
+        leader.submit("after removal")
+        simulation.run(simulation.simulator.now + 1)
+        self.assertEqual("after removal", leader.log[leader.commit_length - leader.log_offset - 1]["command"])
+
+
+if __name__ == '__main__':
+    unittest.main()
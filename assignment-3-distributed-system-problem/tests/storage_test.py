@@ -0,0 +1,207 @@
+import os
+import tempfile
+import unittest
+
+from simulation import Simulator
+from storage import META, RaftStorage, SharedLog
+
+
+def entries(*commands, term=1):
+    return [{"term": term, "command": command} for command in commands]
+
+
+class RaftStorageTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def open(self, **options):
+        return RaftStorage(self.directory.name, 1, **options)
+
+    def test_recovers_log_and_metadata(self):
+        storage = self.open()
+        storage.reset()
+        storage.append(0, entries("a", "b"))
+        storage.save_meta(3, 2, 1)
+        storage.sync()
+        storage.close()
+
+        storage = self.open()
+        self.assertEqual((3, 2, 1, entries("a", "b")), storage.load())
+        storage.close()
+
+    def test_torn_tail_is_cut_off(self):
+        storage = self.open()
+        storage.reset()
+        storage.append(0, entries("a", "b", "c"))
+        storage.sync()
+        storage.close()
+        # a crash in the middle of the last record
+        os.truncate(storage.wal_path, os.path.getsize(storage.wal_path) - 3)
+
+        storage = self.open()
+        self.assertEqual(entries("a", "b"), storage.load()[3])
+        # what is written next follows the intact records, not the garbage
+        storage.append(2, entries("d"))
+        storage.sync()
+        storage.close()
+        storage = self.open()
+        self.assertEqual(entries("a", "b", "d"), storage.load()[3])
+        storage.close()
+
+    def test_truncate_drops_conflicting_tail(self):
+        storage = self.open()
+        storage.reset()
+        storage.append(0, entries("a", "b", "c"))
+        storage.truncate(1)
+        storage.append(1, entries("x", term=2))
+        storage.sync()
+        storage.close()
+
+        storage = self.open()
+        self.assertEqual(entries("a") + entries("x", term=2), storage.load()[3])
+        storage.close()
+
+    def test_torn_metadata_falls_back_to_the_other_slot(self):
+        storage = self.open()
+        storage.reset()
+        storage.save_meta(1, 1, 0)
+        storage.sync()
+        storage.save_meta(2, None, 0)
+        storage.sync()
+        slot = (storage.meta_sequence % 2) * META.size
+        storage.close()
+        with open(storage.meta_path, "r+b") as f:
+            f.seek(slot + 4)
+            f.write(b"\xff\xff")
+
+        storage = self.open()
+        self.assertEqual((1, 1, 0), storage.load()[:3])
+        storage.close()
+
+    def test_snapshot_replaces_the_log_prefix(self):
+        storage = self.open()
+        storage.reset()
+        storage.append(0, entries("a", "b", "c"))
+        storage.sync()
+        storage.save_snapshot(2, 1, {"state": "ab"}, entries("c"))
+        storage.append(3, entries("d"))
+        storage.sync()
+        storage.close()
+
+        storage = self.open()
+        self.assertEqual((2, 1, {"state": "ab"}), storage.load_snapshot())
+        self.assertEqual(entries("c", "d"), storage.load(2)[3])
+        storage.close()
+
+    def test_group_commit_holds_callbacks_until_fsync(self):
+        simulator = Simulator()
+        storage = self.open(fsync_interval=0.5, scheduler=simulator)
+        storage.reset()
+        sent = []
+        storage.append(0, entries("a"))
+        storage.sync()
+        storage.after_sync(sent.append, "ack")
+        self.assertEqual([], sent)
+        simulator.run()
+        self.assertEqual(["ack"], sent)
+        # nothing pending, nothing held
+        storage.after_sync(sent.append, "vote")
+        self.assertEqual(["ack", "vote"], sent)
+        storage.close()
+
+
+class SharedLogTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.simulator = Simulator()
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def open(self, logs=None):
+        shared = SharedLog(self.directory.name, 1, self.simulator, logs=logs)
+        return shared, {group_id: shared.group(group_id) for group_id in (0, 1)}
+
+    def test_groups_recover_their_own_records(self):
+        shared, groups = self.open()
+        shared.reset()
+        groups[0].append(0, entries("a"))
+        groups[1].append(0, entries("x", "y", term=2))
+        groups[0].append(1, entries("b"))
+        groups[0].save_meta(1, 1, 2)
+        groups[0].sync()
+        groups[1].save_meta(2, None, 0)
+        groups[1].sync()
+        self.simulator.run()
+        shared.close()
+
+        shared, groups = self.open()
+        self.assertEqual((1, 1, 2, entries("a", "b")), groups[0].load())
+        self.assertEqual((2, None, 0, entries("x", "y", term=2)), groups[1].load())
+        shared.close()
+        self.assertEqual(["node1.wal"], os.listdir(self.directory.name))
+
+    def test_one_fsync_for_every_group(self):
+        shared, groups = self.open()
+        shared.reset()
+        sent = []
+        for group_id, storage in groups.items():
+            storage.append(0, entries(group_id))
+            storage.sync()
+            storage.after_sync(sent.append, group_id)
+        self.assertEqual(1, len([event for event in self.simulator.events if not event[2].is_cancelled]))
+        self.assertEqual([], sent)
+        self.simulator.run()
+        self.assertEqual([0, 1], sent)
+        shared.close()
+
+    def test_torn_tail_is_cut_off(self):
+        shared, groups = self.open()
+        shared.reset()
+        groups[0].append(0, entries("a", "b"))
+        groups[1].append(0, entries("x"))
+        groups[0].sync()
+        self.simulator.run()
+        shared.close()
+        os.truncate(shared.wal_path, os.path.getsize(shared.wal_path) - 3)
+
+        shared, groups = self.open()
+        self.assertEqual(entries("a", "b"), groups[0].load()[3])
+        self.assertEqual([], groups[1].load()[3])
+        shared.close()
+
+    def test_snapshot_and_compaction(self):
+        logs = {}
+        shared, groups = self.open(lambda: logs)
+        shared.reset()
+        groups[0].append(0, entries("a", "b", "c"))
+        groups[0].save_snapshot(2, 1, {"state": "ab"}, entries("c"))
+        groups[1].append(0, entries("x"))
+        groups[1].save_meta(4, 1, 1)
+        groups[1].sync()
+        self.simulator.run()
+        size = os.path.getsize(shared.wal_path)
+
+        logs.update({0: (2, entries("c")), 1: (0, entries("x"))})
+        shared.compact_size = 0
+        groups[0].append(3, entries("d"))
+        logs[0][1].extend(entries("d"))
+        groups[0].sync()
+        self.simulator.run()
+        self.assertLess(os.path.getsize(shared.wal_path), size)
+        shared.close()
+
+        shared, groups = self.open()
+        self.assertEqual((2, 1, {"state": "ab"}), groups[0].load_snapshot())
+        self.assertEqual(entries("c", "d"), groups[0].load(2)[3])
+        self.assertEqual((4, 1, 1, entries("x")), groups[1].load())
+        shared.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
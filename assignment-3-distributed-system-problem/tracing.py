@@ -0,0 +1,188 @@
+import logging
+import signal
+import struct
+import time
+from argparse import ArgumentParser
+
+# Binary trace of one node (little endian), the format of assignment 2:
+#   header: magic, version (uint8), node id (uint32), wall clock minus event clock (float64), number of events (uint64)
+#   event:  time (float64), event type (uint8), peer (uint32), detail (uint8), value (int64)
+MAGIC = b"RTRC"
+VERSION = 1
+FILE_HEADER = struct.Struct("<4sBIdQ")
+RECORD = struct.Struct("<dBIBq")
+
+# event types, the value is always the term of the node
+# SEND: the peer is the destination port, the detail the MessageType
+# RECV: the peer is the sender node id, the detail the MessageType
+# STATE: the peer is the leader node id, the detail the new NodeStates role
+# TIMER: the detail is one of the timers below
+SEND = 1
+RECV = 2
+STATE = 3
+TIMER = 4
+
+# detail of TIMER
+ELECTION_TIMEOUT = 0
+HEARTBEAT = 1
+
+
+# Tracer taken from assignment 2
+class Tracer:
+    """
+    Preallocated ring buffer of the binary events of one node.
+
+    Recording an event packs five numbers in place, nothing is formatted or allocated. The events
+    are only turned into text offline, by the dump tool. Once the buffer is full the oldest events
+    are overwritten.
+    """
+
+    def __init__(self, node_id, capacity=65536, clock=time.monotonic):
+        """
+        :param node_id: node id
+        :param capacity: number of events kept
+        :param clock: clock of the event timestamps, the time() of the node's scheduler
+        """
+        self.node_id = node_id
+        self.capacity = capacity
+        self.clock = clock
+        self.buffer = bytearray(RECORD.size * capacity)
+        self.count = 0
+        # the dump prints wall clock times
+        self.clock_offset = time.time() - clock()
+
+    def record(self, event, peer=0, detail=0, value=0):
+        RECORD.pack_into(self.buffer, (self.count % self.capacity) * RECORD.size,
+                         self.clock(), event, peer, detail, value)
+        self.count += 1
+
+    def dump(self, path):
+        """
+        Write the events in the buffer to a file, oldest first
+        :param path: path of the trace file
+        """
+        with open(path, "wb") as f:
+            f.write(FILE_HEADER.pack(MAGIC, VERSION, self.node_id, self.clock_offset,
+                                     min(self.count, self.capacity)))
+            if self.count <= self.capacity:
+                f.write(self.buffer[:self.count * RECORD.size])
+            else:
+                # the oldest event is the one the next record overwrites
+                split = (self.count % self.capacity) * RECORD.size
+                f.write(self.buffer[split:])
+                f.write(self.buffer[:split])
+
+
+class TracingSocket:
+    """
+    Wraps the socket of a traced node to record every message it sends.
+    An untraced node keeps its own socket and pays nothing.
+    """
+
+    def __init__(self, socket, tracer: Tracer):
+        self.socket = socket
+        self.tracer = tracer
+
+    def send(self, message: dict, port: int = 0):
+        self.tracer.record(SEND, port, message["type"], message.get("current_term", 0))
+        self.socket.send(message, port)
+
+    def send_many(self, message: dict, ports: list):
+        for port in ports:
+            self.tracer.record(SEND, port, message["type"], message.get("current_term", 0))
+        self.socket.send_many(message, ports)
+
+    def listen(self):
+        return self.socket.listen()
+
+
+def toggle(raft, path, capacity=65536):
+    """
+    Start tracing a node, or stop and dump its trace if it is traced already.
+    Must run on the node's event loop
+    :param raft: a Raft node
+    :param path: path of the trace file
+    """
+    if raft.tracer is None:
+        raft.tracer = Tracer(raft.node_id, capacity, raft.scheduler.time)
+        raft.socket = TracingSocket(raft.socket, raft.tracer)
+        logging.warning(f"Tracing node-{raft.node_id}")
+    else:
+        raft.tracer.dump(path)
+        raft.tracer = None
+        raft.socket = raft.socket.socket
+        logging.warning(f"Stopped tracing node-{raft.node_id}, trace written to {path}")
+
+
+def dump(raft, path):
+    if raft.tracer is not None:
+        raft.tracer.dump(path)
+        logging.warning(f"Trace of node-{raft.node_id} written to {path}")
+
+
+def add_signal_handlers(raft, path):
+    """
+    SIGUSR1 starts or stops tracing the node of this process, SIGUSR2 dumps its trace.
+    Must be called from the main thread
+    :param raft: a Raft node
+    :param path: path of the trace file
+    """
+    # there are no user signals on Windows. the handlers only queue the work, the node is
+    # touched on its event loop like for any message
+    if hasattr(signal, "SIGUSR1"):
+        signal.signal(signal.SIGUSR1, lambda signum, frame: raft.scheduler.call_soon(toggle, raft, path))
+        signal.signal(signal.SIGUSR2, lambda signum, frame: raft.scheduler.call_soon(dump, raft, path))
+
+
+def read(path):
+    """
+    :param path: path of a trace file
+    :return: (node id, clock offset, list of (time, event type, peer, detail, value) tuples)
+    """
+    with open(path, "rb") as f:
+        data = f.read()
+    magic, version, node_id, clock_offset, count = FILE_HEADER.unpack_from(data)
+    if magic != MAGIC or version != VERSION:
+        raise ValueError(f"{path} is not a raft trace")
+    events = data[FILE_HEADER.size:FILE_HEADER.size + RECORD.size * count]
+    return node_id, clock_offset, list(RECORD.iter_unpack(events))
+
+
+def render(event, peer, detail, value, message_names, role_names):
+    # the wording of the node logs
+    if event == SEND:
+        return f"Send {message_names.get(detail, detail)} to port {peer} at term {value}"
+    if event == RECV:
+        return f"node{peer} sends a {message_names.get(detail, detail)} at term {value}"
+    if event == STATE:
+        if role_names.get(detail) == "leader":
+            return f"Elected as leader at term {value}"
+        return f"Become {role_names.get(detail, detail)} at term {value}"
+    if detail == ELECTION_TIMEOUT:
+        return f"Leader is suspected to be failed at term {value}"
+    return f"Heartbeat timer fires at term {value}"
+
+
+def main():
+    parser = ArgumentParser(description="Print binary traces of raft nodes as log lines, merged by time")
+    parser.add_argument("paths", nargs="+", help="Trace files, e.g. logs/node1.trace")
+    args = parser.parse_args()
+
+    # node imports this module, the names are only needed by the dump tool
+    from node import MessageType, NodeStates
+    message_names = {value: name.lower() for name, value in vars(MessageType).items() if not name.startswith("_")}
+    role_names = {value: name.lower() for name, value in vars(NodeStates).items() if not name.startswith("_")}
+
+    lines = []
+    for path in args.paths:
+        node_id, clock_offset, events = read(path)
+        for when, event, peer, detail, value in events:
+            lines.append((when + clock_offset, node_id, render(event, peer, detail, value, message_names, role_names)))
+    # a stable sort keeps the events of one node in the order they were recorded
+    for when, node_id, message in sorted(lines, key=lambda line: line[0]):
+        print(f"{time.strftime('%H:%M:%S', time.localtime(when))}.{int(when % 1 * 1000):03d} "
+              f"Node-{node_id:<4} {message}")
+
+
+if __name__ == '__main__':
+    main()